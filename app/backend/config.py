@@ -1,14 +1,73 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    database_hostname: str
-    database_port: str
-    database_password: str
-    database_name: str
-    database_username: str
+    database_url: Optional[str] = None
+    database_hostname: str = ''
+    database_port: str = ''
+    database_password: str = ''
+    database_name: str = ''
+    database_username: str = ''
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 1800
+    db_pool_timeout: int = 30
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    # Unset keeps the defaults of the installed argon2 library
+    argon2_time_cost: Optional[int] = None
+    argon2_memory_cost: Optional[int] = None
+    argon2_parallelism: Optional[int] = None
+    password_hash_workers: int = 2
+    password_hash_queue: int = 32
+    rag_model: str = 'mistral:latest'
+    ollama_host: Optional[str] = None
+    ollama_timeout: float = 300
+    ollama_max_connections: int = 16
+    ollama_keep_alive: str = '30m'
+    ollama_warmup: bool = True
+    ollama_ps_interval: int = 30
+    scheduler_concurrency: int = 4
+    scheduler_background_slots: int = 2
+    scheduler_max_queued_per_user: int = 8
+    scheduler_interactive_timeout: float = 60
+    scheduler_background_timeout: float = 0
+    max_upload_mb: int = 200
+    ingest_workers: int = 2
+    job_lease_seconds: int = 60
+    parse_workers: int = 0
+    pages_per_shard: int = 20
+    fast_pdf_text: bool = True
+    embedding_cache_path: str = 'app/db/_embedding_cache.sqlite'
+    parse_cache_dir: str = 'app/db/_parse_cache'
+    parse_cache_max_mb: int = 1024
+    embedding_batch_size: int = 32
+    embedding_concurrency: int = 4
+    ingest_batch_size: int = 256
+    ingest_queue_size: int = 4
+    vector_store_mode: str = 'document'
+    vector_backend: str = 'chroma'
+    vector_quantization: str = 'int8'
+    ann_min_vectors: int = 100000
+    default_retrieval_mode: str = 'multi_query'
+    library_top_k: int = 6
+    context_token_budget: int = 1500
+    context_rerank: str = 'lexical'
+    request_log: bool = False
+    create_tables: bool = True
+    rag_preload: str = 'none'
+    user_cache_ttl: int = 60
+    user_cache_size: int = 1024
+    user_cache_redis_url: Optional[str] = None
+    trust_token_claims: bool = False
+    chain_cache_size: int = 32
+    chain_cache_ttl: int = 900
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = 0.92
+    answer_cache_ttl: int = 86400
+    answer_cache_size: int = 256
+    answer_cache_documents: int = 1024
 
     class Config:
         env_file = '.env'
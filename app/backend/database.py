@@ -1,14 +1,62 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from app.core import metrics
 from .config import settings
 
-SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:'\
-                            f'{settings.database_password}@{settings.database_hostname}:'\
-                            f'{settings.database_port}/{settings.database_name}'
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def database_url(async_driver: bool = False) -> URL:
+    """DATABASE_URL when set (e.g. sqlite for tests), otherwise the Postgres settings."""
+    url = make_url(settings.database_url or
+                   f'postgresql://{settings.database_username}:'
+                   f'{settings.database_password}@{settings.database_hostname}:'
+                   f'{settings.database_port}/{settings.database_name}')
+    backend = url.get_backend_name()
+    if async_driver:
+        return url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+    if url.drivername in ASYNC_DRIVERS.values():
+        return url.set(drivername=backend)
+    return url
+
+
+def engine_options(url: URL) -> dict:
+    if url.get_backend_name() == 'sqlite':
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': settings.db_pool_size,
+        'max_overflow': settings.db_max_overflow,
+        'pool_recycle': settings.db_pool_recycle,
+        'pool_timeout': settings.db_pool_timeout,
+        'pool_pre_ping': True,
+    }
+
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # Needed for the ON DELETE CASCADE / SET NULL foreign keys
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+SQLALCHEMY_DATABASE_URL = database_url()
+# Sync engine for the ingestion workers, startup and the migration script
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+
+ASYNC_DATABASE_URL = database_url(async_driver=True)
+# Async engine for the API request handlers
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+
+if SQLALCHEMY_DATABASE_URL.get_backend_name() == 'sqlite':
+    event.listen(engine, 'connect', _enable_sqlite_foreign_keys)
+    event.listen(async_engine.sync_engine, 'connect', _enable_sqlite_foreign_keys)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -17,4 +65,24 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_stats():
+    """Connections per pool state for both engines; pools without a size (sqlite) are skipped."""
+    values = {}
+    for name, pool in (('sync', engine.pool), ('async', async_engine.sync_engine.pool)):
+        if not hasattr(pool, 'checkedout'):
+            continue
+        values[(name, 'size')] = pool.size()
+        values[(name, 'checked_out')] = pool.checkedout()
+        values[(name, 'idle')] = pool.checkedin()
+        values[(name, 'overflow')] = max(pool.overflow(), 0)
+    return values
+
+metrics.REGISTRY.gauge('db_pool_connections', 'Database connection pool usage per engine.',
+                       pool_stats, ('engine', 'state'))
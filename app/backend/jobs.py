@@ -0,0 +1,315 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import func, or_, update
+
+from app.backend import models
+from app.backend.config import settings
+from app.backend.database import SessionLocal, engine
+from app.backend.rag import get_pipeline
+from app.backend.scheduler import BACKGROUND, scheduler
+from app.core import metrics
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+UPLOAD = 'upload'
+REINGEST = 'reingest'
+
+logger = logging.getLogger('app.requests')
+
+# Identifies the API process holding a job; its heartbeat keeps the job's lease alive
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+_executor = None
+_executor_lock = Lock()
+_listeners = []
+_store_listeners = []
+_heartbeat_stop = Event()
+
+
+def on_document_changed(listener):
+    """Register `listener(document_id)`, called in this process when a re-ingestion job ends."""
+    _listeners.append(listener)
+
+
+def on_store_changed(listener):
+    """
+    Register `listener(persist_dir)`, called in this process after every job that wrote
+    to a store, so that clients opened on it before (which may read it stale) are dropped.
+    """
+    _store_listeners.append(listener)
+
+
+def _init_worker():
+    """Drop connections inherited from the parent so each worker opens its own."""
+    engine.dispose(close=False)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    # Jobs are started from the event loop, the heartbeat and slot release callbacks
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.ingest_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _ingest_upload(db, job, pipeline):
+    persist_dir = pipeline.store_path(job.name, job.user_id)
+    new_doc = models.Document(
+        name=job.name,
+        file_path=job.file_path,
+        persist_path=persist_dir,
+        content_hash=job.content_hash,
+        user_id=job.user_id
+    )
+    try:
+        db.add(new_doc)
+        db.flush()
+        pipeline.load_pdf(
+            path=os.path.dirname(job.file_path),
+            name=os.path.basename(job.file_path),
+            chunk_size=job.chunk_size,
+            split_strategy=job.split_strategy,
+            persist_dir=persist_dir,
+            metadata={'document_id': new_doc.id, 'user_id': job.user_id}
+        )
+        job.document_id = new_doc.id
+    except Exception:
+        if new_doc.id is not None:
+            pipeline.delete_document(persist_dir, new_doc.id)
+        raise
+
+
+def _store_of(db, job, pipeline) -> str:
+    """Persist directory an ingestion job writes to."""
+    if job.kind == REINGEST:
+        document = db.get(models.Document, job.document_id)
+        return document.persist_path if document else None
+    return pipeline.store_path(job.name, job.user_id)
+
+
+def _ingest_update(db, job, pipeline):
+    """
+    Apply a re-uploaded file to an existing document, then replace the stored PDF.
+    Chunks are parsed from the staged upload but name the document's file as their source.
+    """
+    document = db.get(models.Document, job.document_id)
+    if not document:
+        raise ValueError(f"Document {job.document_id} no longer exists")
+
+    pipeline.reingest_pdf(
+        path=os.path.dirname(job.file_path),
+        name=os.path.basename(job.file_path),
+        persist_dir=document.persist_path,
+        document_id=document.id,
+        chunk_size=job.chunk_size,
+        split_strategy=job.split_strategy,
+        metadata={'user_id': document.user_id, 'source': document.file_path}
+    )
+    os.replace(job.file_path, document.file_path)
+    job.file_path = document.file_path
+    document.content_hash = job.content_hash
+    document.uploaded_at = func.now()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def lease() -> dict:
+    """Owner and lease columns of a job queued by this process."""
+    return {'owner': WORKER_ID, 'lease_expires_at': _now() + timedelta(seconds=settings.job_lease_seconds)}
+
+
+def run_ingestion(job_id: int, owner: str) -> Tuple[list, Optional[str]]:
+    """
+    Parse, split and embed the PDF of a job, then record the resulting document.
+    Returns the timing spans of the job, so the API process can record them, and the
+    persist directory it wrote to, if any.
+    Nothing is done unless the job is still pending and held by `owner`, so a job
+    taken over by another API process after its lease expired only runs there.
+    """
+    trace_token = metrics.start_trace()
+    persist_dir = None
+    db = SessionLocal()
+    try:
+        claimed = db.execute(update(models.IngestionJob).where(
+                models.IngestionJob.id == job_id,
+                models.IngestionJob.owner == owner,
+                models.IngestionJob.status == PENDING
+            ).values(status=RUNNING, error=None)).rowcount
+        db.commit()
+        if not claimed:
+            print(f"Ingestion job {job_id} is no longer held by {owner}, skipping it")
+            return metrics.end_trace(trace_token), None
+        job = db.get(models.IngestionJob, job_id)
+
+        try:
+            with metrics.span("ingest"):
+                pipeline = get_pipeline()
+                persist_dir = _store_of(db, job, pipeline)
+                if job.kind == REINGEST:
+                    _ingest_update(db, job, pipeline)
+                else:
+                    _ingest_upload(db, job, pipeline)
+            job.status = DONE
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Ingestion job {job_id} failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+            db.commit()
+    finally:
+        db.close()
+
+    trace = metrics.end_trace(trace_token)
+    if settings.request_log:
+        logger.info(json.dumps({'job_id': job_id, 'spans': trace}))
+    return trace, persist_dir
+
+
+def _record_trace(future):
+    if not future.cancelled() and future.exception() is None:
+        metrics.replay(future.result()[0])
+
+
+def _notify_store(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    persist_dir = future.result()[1]
+    if persist_dir is None:
+        return
+    for listener in _store_listeners:
+        try:
+            listener(persist_dir)
+        except Exception as e:
+            print(f"Store change listener failed: {e}")
+
+
+def _notify(document_id: int):
+    for listener in _listeners:
+        try:
+            listener(document_id)
+        except Exception as e:
+            print(f"Document change listener failed: {e}")
+
+
+def _expire(job_id: int):
+    """Fail a job that waited longer than the background queue-time limit."""
+    db = SessionLocal()
+    try:
+        job = db.get(models.IngestionJob, job_id)
+        if job and job.status == PENDING and job.owner == WORKER_ID:
+            job.status = FAILED
+            job.error = 'Timed out waiting for an ingestion slot'
+            db.commit()
+    finally:
+        db.close()
+    print(f"Ingestion job {job_id} expired in the queue")
+
+
+def submit(job_id: int, user_id: int, document_id: int = None):
+    """
+    Queue a job as background work of `user_id`; the scheduler hands it over to the
+    worker pool once a slot is free, taking turns between users.
+    """
+    def start(ticket):
+        future = get_executor().submit(run_ingestion, job_id, WORKER_ID)
+        future.add_done_callback(lambda _: ticket.release())
+        future.add_done_callback(_record_trace)
+        future.add_done_callback(_notify_store)
+        if document_id is not None:
+            future.add_done_callback(lambda _: _notify(document_id))
+
+    timeout = settings.scheduler_background_timeout
+    deadline = time.monotonic() + timeout if timeout > 0 else None
+    return scheduler.submit(user_id, BACKGROUND, start, lambda: _expire(job_id), deadline)
+
+
+def resume_unfinished():
+    """
+    Take over jobs whose lease expired, i.e. left pending or running by an API process
+    that stopped, and queue them here. Each job is claimed with a conditional update,
+    so with several API processes only one of them resumes it.
+    """
+    now = _now()
+    unowned = or_(models.IngestionJob.owner.is_(None),
+                  models.IngestionJob.lease_expires_at.is_(None),
+                  models.IngestionJob.lease_expires_at < now)
+    db = SessionLocal()
+    try:
+        candidates = db.query(models.IngestionJob.id).filter(
+                models.IngestionJob.status.in_([PENDING, RUNNING]), unowned
+            ).all()
+        resumed = []
+        for (job_id,) in candidates:
+            claimed = db.execute(update(models.IngestionJob).where(
+                    models.IngestionJob.id == job_id,
+                    models.IngestionJob.status.in_([PENDING, RUNNING]),
+                    unowned
+                ).values(status=PENDING, **lease())).rowcount
+            db.commit()
+            if claimed:
+                job = db.get(models.IngestionJob, job_id)
+                resumed.append((job.id, job.user_id, job.document_id if job.kind == REINGEST else None))
+    finally:
+        db.close()
+
+    for job_id, user_id, document_id in resumed:
+        print(f"Resuming ingestion job {job_id}")
+        submit(job_id, user_id, document_id)
+
+
+def renew_leases():
+    """Extend the lease of every unfinished job held by this process."""
+    db = SessionLocal()
+    try:
+        db.execute(update(models.IngestionJob).where(
+                models.IngestionJob.owner == WORKER_ID,
+                models.IngestionJob.status.in_([PENDING, RUNNING])
+            ).values(lease_expires_at=lease()['lease_expires_at']))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _heartbeat():
+    interval = max(1, settings.job_lease_seconds / 3)
+    while not _heartbeat_stop.wait(interval):
+        try:
+            renew_leases()
+            resume_unfinished()
+        except Exception as e:
+            print(f"Ingestion job heartbeat failed: {e}")
+
+
+def start_heartbeat():
+    """Renew this process's leases and take over expired jobs in the background."""
+    _heartbeat_stop.clear()
+    Thread(target=_heartbeat, name='job-heartbeat', daemon=True).start()
+
+
+def shutdown():
+    global _executor
+    _heartbeat_stop.set()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
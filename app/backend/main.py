@@ -1,15 +1,106 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from . import models
-from .database import engine
+from .config import settings
+from .database import async_engine
 from .routers import auth, document, query
+from . import jobs, rag
+from app.core import metrics
+from threading import Thread
+import json, logging, time
 
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI()
+if settings.rag_preload not in rag.PRELOAD_MODES:
+    raise ValueError(f"Unknown RAG_PRELOAD mode: {settings.rag_preload}")
+if settings.rag_preload == 'import':
+    # Runs in the master process with `gunicorn --preload`, before workers are forked
+    rag.preload_modules()
+
+def warm_up_pipeline():
+    try:
+        rag.get_pipeline().warm_up()
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.create_tables:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+    await run_in_threadpool(jobs.resume_unfinished)
+    jobs.start_heartbeat()
+
+    if settings.rag_preload == 'startup':
+        await run_in_threadpool(rag.get_pipeline)
+    # Load the models in the background so the first question does not pay for it
+    if settings.ollama_warmup:
+        Thread(target=warm_up_pipeline, name='model-warm-up', daemon=True).start()
+    rag.get_ollama_client().watch(settings.ollama_ps_interval)
+
+    yield
+
+    jobs.shutdown()
+    rag.get_ollama_client().close()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(document.router)
 app.include_router(query.router)
 
+logger = logging.getLogger('app.requests')
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'http_request_seconds', 'Duration of HTTP requests.', ('method', 'route', 'status')
+)
+
+def record_request(request: Request, seconds: float, status_code: int, trace: list):
+    route = request.scope.get('route')
+    route_path = route.path if route else 'unmatched'
+    REQUEST_SECONDS.observe(seconds, method=request.method, route=route_path, status=status_code)
+    if settings.request_log:
+        logger.info(json.dumps({
+            'method': request.method,
+            'route': route_path,
+            'status': status_code,
+            'seconds': round(seconds, 6),
+            'spans': trace,
+        }))
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Time each request and, with REQUEST_LOG enabled, log its pipeline spans as JSON.
+    `call_next` returns once the headers are ready, so a streamed response (/ask/stream)
+    is recorded when its body has been sent.
+    """
+    trace_token = metrics.start_trace()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        record_request(request, time.perf_counter() - start, 500, metrics.end_trace(trace_token))
+        raise
+    # The endpoint keeps adding the spans of the body to this list
+    trace = metrics.end_trace(trace_token)
+    body = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            record_request(request, time.perf_counter() - start, response.status_code, trace)
+
+    response.body_iterator = timed_body()
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of pipeline stage and request histograms."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
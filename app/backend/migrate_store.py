@@ -0,0 +1,111 @@
+"""
+Move per-document Chroma directories into the shared library collection.
+
+    python -m app.backend.migrate_store --mode shared   # one collection for everyone
+    python -m app.backend.migrate_store --mode user     # one collection per user
+
+Stored embeddings are copied as-is, nothing is re-embedded. New library
+directories use the configured VECTOR_BACKEND. Each chunk gets
+`document_id`/`user_id` metadata and the document row is pointed at the new
+directory before the old one is removed.
+"""
+import argparse
+import os
+import shutil
+
+from app.backend import models
+from app.backend.database import SessionLocal
+from app.backend.rag import create_pipeline
+from app.core.lexical import INDEX_EXTENSIONS, lexical_index_path
+
+BATCH_SIZE = 1000
+
+
+def open_collection(pipeline, path: str):
+    """The Chroma collection or memory-mapped store under `path`; both offer count/get/upsert."""
+    if pipeline.backend_of(path) == 'mmap':
+        return pipeline._open_db(path)
+    return pipeline.chroma_clients.open(
+        path, lambda client: client.get_or_create_collection(pipeline.vector_store_name))
+
+
+def shared_chunk_id(chunk_id: str, document_id: int) -> str:
+    """
+    Id of a chunk in a shared collection. Chunks ingested since ids became content-addressed
+    already carry the document prefix; keeping them as they are lets re-ingestion match them.
+    """
+    prefix = f"{document_id}-"
+    return chunk_id if chunk_id.startswith(prefix) else prefix + chunk_id
+
+
+def migrate_document(pipeline, document, target_dir: str) -> int:
+    """Copy the chunks of a per-document store into the shared collection under `target_dir`."""
+    source = open_collection(pipeline, document.persist_path)
+    target = open_collection(pipeline, target_dir)
+
+    moved = 0
+    total = source.count()
+    for offset in range(0, total, BATCH_SIZE):
+        batch = source.get(
+            include=['embeddings', 'documents', 'metadatas'],
+            limit=BATCH_SIZE,
+            offset=offset
+        )
+        metadatas = [
+            {**(metadata or {}), 'document_id': document.id, 'user_id': document.user_id}
+            for metadata in batch['metadatas']
+        ]
+        target.upsert(
+            ids=[shared_chunk_id(chunk_id, document.id) for chunk_id in batch['ids']],
+            embeddings=batch['embeddings'],
+            documents=batch['documents'],
+            metadatas=metadatas
+        )
+        moved += len(batch['ids'])
+
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['shared', 'user'], default='shared')
+    parser.add_argument('--keep', action='store_true', help='keep the old per-document directories')
+    args = parser.parse_args()
+
+    pipeline = create_pipeline()
+    pipeline.store_mode = args.mode
+
+    db = SessionLocal()
+    try:
+        documents = db.query(models.Document).all()
+        for document in documents:
+            if pipeline.is_library(document.persist_path):
+                continue
+            if not os.path.exists(document.persist_path):
+                print(f"Skipping {document.name}: {document.persist_path} does not exist")
+                continue
+
+            old_dir = document.persist_path
+            target_dir = pipeline.store_path(document.name, document.user_id)
+            # The API and ingestion workers may be writing to the same library directory
+            with pipeline.writing(target_dir):
+                moved = migrate_document(pipeline, document, target_dir)
+
+            for extension in INDEX_EXTENSIONS:
+                old_index = lexical_index_path(old_dir, document.id, extension)
+                if os.path.exists(old_index):
+                    new_index = lexical_index_path(target_dir, document.id, extension)
+                    os.makedirs(os.path.dirname(new_index), exist_ok=True)
+                    shutil.copyfile(old_index, new_index)
+
+            document.persist_path = target_dir
+            db.commit()
+            if not args.keep:
+                shutil.rmtree(old_dir, ignore_errors=True)
+            print(f"Migrated {document.name}: {moved} chunks -> {target_dir}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
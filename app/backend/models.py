@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, TIMESTAMP, ForeignKey, text
+from sqlalchemy import Boolean, Column, Integer, Text, TIMESTAMP, ForeignKey, false, text, func
 from .database import Base
 
 class User(Base):
@@ -8,7 +8,7 @@ class User(Base):
     email = Column(Text, nullable=False, unique=True)
     password = Column(Text, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), 
-                        nullable=False, server_default=text('NOW()'))
+                        nullable=False, server_default=func.now())
     
 class Document(Base):
     __tablename__ = "documents"
@@ -17,8 +17,9 @@ class Document(Base):
     name = Column(Text, nullable=False, unique=True)
     file_path = Column(Text, nullable=False, unique=True)
     persist_path = Column(Text, nullable=False)
+    content_hash = Column(Text, index=True)
     uploaded_at = Column(TIMESTAMP(timezone=True), 
-                        nullable=False, server_default=text('NOW()'))
+                        nullable=False, server_default=func.now())
     
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
@@ -28,7 +29,35 @@ class Query(Base):
     id = Column(Integer, primary_key=True)
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
+    # Served from the answer cache; not used to seed it again
+    cached = Column(Boolean, nullable=False, server_default=false())
     created_at =  Column(TIMESTAMP(timezone=True), 
-                        nullable=False, server_default=text('NOW()'))
+                        nullable=False, server_default=func.now())
     
-    document_id = Column(Integer, ForeignKey("documents.id", ondelete='CASCADE'), nullable=False)
+    # NULL for questions asked across all of a user's documents
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete='CASCADE'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False)
+    file_path = Column(Text, nullable=False)
+    content_hash = Column(Text)
+    kind = Column(Text, nullable=False, server_default=text("'upload'"))
+    chunk_size = Column(Integer, nullable=False, server_default=text('1000'))
+    split_strategy = Column(Text, nullable=False, server_default=text("'recursive'"))
+    status = Column(Text, nullable=False, server_default=text("'pending'"))
+    error = Column(Text)
+    # API process that queued or resumed the job, and until when it holds it
+    owner = Column(Text)
+    lease_expires_at = Column(TIMESTAMP(timezone=True))
+    created_at = Column(TIMESTAMP(timezone=True), 
+                        nullable=False, server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), 
+                        nullable=False, server_default=func.now(), onupdate=func.now())
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete='SET NULL'))
@@ -2,16 +2,38 @@ from jose import JWTError, jwt
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 from . import schemas, models
-from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
 from .config import settings
+from .user_cache import UserCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+user_cache = UserCache(ttl=settings.user_cache_ttl,
+                       max_size=settings.user_cache_size,
+                       redis_url=settings.user_cache_redis_url)
+
+@event.listens_for(models.User, 'after_update')
+@event.listens_for(models.User, 'after_delete')
+def record_changed_user(mapper, connection, target):
+    """Runs during the flush; the cached user is dropped once the change is committed."""
+    object_session(target).info.setdefault('changed_users', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_users', None)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -28,21 +50,47 @@ def verifty_access_token(token: str, credentials_exception):
 
         if not id:
             raise credentials_exception
-        token_data = schemas.TokenData(id=id)
+        token_data = schemas.TokenData(id=id, email=payload.get('email'),
+                                       username=payload.get('username'))
     except JWTError:
-        raise create_access_token
-    
+        raise credentials_exception
+
     return token_data
-    
-def get_current_user(token: str = Depends(oauth2_scheme),
-                     db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+
+def credentials_error():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
         headers={'WWW-Authenticate': 'Bearer'})
-    
-    token = verifty_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
-    
+
+async def load_user(token: schemas.TokenData, db: AsyncSession, credentials_exception):
+    """The token's user, from the user cache when possible."""
+    user_id = int(token.id)
+    user = await user_cache.get(user_id)
+    if user is None:
+        db_user = await db.get(models.User, user_id)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(db_user)
+        await user_cache.put(user)
     return user
 
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_async_db)):
+    credentials_exception = credentials_error()
+
+    token = verifty_access_token(token, credentials_exception)
+    return await load_user(token, db, credentials_exception)
+
+async def get_token_user(token: str = Depends(oauth2_scheme),
+                         db: AsyncSession = Depends(get_async_db)):
+    """
+    Current user for read-only endpoints. With TRUST_TOKEN_CLAIMS the signed token
+    claims are used as-is, so a deleted user keeps read access until the token expires.
+    """
+    credentials_exception = credentials_error()
+
+    token = verifty_access_token(token, credentials_exception)
+    if settings.trust_token_claims and token.email and token.username:
+        return schemas.User(id=int(token.id), email=token.email, username=token.username)
+    return await load_user(token, db, credentials_exception)
@@ -0,0 +1,78 @@
+from threading import Lock
+from typing import TYPE_CHECKING
+import time
+
+from app.backend.config import settings
+
+if TYPE_CHECKING:
+    from app.core.ollama_client import OllamaClient
+    from app.core.ollama_rag import OllamaRAG
+
+PRELOAD_MODES = ('none', 'import', 'startup')
+
+_pipeline = None
+_pipeline_lock = Lock()
+
+
+def preload_modules():
+    """
+    Import the RAG stack (langchain, chromadb, ...) without opening any client or thread,
+    so that workers forked afterwards (e.g. gunicorn --preload) share the loaded modules.
+    """
+    start = time.perf_counter()
+    import app.core.ollama_rag  # noqa: F401
+    print(f"RAG modules imported in {time.perf_counter() - start:.2f}s")
+
+
+def create_pipeline() -> 'OllamaRAG':
+    """Build an Ollama RAG pipeline configured from the application settings."""
+    from app.core.ollama_rag import OllamaRAG
+
+    return OllamaRAG(
+        model=settings.rag_model,
+        ollama_host=settings.ollama_host,
+        ollama_timeout=settings.ollama_timeout,
+        ollama_max_connections=settings.ollama_max_connections,
+        ollama_keep_alive=settings.ollama_keep_alive,
+        parse_workers=settings.parse_workers or None,
+        pages_per_shard=settings.pages_per_shard,
+        fast_pdf_text=settings.fast_pdf_text,
+        embedding_cache_path=settings.embedding_cache_path or None,
+        parse_cache_dir=settings.parse_cache_dir or None,
+        parse_cache_max_mb=settings.parse_cache_max_mb,
+        embedding_batch_size=settings.embedding_batch_size,
+        embedding_concurrency=settings.embedding_concurrency,
+        ingest_batch_size=settings.ingest_batch_size,
+        ingest_queue_size=settings.ingest_queue_size,
+        store_mode=settings.vector_store_mode,
+        vector_backend=settings.vector_backend,
+        vector_quantization=settings.vector_quantization,
+        ann_min_vectors=settings.ann_min_vectors,
+        context_token_budget=settings.context_token_budget,
+        context_rerank=settings.context_rerank,
+    )
+
+
+def get_pipeline() -> 'OllamaRAG':
+    """The pipeline of this process, built (and the RAG stack imported) on first use."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                start = time.perf_counter()
+                _pipeline = create_pipeline()
+                print(f"RAG pipeline loaded in {time.perf_counter() - start:.2f}s")
+    return _pipeline
+
+
+def pipeline_loaded() -> bool:
+    return _pipeline is not None
+
+
+def get_ollama_client() -> 'OllamaClient':
+    """The Ollama client the pipeline uses, without loading the pipeline."""
+    from app.core.ollama_client import shared_client
+
+    return shared_client(settings.ollama_host, timeout=settings.ollama_timeout,
+                         max_connections=settings.ollama_max_connections,
+                         keep_alive=settings.ollama_keep_alive)
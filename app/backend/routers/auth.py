@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from app.backend.database import get_db
-from sqlalchemy.orm import Session
+from app.backend.database import get_async_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.backend import models, oauth2, schemas
-from app.backend.utils import verify, hash
+from app.backend.utils import run_hashing, verify_and_update, hash
 
 router = APIRouter(
     prefix='/auth',
@@ -11,9 +12,10 @@ router = APIRouter(
 )
 
 @router.post('/log-in', response_model=schemas.Token)
-def user_login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user  = db.query(models.User).filter(
-        models.User.email == user_credentials.username ).first()
+async def user_login(user_credentials: OAuth2PasswordRequestForm = Depends(),
+                     db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).where(
+        models.User.email == user_credentials.username))
     
     if not user:
         raise HTTPException(
@@ -21,33 +23,39 @@ def user_login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Sess
             detail='Invalid Email.'
         )
     
-    if not verify(user_credentials.password, user.password):
+    valid, new_hash = await run_hashing(verify_and_update, user_credentials.password, user.password)
+    if not valid:
         raise HTTPException(
             status_code = status.HTTP_403_FORBIDDEN,
             detail='Invalid Password.'
         )
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
     
     access_token = oauth2.create_access_token(data={
-         'user_id': str(user.id)
+         'user_id': str(user.id),
+         'email': user.email,
+         'username': user.username
         })
     
     return {'access_token': access_token, 'token_type': 'bearer'}
 
 @router.post('/sign-up', status_code=status.HTTP_201_CREATED, response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
 
-    existing_user = db.query(models.User).filter(
+    existing_user = await db.scalar(select(models.User).where(
         models.User.email == user.email
-    ).first()
+    ))
     
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    user.password = hash(user.password)
+    user.password = await run_hashing(hash, user.password)
     new_user = models.User(**user.model_dump())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
@@ -1,82 +1,313 @@
-from fastapi import APIRouter, UploadFile, Form, Depends, HTTPException, status, Response
-from app.core.ollama_rag import OllamaRAG
-from sqlalchemy.orm import Session
-from app.backend import schemas, models, oauth2
-from app.backend.database import get_db
-import os, shutil
+from fastapi import APIRouter, UploadFile, Form, Header, Depends, HTTPException, Request, status, Response
+from app.core.chain_cache import ChainCache
+from app.core.answer_cache import SemanticAnswerCache
+from fastapi.concurrency import run_in_threadpool
+from app.core import metrics
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.backend import schemas, models, oauth2, jobs, uploads
+from app.backend.database import get_async_db, SessionLocal
+from app.backend.config import settings
+from app.backend.rag import get_pipeline, pipeline_loaded
+import os
 
-MODEL='mistral:latest'
+chain_cache = ChainCache(max_size=settings.chain_cache_size, ttl=settings.chain_cache_ttl)
+
+def load_answered_queries(document_id: int):
+    """Seed the answer cache with the most recent answered questions of a document."""
+    db = SessionLocal()
+    try:
+        document = db.get(models.Document, document_id)
+        if not document:
+            return []
+        # Answers given before the last (re-)ingestion may be stale
+        queries = db.query(models.Query).filter(
+                models.Query.document_id == document_id,
+                models.Query.cached.is_(False),
+                models.Query.created_at >= document.uploaded_at
+            ).order_by(models.Query.created_at.desc()).limit(settings.answer_cache_size).all()
+        return [(q.question, q.answer, q.id, q.created_at.timestamp()) for q in reversed(queries)]
+    finally:
+        db.close()
+
+answer_cache = SemanticAnswerCache(
+    embed=lambda text: get_pipeline()._get_embeddings().embed_query(text),
+    embed_many=lambda texts: get_pipeline()._get_embeddings().embed_documents(texts),
+    threshold=settings.answer_cache_threshold,
+    ttl=settings.answer_cache_ttl,
+    max_entries=settings.answer_cache_size,
+    max_documents=settings.answer_cache_documents,
+    loader=load_answered_queries
+)
+
+def cache_stats():
+    stats = {
+        'chains': chain_cache.stats(),
+        'answers': answer_cache.stats(),
+        'users': oauth2.user_cache.stats(),
+    }
+    # Scraping metrics should not load the pipeline
+    if pipeline_loaded():
+        stats['embeddings'] = get_pipeline()._get_embeddings().stats()
+    return {(cache, event): values[event]
+            for cache, values in stats.items() for event in ('hits', 'misses')}
+
+metrics.REGISTRY.gauge('rag_cache_lookups', 'Cache hits and misses since startup.',
+                       cache_stats, ('cache', 'result'))
+
+def invalidate_document(document_id: int, persist_path: str = None):
+    """Drop the cached handles and answers of a document; looks its store up unless given."""
+    chain_cache.invalidate(document_id)
+    answer_cache.invalidate(document_id)
+
+    if persist_path is None:
+        db = SessionLocal()
+        try:
+            document = db.get(models.Document, document_id)
+        finally:
+            db.close()
+        persist_path = document.persist_path if document else None
+    if persist_path:
+        # Handles of other documents in a shared collection read the same store
+        chain_cache.invalidate_store(persist_path)
+        if pipeline_loaded():
+            get_pipeline().release_store(persist_path)
+
+def release_store(persist_dir: str):
+    """Drop this process's handles and client of a store another process wrote to."""
+    chain_cache.invalidate_store(persist_dir)
+    if pipeline_loaded():
+        get_pipeline().release_store(persist_dir)
+
+jobs.on_document_changed(invalidate_document)
+jobs.on_store_changed(release_store)
 
-rag_pipeline = OllamaRAG(model=MODEL)
 router = APIRouter(
         prefix='/documents',
         tags=['Documents']
     )
 
-@router.post("/upload", response_model=schemas.Document)
+async def create_job(db: AsyncSession, **fields):
+    if fields.get('status', jobs.PENDING) == jobs.PENDING:
+        # Held by this process until it finishes, or until its lease runs out
+        fields.update(jobs.lease())
+    job = models.IngestionJob(**fields)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+def upload_name(user_id: int, filename: str) -> str:
+    return f'{user_id}_' + os.path.basename(filename or '')
+
+async def check_new_name(db: AsyncSession, name: str):
+    existing_doc = await db.scalar(select(models.Document).where(
+                models.Document.name == name
+            ))
+    active_job = await db.scalar(select(models.IngestionJob).where(
+                models.IngestionJob.name == name,
+                models.IngestionJob.status.in_([jobs.PENDING, jobs.RUNNING])
+            ))
+
+    if existing_doc or active_job:
+        raise HTTPException(status_code=400, detail="File already uploaded")
+
+async def queue_upload(db: AsyncSession, user_id: int, name: str, save_path: str,
+                 content_hash: str, chunk_size: int, split_strategy: str):
+    """Queue a stored upload for ingestion, or skip it when the user already has identical content."""
+    identical_doc = await db.scalar(select(models.Document).where(
+                models.Document.user_id == user_id,
+                models.Document.content_hash == content_hash
+            ))
+    if identical_doc:
+        os.remove(save_path)
+        return await create_job(db, name=name, file_path=identical_doc.file_path,
+                          content_hash=content_hash, chunk_size=chunk_size, split_strategy=split_strategy,
+                          status=jobs.SKIPPED, user_id=user_id, document_id=identical_doc.id)
+
+    job = await create_job(db, name=name, file_path=save_path, content_hash=content_hash,
+                     chunk_size=chunk_size, split_strategy=split_strategy, user_id=user_id)
+    jobs.submit(job.id, user_id)
+    return job
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, response_model=schemas.IngestionJob)
 async def upload_pdf(
     file: UploadFile,
+    request: Request,
     chunk_size: int = Form(1000),
+    split_strategy: schemas.SplitStrategy = Form('recursive'),
     current_user = Depends(oauth2.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Upload a PDF, store it, process with RAG, and save metadata in DB."""
-    existing_doc = db.query(models.Document).filter(
-                models.Document.name == file.filename
-            ).first()
+    """Upload a PDF, store it and queue it for RAG ingestion. Poll the returned job for progress."""
+    uploads.check_content_length(request.headers.get('content-length'))
+    name = upload_name(current_user.id, file.filename)
+    await check_new_name(db, name)
 
-    if existing_doc:
-        raise HTTPException(status_code=400, detail="File already uploaded")
-    
-    file.filename = f'{current_user.id}_' + file.filename
-    
-    save_path = os.path.join("uploads", file.filename)
-    print(save_path)
-    os.makedirs("uploads", exist_ok=True)
-    
+    save_path = os.path.join(uploads.UPLOAD_DIR, name)
+    content_hash = await uploads.save_stream(uploads.upload_file_chunks(file), save_path)
+    return await queue_upload(db, current_user.id, name, save_path, content_hash, chunk_size, split_strategy)
 
-    with open(save_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    try:
-        rag_pipeline.load_pdf(path="uploads", name=file.filename, chunk_size=chunk_size)
-        rag_pipeline.create_chain()
+@router.post("/upload/stream", status_code=status.HTTP_202_ACCEPTED, response_model=schemas.IngestionJob)
+async def upload_pdf_stream(
+    request: Request,
+    filename: str,
+    chunk_size: int = 1000,
+    split_strategy: schemas.SplitStrategy = 'recursive',
+    current_user = Depends(oauth2.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Upload a PDF sent as the raw request body, without multipart encoding."""
+    uploads.check_content_length(request.headers.get('content-length'))
+    name = upload_name(current_user.id, filename)
+    await check_new_name(db, name)
 
-        persist_dir = rag_pipeline.persist_dir
+    save_path = os.path.join(uploads.UPLOAD_DIR, name)
+    content_hash = await uploads.save_stream(request.stream(), save_path)
+    return await queue_upload(db, current_user.id, name, save_path, content_hash, chunk_size, split_strategy)
 
-        new_doc = models.Document(
-            name=file.filename,
-            file_path=save_path,
-            persist_path=persist_dir,
-            user_id = current_user.id
-        )
-        db.add(new_doc)
-        db.commit()
-        db.refresh(new_doc)
+@router.post("/uploads", status_code=status.HTTP_201_CREATED, response_model=schemas.UploadSession)
+async def start_upload(session: schemas.UploadSessionCreate,
+                       current_user = Depends(oauth2.get_current_user),
+                       db: AsyncSession = Depends(get_async_db)):
+    """
+    Start a resumable upload. Send the file in pieces with PATCH, each carrying the
+    `Upload-Offset` it starts at, then call `/complete` to queue it for ingestion.
+    """
+    await check_new_name(db, upload_name(current_user.id, session.filename))
+    return uploads.create_session(current_user.id, os.path.basename(session.filename),
+                                  session.size, session.chunk_size, session.split_strategy)
+
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSession)
+def get_upload(upload_id: str, current_user = Depends(oauth2.get_token_user)):
+    """Bytes received so far, so an interrupted client knows where to resume."""
+    return uploads.load_session(upload_id, current_user.id)
+
+@router.patch("/uploads/{upload_id}", response_model=schemas.UploadSession)
+async def append_upload(upload_id: str,
+                        request: Request,
+                        upload_offset: int = Header(),
+                        current_user = Depends(oauth2.get_current_user)):
+    session = uploads.load_session(upload_id, current_user.id)
+    uploads.check_content_length(request.headers.get('content-length'),
+                                 session['size'] - upload_offset)
+    return await uploads.append_chunk(session, upload_offset, request.stream())
+
+@router.post("/uploads/{upload_id}/complete", status_code=status.HTTP_202_ACCEPTED,
+             response_model=schemas.IngestionJob)
+async def complete_upload(upload_id: str,
+                          current_user = Depends(oauth2.get_current_user),
+                          db: AsyncSession = Depends(get_async_db)):
+    session = uploads.load_session(upload_id, current_user.id)
+    name = upload_name(current_user.id, session['filename'])
+    await check_new_name(db, name)
+
+    save_path = os.path.join(uploads.UPLOAD_DIR, name)
+    content_hash = await uploads.finish_session(session, save_path)
+    return await queue_upload(db, current_user.id, name, save_path, content_hash, session['chunk_size'],
+                              session.get('split_strategy', 'recursive'))
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_upload(upload_id: str, current_user = Depends(oauth2.get_current_user)):
+    uploads.discard_session(uploads.load_session(upload_id, current_user.id))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+async def get_reingestable(db: AsyncSession, id: int, user_id: int):
+    """The user's document `id`, unless a re-ingestion of it is already queued or running."""
+    document = await db.scalar(select(models.Document).where(
+            models.Document.id == id,
+            models.Document.user_id == user_id
+        ))
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    active_job = await db.scalar(select(models.IngestionJob).where(
+                models.IngestionJob.document_id == id,
+                models.IngestionJob.status.in_([jobs.PENDING, jobs.RUNNING])
+            ))
+    if active_job:
+        raise HTTPException(status_code=409, detail="Document is already being re-ingested")
+    return document
 
-        return new_doc
+@router.put("/{id}", status_code=status.HTTP_202_ACCEPTED, response_model=schemas.IngestionJob)
+async def reingest_pdf(
+    id: int,
+    file: UploadFile,
+    request: Request,
+    chunk_size: int = Form(1000),
+    split_strategy: schemas.SplitStrategy = Form('recursive'),
+    current_user = Depends(oauth2.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Upload a new version of a document. Only chunks that changed are re-embedded;
+    a byte-identical file is skipped without parsing.
+    """
+    uploads.check_content_length(request.headers.get('content-length'))
+    document = await get_reingestable(db, id, current_user.id)
+
+    save_path = os.path.join(uploads.UPLOAD_DIR, f".reingest_{os.path.basename(document.file_path)}")
+    content_hash = await uploads.save_stream(uploads.upload_file_chunks(file), save_path)
+
+    if content_hash == document.content_hash:
+        os.remove(save_path)
+        return await create_job(db, name=document.name, file_path=document.file_path, kind=jobs.REINGEST,
+                          content_hash=content_hash, chunk_size=chunk_size, split_strategy=split_strategy,
+                          status=jobs.SKIPPED, user_id=current_user.id, document_id=document.id)
 
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    job = await create_job(db, name=document.name, file_path=save_path, kind=jobs.REINGEST,
+                     content_hash=content_hash, chunk_size=chunk_size, split_strategy=split_strategy,
+                     user_id=current_user.id, document_id=document.id)
+    jobs.submit(job.id, current_user.id, document.id)
+    return job
+
+@router.post("/{id}/rechunk", status_code=status.HTTP_202_ACCEPTED, response_model=schemas.IngestionJob)
+async def rechunk_pdf(id: int,
+                      req: schemas.RechunkRequest,
+                      current_user = Depends(oauth2.get_current_user),
+                      db: AsyncSession = Depends(get_async_db)):
+    """
+    Split a stored document again with another chunk size or strategy. The parsed
+    elements come from the parse cache, and only chunks that changed are re-embedded.
+    """
+    document = await get_reingestable(db, id, current_user.id)
+    job = await create_job(db, name=document.name, file_path=document.file_path, kind=jobs.REINGEST,
+                     content_hash=document.content_hash, chunk_size=req.chunk_size,
+                     split_strategy=req.split_strategy, user_id=current_user.id, document_id=document.id)
+    jobs.submit(job.id, current_user.id, document.id)
+    return job
+
+@router.get('/jobs/{id}', response_model=schemas.IngestionJob)
+async def get_job(id: int,
+                  db: AsyncSession = Depends(get_async_db),
+                  current_user = Depends(oauth2.get_token_user)):
+    """Status of an ingestion job."""
+    job = await db.scalar(select(models.IngestionJob).where(
+            models.IngestionJob.id == id,
+            models.IngestionJob.user_id == current_user.id
+        ))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
     
 @router.get('/')
-def get_pdf(db: Session = Depends(get_db),
-            current_user = Depends(oauth2.get_current_user)):
-    documents = db.query(models.Document).filter(
+async def get_pdf(db: AsyncSession = Depends(get_async_db),
+                  current_user = Depends(oauth2.get_token_user)):
+    documents = (await db.scalars(select(models.Document).where(
             models.Document.user_id == current_user.id
-        ).all()
+        ))).all()
     if not documents:
         return {'message': 'no pdf uploaded'}
     return documents
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_pdf(id: int,
-                db: Session = Depends(get_db),
-                current_user = Depends(oauth2.get_current_user)):
-    document_query = db.query(models.Document).filter(
+async def delete_pdf(id: int,
+                     db: AsyncSession = Depends(get_async_db),
+                     current_user = Depends(oauth2.get_current_user)):
+    document = await db.scalar(select(models.Document).where(
             models.Document.id == id,
             models.Document.user_id == current_user.id
-        )
-    document = document_query.first()
+        ))
 
     if not document:
         raise HTTPException(
@@ -87,9 +318,23 @@ def delete_pdf(id: int,
     if document.file_path and os.path.exists(document.file_path):
         os.remove(document.file_path)
 
-    if document.persist_path and os.path.exists(document.persist_path):
-        shutil.rmtree(document.persist_path, ignore_errors=True)
+    # Parsed pages are kept while another document has the same content
+    shared_content = await db.scalar(select(func.count()).select_from(models.Document).where(
+            models.Document.content_hash == document.content_hash,
+            models.Document.id != document.id
+        ))
+    document_id, persist_path, content_hash = document.id, document.persist_path, document.content_hash
+
+    def remove_stored():
+        pipeline = get_pipeline()
+        if persist_path:
+            pipeline.delete_document(persist_path, document_id)
+        if content_hash and not shared_content and pipeline.parse_cache:
+            pipeline.parse_cache.remove(content_hash)
+        invalidate_document(document_id, persist_path or '')
+
+    await run_in_threadpool(remove_stored)
 
-    document_query.delete()
-    db.commit()
+    await db.execute(delete(models.Document).where(models.Document.id == document.id))
+    await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
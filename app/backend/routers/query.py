@@ -1,35 +1,167 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.backend import schemas, models, oauth2
-from app.backend.database import get_db
-from .document import rag_pipeline
+from app.backend.database import get_async_db, AsyncSessionLocal
+from app.backend.config import settings
+from app.backend.rag import get_pipeline
+from app.backend.scheduler import SlotTokens, scheduler
+from .document import chain_cache, answer_cache
+import json
 
 router = APIRouter(tags=['Queries'])
 
-@router.post("/ask", response_model=schemas.Query)
-async def ask_question(req: schemas.QueryRequest, 
-                       db: Session = Depends(get_db),
-                       current_user = Depends(oauth2.get_current_user)):
-    """Query the RAG pipeline with a question."""
-    document = db.query(models.Document).filter(
-            models.Document.id == req.document_id,
+async def get_document(document_id: int, db: AsyncSession, current_user):
+    """Look up a document owned by the current user."""
+    document = await db.scalar(select(models.Document).where(
+            models.Document.id == document_id,
             models.Document.user_id == current_user.id
-        ).first()
+        ))
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    rag_pipeline.create_chain(persist_dir=document.persist_path)
-    print("The chain is created")
-    chunks = [chunk for chunk in rag_pipeline.query(req.question)]
-    result = ''.join(chunks)
+    return document
+
+def get_document_handle(document):
+    """Return the cached query handle of a document."""
+    return chain_cache.get_or_create(
+        (document.id, document.persist_path),
+        lambda: get_pipeline().create_chain(persist_dir=document.persist_path, document_id=document.id)
+    )
+
+async def get_library_handle(db: AsyncSession, current_user):
+    """Query handle over all documents of the current user."""
+    documents = (await db.scalars(select(models.Document).where(
+            models.Document.user_id == current_user.id
+        ))).all()
+    if not documents:
+        raise HTTPException(status_code=404, detail="No documents uploaded")
+
+    handles = await run_in_threadpool(lambda: [get_document_handle(document) for document in documents])
+    names = {document.id: document.name.removeprefix(f'{document.user_id}_') for document in documents}
+    return get_pipeline().create_library_handle(handles, names, k=settings.library_top_k)
+
+def document_version(document) -> str:
+    """Changes whenever the document is re-ingested, by this process or another one."""
+    return f"{document.uploaded_at.isoformat()}/{document.content_hash}"
+
+def lookup_cached_answer(req: schemas.QueryRequest, version: str):
+    """Return a previously generated answer to a similar question, if caching applies."""
+    if not (settings.answer_cache_enabled and req.use_cache) or req.document_id is None:
+        return None
+    hit = answer_cache.lookup(req.document_id, req.question, version)
+    return hit[0] if hit else None
+
+async def prepare_answer(req: schemas.QueryRequest, db: AsyncSession, current_user):
+    """
+    Resolve a question to (cached, sources, tokens, version): a cached answer, an answer from
+    one document, or, without a document id, one answer from all of the user's documents.
+    `version` is that of the document the answer comes from.
+    Generation waits for a scheduler slot, which is held until `tokens` is exhausted or closed.
+    """
+    if req.document_id is None:
+        handle = await get_library_handle(db, current_user)
+        ticket = await scheduler.acquire(current_user.id)
+        try:
+            sources, tokens = await run_in_threadpool(handle.query, req.question)
+        except BaseException:
+            ticket.release()
+            raise
+        return False, sources, SlotTokens(tokens, ticket), None
+
+    document = await get_document(req.document_id, db, current_user)
+    version = document_version(document)
+    cached_answer = await run_in_threadpool(lookup_cached_answer, req, version)
+    if cached_answer is not None:
+        return True, [], iter([cached_answer]), version
+
+    handle = await run_in_threadpool(get_document_handle, document)
+    ticket = await scheduler.acquire(current_user.id)
+    tokens = handle.query(req.question, req.retrieval_mode or settings.default_retrieval_mode)
+    return False, [], SlotTokens(tokens, ticket), version
 
+async def save_query(db: AsyncSession, req: schemas.QueryRequest, answer: str, user_id: int,
+                     cached: bool = False, sources: list = None, version: str = None):
     new_query = models.Query(
         question=req.question,
-        answer=result,
-        document_id=req.document_id
+        answer=answer,
+        document_id=req.document_id,
+        user_id=user_id,
+        cached=cached
     )
     db.add(new_query)
-    db.commit()
-    db.refresh(new_query)
+    await db.commit()
+    await db.refresh(new_query)
+
+    if settings.answer_cache_enabled and not cached and req.document_id is not None:
+        # Embeds the question, so keep it off the event loop
+        await run_in_threadpool(answer_cache.add, req.document_id, req.question, answer, new_query.id, version)
+
+    result = schemas.Query.model_validate(new_query, from_attributes=True)
+    result.cached = cached
+    result.sources = [schemas.Source(**source) for source in sources or []]
+    return result
+
+@router.post("/ask", response_model=schemas.Query)
+async def ask_question(req: schemas.QueryRequest,
+                       db: AsyncSession = Depends(get_async_db),
+                       current_user = Depends(oauth2.get_current_user)):
+    """
+    Query the RAG pipeline with a question. Without `document_id` the question is
+    answered from all of your documents, and `sources` lists the cited passages.
+    """
+    cached, sources, tokens, version = await prepare_answer(req, db, current_user)
+    result = await run_in_threadpool(lambda: ''.join(tokens))
+    return await save_query(db, req, result, current_user.id, cached=cached, sources=sources, version=version)
+
+@router.post("/ask/stream")
+async def ask_question_stream(req: schemas.QueryRequest,
+                              db: AsyncSession = Depends(get_async_db),
+                              current_user = Depends(oauth2.get_current_user)):
+    """
+    Query the RAG pipeline and stream tokens back as Server-Sent Events.
+
+    Each token is sent as `data: {"token": ...}`. Once generation finishes the
+    stored query, with its sources, is sent as a `done` event, or an `error` event
+    if it failed. A cached answer is sent as a single token.
+    """
+    cached, sources, tokens, version = await prepare_answer(req, db, current_user)
+
+    async def event_stream():
+        chunks = []
+        try:
+            # Generation is blocking, each token is pulled from a worker thread
+            async for chunk in iterate_in_threadpool(tokens):
+                chunks.append(chunk)
+                yield f"data: {json.dumps({'token': chunk})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            return
+        finally:
+            # Frees the scheduler slot when the client disconnects mid-stream
+            if hasattr(tokens, 'close'):
+                tokens.close()
+
+        # The request-scoped session is closed once the response starts streaming
+        async with AsyncSessionLocal() as stream_db:
+            new_query = await save_query(stream_db, req, ''.join(chunks), current_user.id,
+                                         cached=cached, sources=sources, version=version)
+        yield f"event: done\ndata: {new_query.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-    return new_query
\ No newline at end of file
+@router.get("/ask/cache")
+def chain_cache_stats(current_user = Depends(oauth2.get_token_user)):
+    """Hit/miss counters of the chain, embedding, answer and user caches, and the scheduler queues."""
+    return {
+        'chains': chain_cache.stats(),
+        'embeddings': get_pipeline()._get_embeddings().stats(),
+        'answers': answer_cache.stats(),
+        'users': oauth2.user_cache.stats(),
+        'scheduler': scheduler.stats(),
+    }
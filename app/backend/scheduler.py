@@ -0,0 +1,263 @@
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Callable, Dict, Iterator
+import asyncio
+import time
+import weakref
+
+from fastapi import HTTPException, status
+
+from app.core import metrics
+from .config import settings
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+# Dispatch order: a queued question always goes before queued ingestion
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+
+WAIT_SECONDS = metrics.REGISTRY.histogram(
+    'scheduler_wait_seconds', 'Time spent queued before a model slot was free.', ('priority',)
+)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Ticket:
+    """A place in the scheduler: queued, then running until `release()`."""
+
+    def __init__(self, scheduler: 'FairScheduler', user_id: int, priority: str,
+                 on_start: Callable[['Ticket'], None], on_expire: Callable[[], None] = None,
+                 deadline: float = None):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.on_start = on_start
+        self.on_expire = on_expire
+        self.deadline = deadline
+        self.queued_at = time.monotonic()
+        self.state = QUEUED
+
+    def release(self):
+        """Give the slot back; safe to call more than once."""
+        self.scheduler._release(self)
+
+    def cancel(self) -> bool:
+        """Leave the queue; False if the ticket was already started."""
+        return self.scheduler._cancel(self)
+
+
+class FairScheduler:
+    """
+    Admission control for work on the models. At most `concurrency` tickets run at once,
+    and each priority class has its own cap. Queued interactive work always starts before
+    background work. Within a class, users take turns (round robin), so a user who queued
+    ten jobs waits behind one job of every other user, not the other way round.
+    """
+
+    def __init__(self, concurrency: int, limits: Dict[str, int], max_queued_per_user: Dict[str, int],
+                 timeouts: Dict[str, float]):
+        self.concurrency = concurrency
+        self.limits = limits
+        self.max_queued_per_user = max_queued_per_user
+        self.timeouts = timeouts
+        self.rejected = {}
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._lock = Lock()
+
+    def _reject(self, priority: str, reason: str):
+        self.rejected[(priority, reason)] = self.rejected.get((priority, reason), 0) + 1
+
+    def submit(self, user_id: int, priority: str, on_start: Callable[[Ticket], None],
+               on_expire: Callable[[], None] = None, deadline: float = None) -> Ticket:
+        """
+        Queue work for `user_id`; `on_start(ticket)` is called (from whichever thread frees a
+        slot) once it may run, or `on_expire` if `deadline` passes first. Raises QueueFull when
+        the user already has `max_queued_per_user` tickets waiting in this class.
+        """
+        ticket = Ticket(self, user_id, priority, on_start, on_expire, deadline)
+        with self._lock:
+            queue = self._queues[priority].setdefault(user_id, deque())
+            limit = self.max_queued_per_user.get(priority, 0)
+            if limit and len(queue) >= limit:
+                if not queue:
+                    del self._queues[priority][user_id]
+                self._reject(priority, 'queue_full')
+                raise QueueFull(f"{len(queue)} requests already queued")
+            queue.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def _pop(self, priority: str) -> Ticket:
+        users = self._queues[priority]
+        if not users:
+            return None
+        user_id, queue = next(iter(users.items()))
+        ticket = queue.popleft()
+        # The user goes to the back of the line, or leaves it
+        del users[user_id]
+        if queue:
+            users[user_id] = queue
+        return ticket
+
+    def _remove(self, ticket: Ticket) -> bool:
+        users = self._queues[ticket.priority]
+        queue = users.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return False
+        queue.remove(ticket)
+        if not queue:
+            del users[ticket.user_id]
+        return True
+
+    def _dispatch(self):
+        started, expired = [], []
+        with self._lock:
+            now = time.monotonic()
+            for users in self._queues.values():
+                for queue in list(users.values()):
+                    for ticket in [t for t in queue if t.deadline is not None and t.deadline <= now]:
+                        self._remove(ticket)
+                        ticket.state = DONE
+                        self._reject(ticket.priority, 'timeout')
+                        expired.append(ticket)
+
+            while sum(self._running.values()) < self.concurrency:
+                ticket = None
+                for priority in PRIORITIES:
+                    if self._running[priority] < self.limits.get(priority, self.concurrency):
+                        ticket = self._pop(priority)
+                        if ticket is not None:
+                            break
+                if ticket is None:
+                    break
+                ticket.state = RUNNING
+                self._running[ticket.priority] += 1
+                WAIT_SECONDS.observe(now - ticket.queued_at, priority=ticket.priority)
+                started.append(ticket)
+
+        for ticket in expired:
+            if ticket.on_expire is not None:
+                ticket.on_expire()
+        for ticket in started:
+            try:
+                ticket.on_start(ticket)
+            except Exception as e:
+                print(f"Scheduled {ticket.priority} work failed to start: {e}")
+                ticket.release()
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            if ticket.state != RUNNING:
+                return
+            ticket.state = DONE
+            self._running[ticket.priority] -= 1
+        self._dispatch()
+
+    def _cancel(self, ticket: Ticket) -> bool:
+        with self._lock:
+            if ticket.state != QUEUED:
+                return False
+            self._remove(ticket)
+            ticket.state = DONE
+        return True
+
+    async def acquire(self, user_id: int, priority: str = INTERACTIVE) -> Ticket:
+        """
+        Wait for a slot from async code. Answers 429 when the user has too many requests
+        queued and 503 when no slot frees up within the class's queue-time limit.
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def start(_):
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        try:
+            ticket = self.submit(user_id, priority, start)
+        except QueueFull:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail='Too many questions in progress, please wait for an answer.',
+                                headers={'Retry-After': '5'})
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.timeouts.get(priority) or None)
+        except asyncio.TimeoutError:
+            if ticket.cancel():
+                with self._lock:
+                    self._reject(priority, 'timeout')
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail='The server is busy, please retry shortly.',
+                                    headers={'Retry-After': '5'})
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            if not ticket.cancel():
+                ticket.release()
+            raise
+        return ticket
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                priority: {
+                    'queued': sum(len(queue) for queue in self._queues[priority].values()),
+                    'users': len(self._queues[priority]),
+                    'running': self._running[priority],
+                }
+                for priority in PRIORITIES
+            }
+
+
+class SlotTokens:
+    """Token stream that gives its scheduler slot back once exhausted, failed, closed or dropped."""
+
+    def __init__(self, tokens: Iterator[str], ticket: Ticket):
+        self._tokens = tokens
+        self._ticket = ticket
+        weakref.finalize(self, ticket.release)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._tokens)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self._ticket.release()
+        close = getattr(self._tokens, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # Still producing a token in a worker thread, it stops at the next one
+                pass
+
+
+scheduler = FairScheduler(
+    concurrency=settings.scheduler_concurrency,
+    limits={BACKGROUND: settings.scheduler_background_slots},
+    max_queued_per_user={INTERACTIVE: settings.scheduler_max_queued_per_user},
+    timeouts={INTERACTIVE: settings.scheduler_interactive_timeout,
+              BACKGROUND: settings.scheduler_background_timeout},
+)
+
+
+def _queue_stats() -> dict:
+    stats = scheduler.stats()
+    return {(priority, state): values[state]
+            for priority, values in stats.items() for state in ('queued', 'running')}
+
+
+metrics.REGISTRY.gauge('scheduler_tasks', 'Model work queued or running, by priority class.',
+                       _queue_stats, ('priority', 'state'))
+metrics.REGISTRY.gauge('scheduler_rejected', 'Work turned away for a full queue or a queue-time limit.',
+                       lambda: dict(scheduler.rejected), ('priority', 'reason'))
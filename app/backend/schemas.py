@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Literal
 
 class User(BaseModel):
     id: int
@@ -24,6 +24,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     id: Optional[str] = None
+    email: Optional[str] = None
+    username: Optional[str] = None
 
 
 class Document(BaseModel):
@@ -31,13 +33,59 @@ class Document(BaseModel):
     name: str
     file_path: str
     persist_path: str
+    content_hash: Optional[str] = None
     uploaded_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
-class QueryRequest(BaseModel):
-    document_id: int
+SplitStrategy = Literal['recursive', 'token', 'section', 'sentence_window']
+
+class IngestionJob(BaseModel):
+    id: int
+    name: str
+    kind: str
+    chunk_size: int
+    split_strategy: str
+    status: str
+    error: Optional[str] = None
+    document_id: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    chunk_size: int = 1000
+    split_strategy: SplitStrategy = 'recursive'
+
+class RechunkRequest(BaseModel):
+    chunk_size: int = Field(1000, gt=0)
+    split_strategy: SplitStrategy = 'recursive'
+
+class UploadSession(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+
+class QueryBase(BaseModel):
+    # Without a document the question is answered from all of the user's documents
+    document_id: Optional[int] = None
     question: str
 
-class Query(QueryRequest):
+class QueryRequest(QueryBase):
+    retrieval_mode: Optional[Literal['similarity', 'mmr', 'multi_query', 'hybrid']] = None
+    use_cache: bool = True
+
+class Source(BaseModel):
+    index: int
+    document_id: Optional[int] = None
+    name: Optional[str] = None
+    page: Optional[int] = None
+    score: float
+
+class Query(QueryBase):
     id: int
     answer: str
+    cached: bool = False
+    sources: List[Source] = []
@@ -0,0 +1,196 @@
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+import hashlib
+import json
+import os
+import uuid
+
+import anyio
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.backend.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+UPLOAD_DIR = "uploads"
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, ".partial")
+CHUNK_BYTES = 1024 * 1024
+
+
+def max_upload_bytes() -> int:
+    return settings.max_upload_mb * 1024 * 1024
+
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the {settings.max_upload_mb} MB upload limit"
+    )
+
+
+def check_content_length(content_length: str = None, limit: int = None):
+    """Reject a request up front when its declared size is already over the limit."""
+    limit = max_upload_bytes() if limit is None else limit
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise too_large()
+
+
+async def upload_file_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(CHUNK_BYTES):
+        yield chunk
+
+
+async def stream_to_file(chunks: AsyncIterator[bytes], path: str, mode: str = "wb",
+                         limit: int = None, digest=None) -> int:
+    """Write chunks to `path` without blocking the event loop; returns the bytes written."""
+    written = 0
+    async with await anyio.open_file(path, mode) as f:
+        async for chunk in chunks:
+            if limit is not None and written + len(chunk) > limit:
+                raise too_large()
+            if digest is not None:
+                digest.update(chunk)
+            await f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+async def save_stream(chunks: AsyncIterator[bytes], path: str) -> str:
+    """Store a complete upload under the size cap and return its SHA-256, hashed while streaming."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    try:
+        await stream_to_file(chunks, path, limit=max_upload_bytes(), digest=digest)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return digest.hexdigest()
+
+
+def _sha256_of(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_sha256(path: str) -> str:
+    return await run_in_threadpool(_sha256_of, path)
+
+
+# --------- Resumable uploads --------- #
+# A session is a JSON metadata file plus a `.part` data file under uploads/.partial.
+# The current offset is the size of the data file, so an interrupted client can ask
+# for it and continue from there.
+
+# Sessions in use by a request of this process, for platforms without fcntl
+_busy = set()
+
+def _session_paths(upload_id: str):
+    try:
+        upload_id = uuid.UUID(upload_id).hex
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    base = os.path.join(PARTIAL_DIR, upload_id)
+    return f"{base}.json", f"{base}.part"
+
+
+def session_view(session: dict) -> dict:
+    _, data_path = _session_paths(session["id"])
+    return {**session, "offset": os.path.getsize(data_path)}
+
+
+def create_session(user_id: int, filename: str, size: int, chunk_size: int,
+                   split_strategy: str = "recursive") -> dict:
+    if size > max_upload_bytes():
+        raise too_large()
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+
+    session = {"id": uuid.uuid4().hex, "user_id": user_id, "filename": filename,
+               "size": size, "chunk_size": chunk_size, "split_strategy": split_strategy}
+    meta_path, data_path = _session_paths(session["id"])
+    open(data_path, "wb").close()
+    with open(meta_path, "w") as f:
+        json.dump(session, f)
+    return session_view(session)
+
+
+def load_session(upload_id: str, user_id: int) -> dict:
+    meta_path, _ = _session_paths(upload_id)
+    if not os.path.exists(meta_path):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    with open(meta_path) as f:
+        session = json.load(f)
+    if session["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session_view(session)
+
+
+@contextmanager
+def _session_lock(session: dict) -> Iterator[int]:
+    """
+    Exclusive use of a session's data file, across requests and API processes, yielding
+    the bytes received so far. It is not waited for: a concurrent request gets 409.
+    """
+    _, data_path = _session_paths(session["id"])
+    try:
+        lock_file = open(data_path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    with lock_file:
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif session["id"] in _busy:
+                raise BlockingIOError
+        except BlockingIOError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Another request is writing to this upload"
+            )
+        _busy.add(session["id"])
+        try:
+            yield os.fstat(lock_file.fileno()).st_size
+        finally:
+            _busy.discard(session["id"])
+
+
+async def append_chunk(session: dict, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+    """Append a chunk at `offset`, which must match what the server already has."""
+    _, data_path = _session_paths(session["id"])
+    with _session_lock(session) as received:
+        # Checked under the lock, another request may have appended since the session was read
+        if offset != received:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload offset mismatch, server has {received} bytes"
+            )
+        await stream_to_file(chunks, data_path, mode="ab", limit=session["size"] - offset)
+    return session_view(session)
+
+
+async def finish_session(session: dict, save_path: str) -> str:
+    """Move a fully received upload to `save_path` and return its SHA-256."""
+    meta_path, data_path = _session_paths(session["id"])
+    with _session_lock(session) as received:
+        if received != session["size"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload incomplete: {received} of {session['size']} bytes received"
+            )
+        content_hash = await file_sha256(data_path)
+        os.replace(data_path, save_path)
+        os.remove(meta_path)
+    return content_hash
+
+
+def discard_session(session: dict):
+    for path in _session_paths(session["id"]):
+        if os.path.exists(path):
+            os.remove(path)
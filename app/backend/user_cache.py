@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+import asyncio
+import time
+
+from app.backend import schemas
+
+
+class UserCache:
+    """
+    Short-TTL cache of authenticated users keyed by user id.
+
+    Entries live in process memory, or in redis when `redis_url` is given so that
+    every API worker sees the same entries and invalidations. Entries expire `ttl`
+    seconds after they were stored, however often they are read.
+    `get` and `put` run on the event loop, so redis is used through its asyncio client.
+    `invalidate` is called from SQLAlchemy events once a change is committed; on the event
+    loop it deletes the redis entry in a task, elsewhere with a blocking client.
+    """
+
+    def __init__(self, ttl: float = 60, max_size: int = 1024, redis_url: str = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._redis = None
+        self._async_redis = None
+        # Pending deletions, referenced until done
+        self._tasks = set()
+        if redis_url:
+            try:
+                import redis
+                import redis.asyncio
+            except ImportError:
+                print("redis is not installed, falling back to the in-process user cache")
+            else:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                self._async_redis = redis.asyncio.Redis.from_url(redis_url, socket_timeout=0.5)
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"pdf_rag:user:{user_id}"
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    async def get(self, user_id: int) -> Optional[schemas.User]:
+        if self.ttl <= 0:
+            return None
+        if self._async_redis is not None:
+            try:
+                value = await self._async_redis.get(self._key(user_id))
+            except Exception as e:
+                print(f"User cache lookup failed: {e}")
+                value = None
+            self._count(value is not None)
+            return schemas.User.model_validate_json(value) if value else None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] <= now:
+                del self._entries[user_id]
+                entry = None
+        self._count(entry is not None)
+        return entry[0] if entry else None
+
+    async def put(self, user: schemas.User):
+        if self.ttl <= 0:
+            return
+        if self._async_redis is not None:
+            try:
+                await self._async_redis.set(self._key(user.id), user.model_dump_json(), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                print(f"User cache store failed: {e}")
+            return
+
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def _delete(self, user_id: int):
+        try:
+            await self._async_redis.delete(self._key(user_id))
+        except Exception as e:
+            print(f"User cache invalidation failed: {e}")
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self._redis is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                self._redis.delete(self._key(user_id))
+            except Exception as e:
+                print(f"User cache invalidation failed: {e}")
+            return
+        task = loop.create_task(self._delete(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': 'redis' if self._redis is not None else 'memory',
+                'size': len(self._entries),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -1,9 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from app.core import metrics
+from .config import settings
+import asyncio
 
-password_context = CryptContext(schemes=['argon2'], deprecated='auto')
+argon2_costs = {
+    f'argon2__{name}': value for name, value in (
+        ('time_cost', settings.argon2_time_cost),
+        ('memory_cost', settings.argon2_memory_cost),
+        ('parallelism', settings.argon2_parallelism),
+    ) if value is not None
+}
+
+# Hashes made with other parameters still verify and are flagged for a rehash
+password_context = CryptContext(schemes=['argon2'], deprecated='auto', **argon2_costs)
+
+# argon2 releases the GIL, so a few threads keep hashing off the event loop
+hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers,
+                                   thread_name_prefix='password-hash')
+hash_capacity = settings.password_hash_workers + settings.password_hash_queue
+hash_slots = BoundedSemaphore(hash_capacity)
+hashes_in_flight = 0
+in_flight_lock = Lock()
+
+metrics.REGISTRY.gauge('password_hash_slots', 'Password hashing work running or queued.',
+                       lambda: {('used',): hashes_in_flight, ('capacity',): hash_capacity},
+                       ('state',))
 
 def hash(password: str):
     return password_context.hash(password)
 
 def verify(password_provided: str, hash_password: str):
-    return password_context.verify(password_provided, hash_password)
\ No newline at end of file
+    return password_context.verify(password_provided, hash_password)
+
+def verify_and_update(password_provided: str, hash_password: str):
+    """Returns (valid, new_hash); new_hash is set when the stored hash uses outdated parameters."""
+    return password_context.verify_and_update(password_provided, hash_password)
+
+def _release_slot(_):
+    global hashes_in_flight
+    with in_flight_lock:
+        hashes_in_flight -= 1
+    hash_slots.release()
+
+async def run_hashing(fn, *args):
+    """Run `fn` on the hashing executor, or answer 503 when its queue is full."""
+    global hashes_in_flight
+    if not hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many logins in progress, please retry shortly.',
+            headers={'Retry-After': '1'}
+        )
+    with in_flight_lock:
+        hashes_in_flight += 1
+    future = hash_executor.submit(fn, *args)
+    # The slot is held until the hash finishes, even if the client goes away
+    future.add_done_callback(_release_slot)
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable, Hashable, Iterable, List, Optional, Tuple
+import time
+
+import numpy as np
+
+
+class _DocumentIndex:
+    """Normalized question vectors of one version of a document with their stored answers."""
+
+    def __init__(self, dim: int, version: Hashable = None):
+        self.version = version
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.answers: List[str] = []
+        self.query_ids: List[int] = []
+        self.created: List[float] = []
+
+
+class SemanticAnswerCache:
+    """
+    Per-document cache of answers, looked up by cosine similarity between the
+    embedding of an incoming question and previously answered questions.
+    At most `max_documents` documents are indexed, the least recently used are dropped.
+
+    Callers pass the version of the document they read (e.g. its upload time and file
+    hash). An index built for another version is dropped and seeded again, so processes
+    that missed an `invalidate` stop serving answers from before a re-ingestion.
+    """
+
+    def __init__(self, embed: Callable[[str], List[float]], threshold: float = 0.92,
+                 ttl: float = 86400, max_entries: int = 256,
+                 loader: Callable[[int], Iterable[Tuple[str, str, int, float]]] = None,
+                 embed_many: Callable[[List[str]], List[List[float]]] = None,
+                 max_documents: int = 1024):
+        self.embed = embed
+        self.embed_many = embed_many
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._indexes = OrderedDict()
+        # Bumped on every invalidation, so an index seeded meanwhile is not installed
+        self._generation = 0
+        self._lock = RLock()
+
+    def _normalize(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def _vector(self, question: str) -> np.ndarray:
+        return self._normalize(self.embed(question.strip().lower()))
+
+    def _seed(self, document_id: int, dim: int, version: Hashable) -> _DocumentIndex:
+        """A new index holding the questions returned by `loader`, embedded in one batch."""
+        index = _DocumentIndex(dim, version)
+        rows = list(self.loader(document_id)) if self.loader else []
+        rows = rows[-self.max_entries:]
+        if rows:
+            questions = [question.strip().lower() for question, _, _, _ in rows]
+            embedded = self.embed_many(questions) if self.embed_many else [self.embed(q) for q in questions]
+            index.vectors = self._normalize(embedded).reshape(len(rows), dim)
+            index.answers = [answer for _, answer, _, _ in rows]
+            index.query_ids = [query_id for _, _, query_id, _ in rows]
+            index.created = [created for _, _, _, created in rows]
+        return index
+
+    def _index(self, document_id: int, dim: int, version: Hashable) -> _DocumentIndex:
+        """
+        Return the index of a document version, seeding it from `loader` on first use. Seeding
+        loads and embeds outside the lock, so lookups on other documents are not held up;
+        when two threads seed the same document, the first one to finish is kept.
+        """
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(document_id)
+                return index
+            generation = self._generation
+
+        seeded = self._seed(document_id, dim, version)
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is not None and index.version == version:
+                return index
+            if self._generation != generation:
+                # A document was invalidated while seeding, the index may be stale
+                return seeded
+            self._indexes[document_id] = seeded
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+            return seeded
+
+    def _append(self, index: _DocumentIndex, vector: np.ndarray, answer: str,
+                query_id: int, created: float):
+        index.vectors = np.vstack([index.vectors, vector[None, :]])[-self.max_entries:]
+        index.answers = (index.answers + [answer])[-self.max_entries:]
+        index.query_ids = (index.query_ids + [query_id])[-self.max_entries:]
+        index.created = (index.created + [created])[-self.max_entries:]
+
+    def lookup(self, document_id: int, question: str, version: Hashable = None) -> Optional[Tuple[str, int]]:
+        """Return `(answer, query_id)` of the closest fresh question above the threshold."""
+        vector = self._vector(question)
+        index = self._index(document_id, vector.shape[0], version)
+        with self._lock:
+            if index.answers:
+                scores = index.vectors @ vector
+                if self.ttl > 0:
+                    expired = np.asarray(index.created) < time.time() - self.ttl
+                    scores[expired] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return index.answers[best], index.query_ids[best]
+            self.misses += 1
+            return None
+
+    def add(self, document_id: int, question: str, answer: str, query_id: int, version: Hashable = None):
+        vector = self._vector(question)
+        index = self._index(document_id, vector.shape[0], version)
+        with self._lock:
+            self._append(index, vector, answer, query_id, time.time())
+
+    def invalidate(self, document_id: int):
+        with self._lock:
+            self._indexes.pop(document_id, None)
+            self._generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'documents': len(self._indexes),
+                'entries': sum(len(index.answers) for index in self._indexes.values()),
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -1,29 +1,297 @@
 from abc import ABC, abstractmethod
-from typing import  Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import  Callable, Dict, Generator, Iterator, List, Tuple
+from threading import Lock
+import hashlib
 import os
+import shutil
+import time
 
-from langchain_community.document_loaders import UnstructuredPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import numpy as np
 from langchain_chroma import Chroma
 from langchain.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain.retrievers.multi_query import MultiQueryRetriever
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+from . import metrics
+from .chain_cache import ChainCache
+from .chroma_clients import ChromaClients
+from .context import ContextCompressor, RERANK_MODES
+from .embeddings import PrecomputedEmbeddings
+from .pdf_loader import ParallelPDFLoader, ParseCache
+from .lexical import BM25Writer, lexical_index_path, open_lexical_index, remove_lexical_index
+from .mmap_store import MmapVectorStore
+from .retrievers import ConcurrentMultiQueryRetriever, BM25Retriever, RRFRetriever
+from .splitters import SPLIT_STRATEGIES, expand_windows, iter_chunks
+from .streaming import StageTimer, batched, prefetch
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+DB_ROOT = os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "db")
+LIBRARY_DIR = "_library"
+
+STORE_MODES = ('document', 'shared', 'user')
+
+VECTOR_BACKENDS = ('chroma', 'mmap')
+
+RETRIEVAL_MODES = ('similarity', 'mmr', 'multi_query', 'hybrid')
+
+WRITE_LOCK = ".write.lock"
+_write_locks = {}
+_write_locks_guard = Lock()
+
+
+@contextmanager
+def store_write_lock(persist_dir: str):
+    """
+    Exclusive write access to a store, across threads and, through a lock file, across
+    processes: Chroma does not support several writers on one persistent directory.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    key = os.path.normpath(os.path.abspath(persist_dir))
+    with _write_locks_guard:
+        thread_lock = _write_locks.setdefault(key, Lock())
+    with thread_lock:
+        with open(os.path.join(persist_dir, WRITE_LOCK), "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def stream_answer(chain, value) -> Generator[str, None, None]:
+    """Stream a chain's output, recording time to first token and generation time."""
+    start = time.perf_counter()
+    tokens = 0
+    for chunk in chain.stream(value):
+        if tokens == 0:
+            metrics.observe("first_token", time.perf_counter() - start)
+        tokens += 1
+        yield chunk
+    metrics.observe("generate", time.perf_counter() - start, tokens=tokens)
+
+class DocumentHandle:
+    """
+    Per-document query handle. Owns the vector store of one document and its chains,
+    built lazily per retrieval mode, while sharing the models of its pipeline.
+    """
+
+    def __init__(self, rag: 'BaseRAG', persist_dir: str, vector_db,
+                 prompt_template: str = None, search_kwargs: dict = None,
+                 document_id: int = None):
+        self.rag = rag
+        self.persist_dir = persist_dir
+        self.vector_db = vector_db
+        self.prompt_template = prompt_template
+        self.search_kwargs = search_kwargs or {}
+        self.document_id = document_id
+        self._chains = {}
+
+    def lexical_index(self):
+        """The document's BM25 index, or None if it was ingested without one."""
+        return open_lexical_index(self.persist_dir, self.document_id)
+
+    def get_chain(self, retrieval_mode: str = 'multi_query'):
+        """Return the RAG chain for `retrieval_mode`, building it on first use."""
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+
+        chain = self._chains.get(retrieval_mode)
+        if chain is None:
+            lexical_index = self.lexical_index() if retrieval_mode == 'hybrid' else None
+            retriever = self.rag._create_retriever(
+                self.vector_db, retrieval_mode, self.prompt_template, self.search_kwargs,
+                lexical_index
+            )
+            chain = self._chains[retrieval_mode] = self.rag._create_rag_chain(retriever)
+        return chain
+
+    def query(self, question: str, retrieval_mode: str = 'multi_query') -> Generator[str, None, None]:
+        """Ask a question about this document."""
+
+        if not question or not question.strip():
+            raise ValueError("Question cannot be empty")
+
+        yield from stream_answer(self.get_chain(retrieval_mode), question)
+
+
+class LibraryHandle:
+    """
+    Query handle over several documents. Every store is searched in parallel (a shared
+    collection once, filtered to the wanted documents) with one query embedding, hits are
+    merged by cosine similarity and a single generation answers from the numbered passages,
+    citing them.
+    """
+
+    def __init__(self, rag: 'BaseRAG', handles: List[DocumentHandle], names: Dict[int, str] = None,
+                 k: int = 6, max_workers: int = 8):
+        self.rag = rag
+        self.names = names or {}
+        self.k = k
+        self.max_workers = max_workers
+
+        # One search per store: documents sharing a collection are filtered together
+        self.searches = {}
+        for handle in handles:
+            vector_db, document_ids = self.searches.setdefault(handle.persist_dir, (handle.vector_db, []))
+            document_ids.append(handle.document_id)
+
+    def _search(self, query: List[float], persist_dir: str) -> List[Tuple[Document, List[float]]]:
+        """The `k` nearest chunks of the handles' documents in one store, with their stored vectors."""
+        vector_db, document_ids = self.searches[persist_dir]
+        if self.rag.is_library(persist_dir):
+            search_filter = ({"document_id": document_ids[0]} if len(document_ids) == 1
+                             else {"document_id": {"$in": document_ids}})
+            docs = vector_db.similarity_search_by_vector(query, k=self.k, filter=search_filter)
+        else:
+            docs = vector_db.similarity_search_by_vector(query, k=self.k)
+            # Per-document stores ingested before chunk metadata existed lack the id
+            for doc in docs:
+                doc.metadata.setdefault("document_id", document_ids[0])
+        if not docs:
+            return []
+
+        stored = vector_db.get(ids=[doc.id for doc in docs], include=['embeddings'])
+        vectors = dict(zip(stored['ids'], stored['embeddings']))
+        # A chunk deleted since the search has no vector left
+        return [(doc, vectors[doc.id]) for doc in docs if doc.id in vectors]
+
+    @staticmethod
+    def _rescore(query: List[float], hits: List[Tuple[Document, List[float]]]) -> List[Tuple[Document, float]]:
+        """
+        Cosine similarity of each chunk to the query. Backends report scores on different
+        scales (Chroma from L2 distance, mmap from cosine), so merged hits are scored here
+        alike, from the vectors the stores hold.
+        """
+        if not hits:
+            return []
+        vectors = np.asarray([vector for _, vector in hits], dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = vectors @ query / np.where(norms > 0, norms, 1.0)
+        return [(doc, score) for (doc, _), score in zip(hits, scores.tolist())]
+
+    def retrieve(self, question: str) -> List[Tuple[object, float]]:
+        """The `k` best chunks over all documents with their cosine similarity, compressed."""
+        with metrics.span("retrieve") as counts:
+            embeddings = self.rag._get_embeddings()
+            query = embeddings.embed_query(question)
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.searches))) as executor:
+                results = list(executor.map(lambda persist_dir: self._search(query, persist_dir),
+                                            self.searches))
+            hits = self._rescore(query, [hit for hits in results for hit in hits])
+            hits = sorted(hits, key=lambda hit: hit[1], reverse=True)[:self.k]
+            counts["chunks"] = len(hits)
+            counts["stores"] = len(self.searches)
+
+        selected = self.rag.context_compressor.select(question, expand_windows([doc for doc, _ in hits]))
+        return [
+            (Document(page_content=text, metadata=hits[position][0].metadata), hits[position][1])
+            for position, text in selected
+        ]
+
+    def sources(self, hits) -> List[dict]:
+        return [
+            {
+                "index": index,
+                "document_id": doc.metadata.get("document_id"),
+                "name": self.names.get(doc.metadata.get("document_id"), doc.metadata.get("source")),
+                "page": doc.metadata.get("page_number"),
+                "score": round(float(score), 4),
+            }
+            for index, (doc, score) in enumerate(hits, start=1)
+        ]
+
+    def query(self, question: str) -> Tuple[List[dict], Generator[str, None, None]]:
+        """Retrieve across all documents; returns the cited sources and the answer token stream."""
+
+        if not question or not question.strip():
+            raise ValueError("Question cannot be empty")
+
+        hits = self.retrieve(question)
+        sources = self.sources(hits)
+        context = "\n\n".join(
+            f"[{source['index']}] {source['name']}, page {source['page']}:\n{doc.page_content}"
+            for source, (doc, _) in zip(sources, hits)
+        )
+        chain = self.rag._create_library_chain()
+        return sources, stream_answer(chain, {"context": context, "question": question})
+
 
 class BaseRAG(ABC):
     """
     Abstract base class for RAG pipeline supporting multiple AI providers.
+
+    Instances only hold the models and embeddings, which are safe to share across
+    threads. Everything document-specific lives in the returned `DocumentHandle`.
     """
     
-    def __init__(self, model: str, embedding_model: str = None):
+    def __init__(self, model: str, embedding_model: str = None,
+                 parse_workers: int = None, pages_per_shard: int = 20,
+                 fast_pdf_text: bool = False, embedding_cache_path: str = None,
+                 embedding_batch_size: int = 32, embedding_concurrency: int = 4,
+                 store_mode: str = 'document', vector_backend: str = 'chroma',
+                 vector_quantization: str = 'int8', ann_min_vectors: int = 100000,
+                 context_token_budget: int = 1500, context_rerank: str = 'lexical',
+                 parse_cache_dir: str = None, parse_cache_max_mb: int = 1024,
+                 ingest_batch_size: int = 256, ingest_queue_size: int = 4):
+        if store_mode not in STORE_MODES:
+            raise ValueError(f"Unknown store mode: {store_mode}")
+        if vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend: {vector_backend}")
+        if context_rerank not in RERANK_MODES:
+            raise ValueError(f"Unknown rerank mode: {context_rerank}")
         self.model = model
         self.embedding_model = embedding_model or self._get_default_embedding_model()
         self.vector_store_name = "pdf-rag"
-        self.persist_dir = ''
+        self.parse_workers = parse_workers
+        self.pages_per_shard = pages_per_shard
+        self.fast_pdf_text = fast_pdf_text
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_concurrency = embedding_concurrency
+        self.ingest_batch_size = max(1, ingest_batch_size)
+        self.ingest_queue_size = max(1, ingest_queue_size)
+        self.store_mode = store_mode
+        self.vector_backend = vector_backend
+        self.vector_quantization = vector_quantization
+        self.ann_min_vectors = ann_min_vectors
+        self.context_token_budget = context_token_budget
+        self.context_rerank = context_rerank
+        self._context_compressor = None
+        self.chroma_clients = ChromaClients()
+        self.parse_cache = ParseCache(parse_cache_dir, parse_cache_max_mb * 1024 ** 2) if parse_cache_dir else None
         self.llm = None
-        self.vector_db = None
-        self.chain = None
+        self.query_variant_cache = ChainCache(max_size=1024, ttl=3600)
+        self._init_lock = Lock()
+
+    def _ensure_models(self):
+        """Initialize the models once, even when called from several threads."""
+        if self.llm:
+            return
+        with self._init_lock:
+            if not self.llm:
+                self._initialize_models()
         
+    @property
+    def context_compressor(self) -> ContextCompressor:
+        """Dedupes, reranks and budgets retrieved chunks before generation."""
+        if self._context_compressor is None:
+            embeddings = self._get_embeddings() if self.context_rerank == 'embedding' else None
+            self._context_compressor = ContextCompressor(self.context_token_budget, self.context_rerank, embeddings)
+        return self._context_compressor
+
+    def warm_up(self):
+        """Initialize the models ahead of the first request."""
+        self._ensure_models()
+
     @abstractmethod
     def _initialize_models(self):
         """Initialize the LLM and embedding models for the specific provider."""
@@ -34,83 +302,304 @@ class BaseRAG(ABC):
         """Get default embedding model for the provider."""
         pass
     
-    def _create_db(self, documents):
-        """Create or update a Chroma vector database from documents."""
-        try:
-            embeddings = self._get_embeddings()
-
-            # Ensure the persist directory exists
-            os.makedirs(self.persist_dir, exist_ok=True)
-            print(f"Creating new database at: {self.persist_dir}")
-            
-            # Create new DB - Chroma automatically persists with persist_directory
-            self.vector_db = Chroma.from_documents(
-                documents=documents,
-                embedding=embeddings,
-                collection_name=self.vector_store_name,
-                persist_directory=self.persist_dir,
-            )
-            print("Database created successfully")
-            
-        except Exception as e:
-            print(f"Error in _create_db: {e}")
-            raise RuntimeError(f"Failed to create vector database: {e}")
-    
     @abstractmethod
     def _get_embeddings(self):
         """Get embeddings instance for the provider."""
         pass
 
-    def _split_doc(self, documents, chunk_size: int = 1000, overlap_ratio: float = 0.2):
-        """Split documents into chunks and create a DB."""
-        chunk_overlap = int(chunk_size * overlap_ratio)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = splitter.split_documents(documents)
-        print(f"Chunks created: {len(chunks)}")
-        self._create_db(chunks)
+    @staticmethod
+    def is_library(persist_dir: str) -> bool:
+        """Whether a persist directory holds a shared (multi-document) collection."""
+        return LIBRARY_DIR in os.path.normpath(persist_dir).split(os.sep)
+
+    def store_path(self, name: str, user_id: int = None) -> str:
+        """Persist directory for a new document under the configured store mode."""
+        if self.store_mode == 'shared':
+            return os.path.join(DB_ROOT, LIBRARY_DIR)
+        if self.store_mode == 'user':
+            return os.path.join(DB_ROOT, LIBRARY_DIR, f"user_{user_id}")
+        return os.path.join(DB_ROOT, name.removesuffix(".pdf"))
+
+    @staticmethod
+    def _stored_backend(persist_dir: str) -> str:
+        """Backend of the store in `persist_dir`, or None when nothing was written there yet."""
+        if MmapVectorStore.exists(persist_dir):
+            return 'mmap'
+        if os.path.exists(os.path.join(persist_dir, 'chroma.sqlite3')):
+            return 'chroma'
+        return None
+
+    def backend_of(self, persist_dir: str) -> str:
+        """Backend of an existing store, or the configured one for a new directory."""
+        return self._stored_backend(persist_dir) or self.vector_backend
+
+    def _open_db(self, persist_dir: str, embeddings=None):
+        embeddings = embeddings or self._get_embeddings()
+        if self.backend_of(persist_dir) == 'mmap':
+            return MmapVectorStore(
+                persist_dir,
+                embeddings,
+                quantization=self.vector_quantization,
+                ann_min_vectors=self.ann_min_vectors,
+            )
+        return self.chroma_clients.open(persist_dir, lambda client: Chroma(
+            client=client,
+            embedding_function=embeddings,
+            collection_name=self.vector_store_name,
+        ))
+
+    def release_store(self, persist_dir: str):
+        """
+        Forget this process's client of a store that another process changed: stores opened
+        later read it afresh, queries still running finish on the old client.
+        """
+        self.chroma_clients.release(persist_dir)
+
+    @contextmanager
+    def writing(self, persist_dir: str):
+        """
+        Hold the write lock of a store, on a client opened after taking it: a client opened
+        before may not see what other processes wrote, and writing through it would lose that.
+        """
+        with store_write_lock(persist_dir):
+            self.release_store(persist_dir)
+            yield
+
+    def delete_document(self, persist_dir: str, document_id: int):
+        """Remove a document's chunks: its rows in a shared collection, or its whole directory."""
+        if not os.path.exists(persist_dir):
+            return
+        if self.is_library(persist_dir):
+            with self.writing(persist_dir):
+                self._open_db(persist_dir).delete(where={"document_id": document_id})
+            remove_lexical_index(persist_dir, document_id)
+        else:
+            self.release_store(persist_dir)
+            shutil.rmtree(persist_dir, ignore_errors=True)
 
-    def load_pdf(self, path: str, name: str, lang: str = "en", chunk_size: int = 1000):
-        """Load a PDF file, split it, and store it in Chroma DB."""
+    @staticmethod
+    def _chunk_id(chunk, taken: Callable[[str], bool], document_id: int = None) -> str:
+        """
+        Content-addressed chunk id: sha256 of the chunk text, and of its sentence window if
+        any (answers are generated from it, so a changed window is a changed chunk), plus an
+        occurrence counter for repeated text (the first id not `taken` yet), prefixed with the
+        document id so shared collections stay unique.
+        """
+        content = chunk.page_content
+        if chunk.metadata.get("window"):
+            content = f"{content}\0{chunk.metadata['window']}"
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+        prefix = f"{document_id}-{digest}" if document_id is not None else digest
+        occurrence = 0
+        while taken(f"{prefix}-{occurrence}"):
+            occurrence += 1
+        return f"{prefix}-{occurrence}"
+
+    def _iter_chunks(self, path: str, name: str, lang: str = "en", chunk_size: int = 1000,
+                     metadata: dict = None, split_strategy: str = 'recursive') -> Iterator[Document]:
+        """Chunks of a PDF carrying `metadata`, split as its pages are parsed."""
+        if split_strategy not in SPLIT_STRATEGIES:
+            raise ValueError(f"Unknown split strategy: {split_strategy}")
+        extension = ".pdf"
+        name = name.removesuffix(extension)
+        pdf_path = os.path.join(path, f"{name + extension}")
+
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF not found at path: {pdf_path}")
+
+        print(f"Looking for PDF at: {os.path.abspath(pdf_path)}")
+        loader = ParallelPDFLoader(
+            file_path=pdf_path,
+            language=lang,
+            workers=self.parse_workers,
+            pages_per_shard=self.pages_per_shard,
+            fast_path=self.fast_pdf_text,
+            cache=self.parse_cache,
+        )
+        return self._split_pages(loader, chunk_size, metadata, split_strategy)
+
+    def _split_pages(self, loader: ParallelPDFLoader, chunk_size: int, metadata: dict,
+                     split_strategy: str) -> Iterator[Document]:
+        """Parsing runs on a thread of its own, at most `ingest_queue_size` pages ahead of splitting."""
+        parse, waited, split = StageTimer(), StageTimer(), StageTimer()
+        pages = prefetch(parse.wrap(loader.lazy_load_pages()), self.ingest_queue_size, 'parse')
+        elements = (element for page in waited.wrap(pages) for element in page)
         try:
-            extension = ".pdf"
-            name = name.removesuffix(extension)
-            pdf_path = os.path.join(path, f"{name + extension}")
+            for chunk in split.wrap(iter_chunks(elements, split_strategy, chunk_size)):
+                chunk.metadata.update(metadata or {})
+                yield chunk
+        finally:
+            pages.close()
+        metrics.observe("parse", parse.seconds, pages=parse.items)
+        metrics.observe("split", split.seconds - waited.seconds, chunks=split.items)
+        print(f"Documents loaded: {parse.items} pages")
+        print(f"Chunks created: {split.items}")
+
+    def _ingest(self, chunks: Iterator[Document], persist_dir: str, document_id: int = None,
+                existing: set = frozenset()) -> Tuple[set, int]:
+        """
+        Embed streamed chunks and write them to the store of `persist_dir` in batches of
+        `ingest_batch_size`. Splitting, embedding and writing run concurrently with at most
+        `ingest_queue_size` batches between them, and the document's lexical index is built
+        on disk as the batches pass, replacing the previous one once all chunks are written.
+        Chunks whose id is in `existing` are kept but not embedded again.
+        Returns the ids of `existing` that are still chunks of the PDF and how many were added.
+        """
+        lexical_index = BM25Writer(lexical_index_path(persist_dir, document_id))
+        kept = set()
+        embeddings = self._get_embeddings()
 
-            if not os.path.exists(pdf_path):
-                raise FileNotFoundError(f"PDF not found at path: {pdf_path}")
+        def embedded_batches():
+            for batch in prefetch(batched(chunks, self.ingest_batch_size), self.ingest_queue_size, 'split'):
+                new = []
+                for chunk in batch:
+                    chunk_id = self._chunk_id(chunk, lexical_index.contains, document_id)
+                    lexical_index.add(chunk_id, chunk)
+                    if chunk_id in existing:
+                        kept.add(chunk_id)
+                    else:
+                        new.append((chunk_id, chunk))
+                lexical_index.commit()
+                if not new:
+                    continue
+                texts = [chunk.page_content for _, chunk in new]
+                with metrics.span("embed", chunks=len(texts)):
+                    vectors = embeddings.embed_documents(texts)
+                yield new, dict(zip(texts, vectors))
 
-            base_dir = os.path.abspath(os.path.dirname(__file__)) 
-            db_root = os.path.join(base_dir, "..", "db")            
-            os.makedirs(db_root, exist_ok=True)
+        created = self._stored_backend(persist_dir) is None
+        os.makedirs(persist_dir, exist_ok=True)
+        if created:
+            print(f"Creating new database at: {persist_dir}")
+        precomputed = PrecomputedEmbeddings({}, embeddings)
+        vector_db = self._open_db(persist_dir, precomputed)
+        added = 0
+        try:
+            for new, vectors in prefetch(embedded_batches(), self.ingest_queue_size, 'embed'):
+                precomputed.vectors = vectors
+                with metrics.span("persist", chunks=len(new)):
+                    vector_db.add_documents([chunk for _, chunk in new], ids=[chunk_id for chunk_id, _ in new])
+                added += len(new)
+        except BaseException:
+            lexical_index.abort()
+            raise
+        lexical_index.finish()
+        if created:
+            print("Database created successfully")
+        return kept, added
+
+    def load_pdf(self, path: str, name: str, lang: str = "en", chunk_size: int = 1000,
+                 persist_dir: str = None, metadata: dict = None, split_strategy: str = 'recursive') -> str:
+        """
+        Load a PDF file, split it, store it in Chroma DB and return the persist directory.
 
-            persist_path = os.path.join(db_root, name)
-            self.persist_dir = persist_path
+        `metadata` (e.g. `document_id`/`user_id`) is attached to every chunk so that
+        documents sharing a collection can be filtered and deleted.
+        """
+        try:
+            os.makedirs(DB_ROOT, exist_ok=True)
+            persist_path = persist_dir or self.store_path(name)
 
-            print(f"Looking for PDF at: {os.path.abspath(pdf_path)}")
-            loader = UnstructuredPDFLoader(file_path=pdf_path, language=lang)
-            documents = loader.load()
-            print(f"Documents loaded: {len(documents)}")
-            self._split_doc(documents, chunk_size=chunk_size)
+            document_id = (metadata or {}).get("document_id")
+            chunks = self._iter_chunks(path, name, lang, chunk_size, metadata, split_strategy)
+            with self.writing(persist_path):
+                self._ingest(chunks, persist_path, document_id)
+            return persist_path
         except Exception as e:
             print(f"Error loading PDF: {e}")
             raise RuntimeError(f"Failed to load PDF: {e}")
 
-    def create_chain(self, persist_dir: str = None, prompt_template: str = None):
-        """Build retriever + RAG chain for answering questions."""
+    def reingest_pdf(self, path: str, name: str, persist_dir: str, document_id: int,
+                     lang: str = "en", chunk_size: int = 1000, metadata: dict = None,
+                     split_strategy: str = 'recursive') -> dict:
+        """
+        Re-parse a PDF into an existing store, embedding only chunks whose content-addressed
+        id is new and deleting chunks that disappeared. Returns added/deleted/unchanged counts.
+        """
+        try:
+            metadata = {**(metadata or {}), "document_id": document_id}
+            chunks = self._iter_chunks(path, name, lang, chunk_size, metadata, split_strategy)
+            with self.writing(persist_dir):
+                existing = set()
+                if self._stored_backend(persist_dir) is not None:
+                    where = {"document_id": document_id} if self.is_library(persist_dir) else None
+                    existing = set(self._open_db(persist_dir).get(where=where, include=[])["ids"])
 
-        if persist_dir:
-            if not os.path.exists(persist_dir):
-                raise ValueError(f"Persistence directory not found: {persist_dir}")
+                kept, added = self._ingest(chunks, persist_dir, document_id, existing)
 
-            embeddings = self._get_embeddings()
-            self.vector_db = Chroma(
-                persist_directory=persist_dir,
-                embedding_function=embeddings,
-                collection_name=self.vector_store_name,
-            )
+                to_delete = [chunk_id for chunk_id in existing if chunk_id not in kept]
+                if to_delete:
+                    self._open_db(persist_dir).delete(ids=to_delete)
 
-        if not self.llm:
-            self._initialize_models()
+            print(f"Re-ingested {name}: {added} added, {len(to_delete)} deleted")
+            return {"added": added, "deleted": len(to_delete), "unchanged": len(kept)}
+        except Exception as e:
+            print(f"Error re-ingesting PDF: {e}")
+            raise RuntimeError(f"Failed to re-ingest PDF: {e}")
+
+    def create_chain(self, persist_dir: str, prompt_template: str = None,
+                     document_id: int = None) -> DocumentHandle:
+        """Open a document's vector store and return a handle that builds its RAG chains."""
+
+        if not os.path.exists(persist_dir):
+            raise ValueError(f"Persistence directory not found: {persist_dir}")
+
+        vector_db = self._open_db(persist_dir)
+        search_kwargs = {}
+        if self.is_library(persist_dir):
+            if document_id is None:
+                raise ValueError("document_id is required to query a shared collection")
+            search_kwargs["filter"] = {"document_id": document_id}
+
+        self._ensure_models()
+        print('Your PDF is ready to chat with')
+        return DocumentHandle(self, persist_dir, vector_db, prompt_template, search_kwargs, document_id)
+
+    def create_library_handle(self, handles: List[DocumentHandle], names: Dict[int, str] = None,
+                              k: int = 6) -> LibraryHandle:
+        """Handle that answers from several documents at once, from their open document handles."""
+        if not handles:
+            raise ValueError("At least one document is required")
+        for handle in handles:
+            if handle.document_id is None:
+                raise ValueError("Library queries need the document_id of every handle")
+        self._ensure_models()
+        return LibraryHandle(self, handles, names, k)
+
+    def _create_library_chain(self):
+        """Prompt and LLM for answers over numbered passages from several documents."""
+        template = (
+            "Answer the question based ONLY on the following numbered passages. "
+            "Cite the passages you use by their number, like [1], and say so if they do "
+            "not contain the answer.\n\n"
+            "{context}\n\n"
+            "Question: {question}"
+        )
+        return ChatPromptTemplate.from_template(template=template) | self.llm | StrOutputParser()
+
+    def _create_retriever(self, vector_db, retrieval_mode: str, prompt_template: str = None,
+                          search_kwargs: dict = None, lexical_index=None):
+        """
+        Build the retriever for a retrieval mode: plain similarity, MMR, multi-query, or
+        hybrid (BM25 + vector results fused with reciprocal rank fusion).
+        """
+
+        search_kwargs = search_kwargs or {}
+        if retrieval_mode == 'mmr':
+            return vector_db.as_retriever(search_type='mmr', search_kwargs=search_kwargs)
+
+        retriever = vector_db.as_retriever(search_kwargs=search_kwargs)
+        if retrieval_mode == 'hybrid':
+            if lexical_index is None:
+                print("No lexical index for this document, falling back to similarity search")
+                return retriever
+            k = search_kwargs.get("k", 4)
+            return RRFRetriever(
+                retrievers=[retriever, BM25Retriever(index=lexical_index, k=k)],
+                k=k,
+            )
+        if retrieval_mode == 'similarity':
+            return retriever
 
         if not prompt_template:
             prompt_template = (
@@ -122,12 +611,16 @@ class BaseRAG(ABC):
 
         query_prompt = PromptTemplate(input_variables=["question"], template=prompt_template)
 
-        retriever = MultiQueryRetriever.from_llm(
-            retriever=self.vector_db.as_retriever(),
-            llm=self.llm,
-            prompt=query_prompt,
+        return ConcurrentMultiQueryRetriever(
+            retriever=retriever,
+            llm_chain=query_prompt | self.llm | StrOutputParser(),
+            variant_cache=self.query_variant_cache,
+            prompt_key=hashlib.sha256(prompt_template.encode('utf-8')).hexdigest()[:16],
         )
 
+    def _create_rag_chain(self, retriever):
+        """Pipe retrieved context and the question through the prompt and the LLM."""
+
         rag_template = (
             "Answer the question based ONLY on the following context:\n"
             "{context}\n\n"
@@ -136,22 +629,16 @@ class BaseRAG(ABC):
 
         prompt = ChatPromptTemplate.from_template(template=rag_template)
 
-        self.chain = (
-            {"context": retriever, "question": RunnablePassthrough()}
+        def retrieve(question):
+            with metrics.span("retrieve") as counts:
+                documents = retriever.invoke(question)
+                counts["chunks"] = len(documents)
+            documents = self.context_compressor.compress(question, expand_windows(documents))
+            return "\n\n".join(doc.page_content for doc in documents)
+
+        return (
+            {"context": RunnableLambda(retrieve), "question": RunnablePassthrough()}
             | prompt
             | self.llm
             | StrOutputParser()
         )
-
-        print('Your PDF is ready to chat with')
-
-    def query(self, question: str) -> Generator[str, None, None]:
-        """Ask a question to the RAG pipeline."""
-
-        if not self.chain:
-            raise RuntimeError("Chain not initialized. Call `create_chain()` first.")
-        if not question or not question.strip():
-            raise ValueError("Question cannot be empty")
-        
-        for chunk in self.chain.stream(question): 
-            yield chunk
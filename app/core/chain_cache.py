@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Callable, Hashable
+import time
+
+
+class ChainCache:
+    """
+    Bounded LRU cache of ready-to-query chains with idle-TTL eviction.
+    """
+
+    def __init__(self, max_size: int = 32, ttl: float = 900):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def _expired(self, last_used: float, now: float) -> bool:
+        return self.ttl > 0 and now - last_used > self.ttl
+
+    def _evict_expired(self, now: float):
+        """Drop entries that have been idle for longer than the TTL."""
+        for key in [k for k, (_, used) in self._entries.items() if self._expired(used, now)]:
+            del self._entries[key]
+            self.evictions += 1
+
+    def get(self, key: Hashable):
+        """Return the cached value for `key` or None, refreshing its LRU position."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries[key] = (entry[0], now)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Insert `value`, evicting idle and least recently used entries as needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]):
+        """Return the cached value for `key`, building it with `factory` on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, document_id: int):
+        """Drop every entry belonging to `document_id` (keys are `(document_id, ...)` tuples)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == document_id]:
+                del self._entries[key]
+
+    def invalidate_store(self, persist_dir: str):
+        """Drop every entry reading `persist_dir` (keys are `(document_id, persist_dir)` tuples)."""
+        with self._lock:
+            for key in [k for k in self._entries if len(k) > 1 and k[1] == persist_dir]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
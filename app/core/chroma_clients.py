@@ -0,0 +1,81 @@
+from threading import Lock
+from typing import Callable
+import os
+import weakref
+
+import chromadb
+
+
+class ChromaClients:
+    """
+    One chromadb client per store and process. chromadb shares one system, holding the
+    index in memory, between all clients of a path, so it keeps reading a store that
+    another process changed stale until that system is stopped, which `close()` does once
+    the last client of the path is closed.
+
+    Releasing a store retires its client: it is closed as soon as nothing built on it is
+    alive anymore, or at the latest when the store is opened again, so the next `open`
+    loads the store afresh. Queries still running on a retired client when that happens
+    fail; the API only releases a store after writing to it or after another process did.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._current = {}
+        self._retired = {}
+        self._users = {}
+
+    @staticmethod
+    def _key(persist_dir: str) -> str:
+        return os.path.normpath(os.path.abspath(persist_dir))
+
+    def open(self, persist_dir: str, build: Callable):
+        """
+        `build(client)` on the current client of a store; the client stays open while
+        the returned object is alive, unless the store is released and opened again.
+        """
+        key = self._key(persist_dir)
+        with self._lock:
+            client = self._current.get(key)
+            if client is None:
+                retired = self._retired.pop(key, None)
+                if retired is not None:
+                    self._close(retired)
+                client = self._current[key] = chromadb.PersistentClient(path=key)
+                self._users[client] = 0
+            self._users[client] += 1
+        try:
+            user = build(client)
+        except Exception:
+            self._drop(client)
+            raise
+        weakref.finalize(user, self._drop, client)
+        return user
+
+    def _close(self, client):
+        del self._users[client]
+        client.close()
+
+    def _drop(self, client):
+        with self._lock:
+            if client not in self._users:
+                return
+            self._users[client] -= 1
+            if self._users[client]:
+                return
+            for key, retired in list(self._retired.items()):
+                if retired is client:
+                    del self._retired[key]
+                    self._close(client)
+
+    def release(self, persist_dir: str):
+        """Retire the client of a store, so that the next `open` reads it afresh."""
+        key = self._key(persist_dir)
+        with self._lock:
+            client = self._current.pop(key, None)
+            if client is None:
+                return
+            if self._users[client]:
+                self._retired[key] = client
+            else:
+                self._close(client)
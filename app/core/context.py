@@ -0,0 +1,151 @@
+from typing import List, Tuple
+import math
+import re
+
+from langchain_core.documents import Document
+
+from . import metrics
+from .lexical import BM25Index
+
+RERANK_MODES = ('lexical', 'embedding', 'none')
+
+# Ollama models use different tokenizers; ~4 characters per token is close enough for English
+CHARS_PER_TOKEN = 4
+
+SENTENCE_END_RE = re.compile(r"[.!?]\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = text.lower().split()
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _overlap(left: str, right: str, min_chars: int) -> int:
+    """Length of the longest suffix of `left` that `right` starts with, if at least `min_chars`."""
+    if len(left) < min_chars or len(right) < min_chars:
+        return 0
+    head = right[:min_chars]
+    position = left.find(head)
+    while position != -1:
+        length = len(left) - position
+        if right.startswith(left[position:]):
+            return length
+        position = left.find(head, position + 1)
+    return 0
+
+
+def _same_passage(a: Document, b: Document) -> bool:
+    return (a.metadata.get("source") == b.metadata.get("source")
+            and a.metadata.get("page_number") == b.metadata.get("page_number"))
+
+
+class ContextCompressor:
+    """
+    Shrinks retrieved chunks before they are put in the prompt: drops duplicates and
+    chunks contained in others, trims the text that neighbouring chunks share (the
+    splitter overlaps them), reranks the rest and keeps the best within a token budget.
+    """
+
+    def __init__(self, token_budget: int = 1500, rerank: str = 'lexical', embeddings=None,
+                 min_overlap_chars: int = 40, near_duplicate: float = 0.9, min_tail_tokens: int = 64,
+                 rrf_k: int = 60):
+        if rerank not in RERANK_MODES:
+            raise ValueError(f"Unknown rerank mode: {rerank}")
+        self.token_budget = token_budget
+        self.rerank = rerank
+        self.embeddings = embeddings
+        self.min_overlap_chars = min_overlap_chars
+        self.near_duplicate = near_duplicate
+        self.min_tail_tokens = min_tail_tokens
+        self.rrf_k = rrf_k
+
+    def _rank(self, question: str, documents: List[Document]) -> List[int]:
+        """Positions of `documents`, best first: retrieval order fused (RRF) with a rerank score."""
+        if self.rerank == 'none' or len(documents) < 2:
+            return list(range(len(documents)))
+
+        if self.rerank == 'embedding':
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+            query = self.embeddings.embed_query(question)
+            query_norm = math.sqrt(sum(x * x for x in query)) or 1.0
+            scores = [
+                sum(q * v for q, v in zip(query, vector))
+                / (query_norm * (math.sqrt(sum(x * x for x in vector)) or 1.0))
+                for vector in vectors
+            ]
+        else:
+            index = BM25Index.build(list(range(len(documents))), documents)
+            by_text = {doc.page_content: score for doc, score in index.search(question, k=len(documents))}
+            scores = [by_text.get(doc.page_content, 0.0) for doc in documents]
+
+        reranked = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        fused = {i: 1.0 / (self.rrf_k + i + 1) for i in range(len(documents))}
+        for position, i in enumerate(reranked):
+            fused[i] += 1.0 / (self.rrf_k + position + 1)
+        return sorted(fused, key=fused.get, reverse=True)
+
+    def _deduplicate(self, documents: List[Document]) -> List[Tuple[int, str]]:
+        """(position, text) of the chunks worth keeping, with text shared with earlier chunks removed."""
+        kept = []
+        for position, doc in enumerate(documents):
+            text = doc.page_content.strip()
+            shingles = _shingles(text)
+            for kept_position, kept_text, kept_shingles in kept:
+                if text in kept_text:
+                    text = ''
+                    break
+                if len(shingles & kept_shingles) / len(shingles | kept_shingles) >= self.near_duplicate:
+                    text = ''
+                    break
+                if _same_passage(doc, documents[kept_position]):
+                    head = _overlap(kept_text, text, self.min_overlap_chars)
+                    tail = _overlap(text, kept_text, self.min_overlap_chars)
+                    text = text[head:len(text) - tail].strip()
+            if text:
+                kept.append((position, text, _shingles(text)))
+        return [(position, text) for position, text, _ in kept]
+
+    def _truncate(self, text: str, tokens: int) -> str:
+        """Cut `text` to about `tokens`, at a sentence end when there is one."""
+        text = text[:tokens * CHARS_PER_TOKEN]
+        ends = [match.end() for match in SENTENCE_END_RE.finditer(text)]
+        return text[:ends[-1]].strip() if ends and ends[-1] > len(text) // 2 else text.strip()
+
+    def select(self, question: str, documents: List[Document]) -> List[Tuple[int, str]]:
+        """
+        The chunks to put in the prompt as (position in `documents`, text), best first.
+        Records the tokens before and after, and the tokens saved, as the "compress" stage.
+        """
+        with metrics.span("compress") as counts:
+            tokens_in = sum(estimate_tokens(doc.page_content) for doc in documents)
+            order = self._rank(question, documents)
+            candidates = self._deduplicate([documents[i] for i in order])
+
+            selected = []
+            remaining = self.token_budget
+            for position, text in candidates:
+                tokens = estimate_tokens(text)
+                if self.token_budget <= 0 or tokens <= remaining:
+                    selected.append((order[position], text))
+                    remaining -= tokens
+                    continue
+                # Part of the next chunk still fits, or nothing was selected yet
+                if remaining >= self.min_tail_tokens or not selected:
+                    selected.append((order[position], self._truncate(text, max(remaining, self.min_tail_tokens))))
+                break
+
+            tokens_out = sum(estimate_tokens(text) for _, text in selected)
+            counts["chunks"] = len(selected)
+            counts["tokens"] = tokens_out
+            counts["tokens_saved"] = tokens_in - tokens_out
+        return selected
+
+    def compress(self, question: str, documents: List[Document]) -> List[Document]:
+        return [
+            Document(page_content=text, metadata=documents[position].metadata)
+            for position, text in self.select(question, documents)
+        ]
@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+from typing import Dict, List
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that batches requests, runs batches concurrently and caches
+    vectors on disk as float32 blobs in sqlite, keyed by (model, sha256 of normalized text).
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache_path: str = None,
+                 batch_size: int = 32, concurrency: int = 4):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache_path = cache_path
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = Lock()
+        self._local = local()
+
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                    "PRIMARY KEY (model, hash))"
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One sqlite connection per thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.cache_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        if not self.cache_path or not keys:
+            return {}
+        found = {}
+        conn = self._connection()
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                [self.model, *batch]
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        if not self.cache_path or not vectors:
+            return
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(self.model, key, np.asarray(vector, dtype=np.float32).tobytes())
+                 for key, vector in vectors.items()]
+            )
+
+    def _embed_missing(self, texts: Dict[str, str]) -> Dict[str, List[float]]:
+        """Embed `{key: text}` in batches, running up to `concurrency` batches at once."""
+        keys = list(texts)
+        batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+
+        def embed_batch(batch):
+            return self.embeddings.embed_documents([texts[key] for key in batch])
+
+        if len(batches) > 1 and self.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+                results = list(executor.map(embed_batch, batches))
+        else:
+            results = [embed_batch(batch) for batch in batches]
+
+        return {key: vector for batch, vectors in zip(batches, results)
+                for key, vector in zip(batch, vectors)}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        unique = dict(zip(keys, texts))
+
+        vectors = self._lookup(list(unique))
+        missing = {key: text for key, text in unique.items() if key not in vectors}
+
+        with self._stats_lock:
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            embedded = self._embed_missing(missing)
+            self._store(embedded)
+            vectors.update(embedded)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves vectors computed ahead of time, falling back to `embeddings` for anything else."""
+
+    def __init__(self, vectors: Dict[str, List[float]], embeddings: Embeddings):
+        self.vectors = vectors
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = [text for text in texts if text not in self.vectors]
+        if missing:
+            self.vectors.update(zip(missing, self.embeddings.embed_documents(missing)))
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,224 @@
+from collections import Counter
+from threading import local
+from typing import List, Optional, Tuple, Union
+import gzip
+import json
+import math
+import os
+import re
+import sqlite3
+
+from langchain_core.documents import Document
+
+# Keeps part numbers and error codes such as "E-1042" or "XJ9.2b" as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[\-\._/][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+# Indexes written before the sqlite format are gzipped JSON, read whole
+INDEX_EXTENSIONS = ('sqlite', 'json.gz')
+
+
+def lexical_index_path(persist_dir: str, document_id: int = None, extension: str = 'sqlite') -> str:
+    """Location of a document's BM25 index, next to its vector store."""
+    key = document_id if document_id is not None else 'index'
+    return os.path.join(persist_dir, 'bm25', f'{key}.{extension}')
+
+
+def open_lexical_index(persist_dir: str, document_id: int = None) -> Optional[Union['DiskBM25Index', 'BM25Index']]:
+    """The BM25 index of a document, or None if it was ingested without one."""
+    path = lexical_index_path(persist_dir, document_id)
+    if os.path.exists(path):
+        return DiskBM25Index(path)
+    path = lexical_index_path(persist_dir, document_id, 'json.gz')
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    return None
+
+
+def remove_lexical_index(persist_dir: str, document_id: int = None):
+    for extension in INDEX_EXTENSIONS:
+        path = lexical_index_path(persist_dir, document_id, extension)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _bm25(tf: int, df: int, n: int, length: int, avg_length: float, k1: float, b: float) -> float:
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / (avg_length or 1)))
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a few documents, in memory (e.g. to rerank retrieved chunks).
+
+    Postings are flat `[chunk, term frequency, ...]` lists per term. Document indexes
+    from before the sqlite format are stored like this, gzipped, and loaded whole.
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict],
+                 lengths: List[int], postings: dict, k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.lengths = lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[Document]) -> 'BM25Index':
+        index = cls(ids=[], texts=[], metadatas=[], lengths=[], postings={})
+        for chunk_id, doc in zip(ids, documents):
+            index.add(chunk_id, doc)
+        return index
+
+    def add(self, chunk_id: str, doc: Document):
+        """Index one more chunk, so the index can be built while chunks stream past."""
+        tokens = tokenize(doc.page_content)
+        position = len(self.ids)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).extend((position, tf))
+        self.ids.append(chunk_id)
+        self.texts.append(doc.page_content)
+        self.metadatas.append(doc.metadata)
+        self.lengths.append(len(tokens))
+        self.avg_length += (len(tokens) - self.avg_length) / len(self.lengths)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(**data)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        n = len(self.ids)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings) // 2
+            for i in range(0, len(postings), 2):
+                position, tf = postings[i], postings[i + 1]
+                score = _bm25(tf, df, n, self.lengths[position], self.avg_length, self.k1, self.b)
+                scores[position] = scores.get(position, 0.0) + score
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            (Document(page_content=self.texts[position], metadata=self.metadatas[position]), score)
+            for position, score in best
+        ]
+
+
+class BM25Writer:
+    """
+    Builds a document's BM25 index on disk while its chunks stream past: chunks and
+    postings go to a sqlite file as they are added and are committed per batch, so
+    building the index holds no more than a batch in memory. `finish()` replaces the
+    previous index at `path` at once; until then queries keep reading the old one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        # Filled by the ingestion pipeline's embedding thread, finished by the caller
+        self.conn = sqlite3.connect(self.tmp_path, check_same_thread=False)
+        # A partly written file is never renamed into place, so it needs no journal
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "length INTEGER NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE postings (term TEXT NOT NULL, position INTEGER NOT NULL, tf INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self.count = 0
+        self.total_length = 0
+
+    def contains(self, chunk_id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM chunks WHERE id = ?", (chunk_id,)).fetchone() is not None
+
+    def add(self, chunk_id: str, doc: Document):
+        tokens = tokenize(doc.page_content)
+        position = self.count
+        self.conn.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                          (position, chunk_id, len(tokens), doc.page_content, json.dumps(doc.metadata)))
+        self.conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                              [(term, position, tf) for term, tf in Counter(tokens).items()])
+        self.count += 1
+        self.total_length += len(tokens)
+
+    def commit(self):
+        self.conn.commit()
+
+    def finish(self):
+        self.conn.execute("CREATE INDEX postings_term ON postings (term)")
+        self.conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('count', self.count),
+            ('avg_length', self.total_length / self.count if self.count else 0.0),
+        ])
+        self.conn.commit()
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+        # Superseded: the older format is only read when there is no sqlite index
+        legacy = self.path.removesuffix('.sqlite') + '.json.gz'
+        if os.path.exists(legacy):
+            os.remove(legacy)
+
+    def abort(self):
+        self.conn.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class DiskBM25Index:
+    """Okapi BM25 over a document index written by `BM25Writer`, read from sqlite per query."""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._local = local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One read-only sqlite connection per thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            self._local.conn = conn
+        return conn
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        conn = self._connection()
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        n, avg_length = int(meta['count']), meta['avg_length']
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = conn.execute(
+                "SELECT p.position, p.tf, c.length FROM postings p JOIN chunks c ON c.position = p.position "
+                "WHERE p.term = ?", (term,)
+            ).fetchall()
+            for position, tf, length in postings:
+                score = _bm25(tf, len(postings), n, length, avg_length, self.k1, self.b)
+                scores[position] = scores.get(position, 0.0) + score
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not best:
+            return []
+        rows = {
+            position: (text, metadata) for position, text, metadata in conn.execute(
+                f"SELECT position, text, metadata FROM chunks WHERE position IN ({','.join('?' * len(best))})",
+                [position for position, _ in best])
+        }
+        return [
+            (Document(page_content=rows[position][0], metadata=json.loads(rows[position][1])), score)
+            for position, score in best
+        ]
@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
+import time
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, value_sum) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+                le = 'le="+Inf"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {total}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {value_sum}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {total}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose labelled values are read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, callback: Callable[[], Dict[tuple, float]],
+                 labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Metric {self.name} failed: {e}")
+            return lines
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = TIME_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable[[], Dict[tuple, float]],
+              labelnames: Tuple[str, ...] = ()) -> Gauge:
+        self._metrics[name] = Gauge(name, help, callback, labelnames)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'rag_stage_seconds', 'Duration of RAG pipeline stages.', ('stage',)
+)
+STAGE_ITEMS = REGISTRY.histogram(
+    'rag_stage_items', 'Pages, chunks or tokens handled per RAG pipeline stage.',
+    ('stage', 'unit'), COUNT_BUCKETS
+)
+
+_trace: ContextVar = ContextVar('rag_trace', default=None)
+
+
+def observe(stage: str, seconds: float, **counts):
+    """Record a finished stage in the histograms and in the current trace, if any."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    for unit, count in counts.items():
+        STAGE_ITEMS.observe(count, stage=stage, unit=unit)
+
+    trace = _trace.get()
+    if trace is not None:
+        trace.append({'stage': stage, 'seconds': round(seconds, 6), **counts})
+
+
+@contextmanager
+def span(stage: str, **counts):
+    """
+    Time a pipeline stage. Counts (pages, chunks, tokens) can be passed up front
+    or set on the yielded dict before the block ends.
+    """
+    start = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        observe(stage, time.perf_counter() - start, **counts)
+
+
+def start_trace():
+    """Collect the spans of the current request/job; returns a token for `end_trace`."""
+    return _trace.set([])
+
+
+def end_trace(token) -> List[dict]:
+    """The spans of the trace, as the list that spans still running keep appending to."""
+    trace = _trace.get()
+    _trace.reset(token)
+    return trace if trace is not None else []
+
+
+def replay(trace: List[dict]):
+    """Record spans collected in another process (e.g. an ingestion worker)."""
+    for record in trace or []:
+        record = dict(record)
+        stage = record.pop('stage')
+        seconds = record.pop('seconds')
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        for unit, count in record.items():
+            STAGE_ITEMS.observe(count, stage=stage, unit=unit)
@@ -0,0 +1,510 @@
+from contextlib import contextmanager
+from threading import Lock, RLock, local
+from typing import Any, Iterable, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+STORE_DIR = "mmap"
+QUANTIZATIONS = ("int8", "none")
+SCAN_BLOCK_ROWS = 8192
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization; returns the codes and one float32 scale per row."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales = np.where(scales == 0, 1, scales).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Vector store that keeps embeddings in memory-mapped files instead of process memory.
+
+    Vectors are L2-normalized and appended to `vectors-<generation>.f32`; with int8
+    quantization a compact `.i8` copy plus per-row scales is scanned first and the best
+    candidates are rescored against the full-precision vectors. Chunk text and metadata
+    live in sqlite. Deleted rows are dropped from sqlite and the files are compacted into
+    a new generation once most rows are dead, so readers in other processes never see
+    rows renumbered under an open mapping.
+
+    Collections with at least `ann_min_vectors` candidates are searched with an hnswlib
+    index when hnswlib is installed.
+
+    Supports the parts of the Chroma interface the pipeline uses: `add_documents`,
+    `get`/`delete` with `ids` or a `where` metadata filter, and a `filter` search kwarg.
+    """
+
+    def __init__(self, persist_dir: str, embedding_function: Embeddings,
+                 quantization: str = "int8", ann_min_vectors: int = 100000,
+                 rescore_factor: int = 8):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = os.path.join(persist_dir, STORE_DIR)
+        self._embedding = embedding_function
+        self.quantization = quantization
+        self.ann_min_vectors = ann_min_vectors
+        self.rescore_factor = max(1, rescore_factor)
+        self._local = local()
+        self._lock = RLock()
+        self._state_lock = Lock()
+        self._state = None
+        self._maps = {}
+        self._ann = None
+        os.makedirs(self.path, exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document_id INTEGER, "
+                "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS rows_document_id ON rows (document_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # The first writer fixes the quantization of the store
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('quantization', ?)", (quantization,))
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', '0')")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', '0')")
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, STORE_DIR, "store.sqlite"))
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _connection(self) -> sqlite3.Connection:
+        """One sqlite connection per thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, "store.sqlite"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _file(self, generation: int, kind: str) -> str:
+        return os.path.join(self.path, f"vectors-{generation}.{kind}")
+
+    @staticmethod
+    def _meta(conn: sqlite3.Connection) -> dict:
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across threads and, through a lock file, across processes."""
+        with self._lock:
+            with open(os.path.join(self.path, "write.lock"), "w") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield self._connection()
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --------- Reading --------- #
+
+    @contextmanager
+    def _snapshot(self):
+        """
+        Read transaction, so rows, metadata and generation come from one consistent
+        version of the store even while another process appends or compacts.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def _load_state(self, conn: sqlite3.Connection) -> dict:
+        """Live rows and their document ids, reloaded only when a writer bumped the version."""
+        meta = self._meta(conn)
+        key = (meta["generation"], meta["version"])
+        with self._state_lock:
+            if self._state is not None and self._state["key"] == key:
+                return self._state
+
+        data = np.array(conn.execute("SELECT row, COALESCE(document_id, -1) FROM rows ORDER BY row").fetchall(),
+                        dtype=np.int64).reshape(-1, 2)
+        state = {
+            "key": key,
+            "generation": int(meta["generation"]),
+            "dim": int(meta["dim"]) if "dim" in meta else None,
+            "quantization": meta["quantization"],
+            "rows": data[:, 0],
+            "document_ids": data[:, 1],
+        }
+        with self._state_lock:
+            self._state = state
+        return state
+
+    def _matrix(self, generation: int, kind: str, dim: int, min_rows: int) -> np.ndarray:
+        """Memory-map a vector file, remapping it when rows were appended since the last call."""
+        dtype, width = {"f32": (np.float32, dim), "i8": (np.int8, dim), "scale": (np.float32, 1)}[kind]
+        matrix = self._maps.get((generation, kind))
+        if matrix is None or matrix.shape[0] < min_rows:
+            path = self._file(generation, kind)
+            rows = os.path.getsize(path) // (np.dtype(dtype).itemsize * width)
+            if rows < min_rows:
+                raise RuntimeError(f"Vector file {path} is shorter than its index")
+            matrix = np.memmap(path, dtype=dtype, mode="r", shape=(rows, width)) if rows else \
+                np.empty((0, width), dtype=dtype)
+            self._maps = {k: v for k, v in self._maps.items() if k[0] == generation}
+            self._maps[(generation, kind)] = matrix
+        return matrix
+
+    def _candidates(self, state: dict, filter: Optional[dict]) -> np.ndarray:
+        if not filter:
+            return state["rows"]
+        if set(filter) == {"document_id"}:
+            value = filter["document_id"]
+            if isinstance(value, dict) and set(value) == {"$in"}:
+                return state["rows"][np.isin(state["document_ids"], [int(v) for v in value["$in"]])]
+            if not isinstance(value, dict):
+                return state["rows"][state["document_ids"] == int(value)]
+        where, params = self._where_sql(filter)
+        rows = self._connection().execute(f"SELECT row FROM rows WHERE {where} ORDER BY row", params)
+        return np.array([row for (row,) in rows], dtype=np.int64)
+
+    def _scan(self, state: dict, candidates: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over the candidate rows, on int8 codes with a float32 rescoring pass."""
+        generation, dim = state["generation"], state["dim"]
+        min_rows = int(candidates[-1]) + 1
+        quantized = state["quantization"] == "int8"
+        vectors = self._matrix(generation, "f32", dim, min_rows)
+        if quantized:
+            codes = self._matrix(generation, "i8", dim, min_rows)
+            scales = self._matrix(generation, "scale", dim, min_rows)[:, 0]
+
+        shortlist = min(len(candidates), k * self.rescore_factor if quantized else k)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(candidates), SCAN_BLOCK_ROWS):
+            rows = candidates[start:start + SCAN_BLOCK_ROWS]
+            if quantized:
+                scores = (codes[rows].astype(np.float32) @ query) * scales[rows]
+            else:
+                scores = vectors[rows] @ query
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > shortlist:
+                keep = np.argpartition(-scores, shortlist - 1)[:shortlist]
+                rows, scores = rows[keep], scores[keep]
+            best_rows, best_scores = rows, scores
+
+        if quantized:
+            best_scores = vectors[best_rows] @ query
+        order = np.argsort(-best_scores)[:k]
+        return best_rows[order], best_scores[order]
+
+    def _ann_index(self, state: dict):
+        """hnswlib index over the live rows, updated incrementally as rows come and go."""
+        live = set(state["rows"].tolist())
+        ann = self._ann
+        if ann is None or ann["generation"] != state["generation"]:
+            index = hnswlib.Index(space="ip", dim=state["dim"])
+            index.init_index(max_elements=max(len(live), 1024), ef_construction=200, M=16)
+            ann = {"generation": state["generation"], "index": index, "rows": set()}
+
+        index = ann["index"]
+        added = np.array(sorted(live - ann["rows"]), dtype=np.int64)
+        removed = ann["rows"] - live
+        for row in removed:
+            index.mark_deleted(row)
+        if len(added):
+            vectors = self._matrix(state["generation"], "f32", state["dim"], int(added[-1]) + 1)
+            if index.get_current_count() + len(added) > index.get_max_elements():
+                index.resize_index(2 * (index.get_current_count() + len(added)))
+            index.add_items(vectors[added], added)
+        ann["rows"] = live
+        self._ann = ann
+        return index
+
+    def _search(self, conn: sqlite3.Connection, query: np.ndarray, k: int,
+                filter: Optional[dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        state = self._load_state(conn)
+        candidates = self._candidates(state, filter)
+        if not len(candidates) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if hnswlib is not None and len(candidates) >= self.ann_min_vectors:
+            with self._lock:
+                index = self._ann_index(state)
+            allowed = None if filter is None else set(candidates.tolist())
+            index.set_ef(max(k * self.rescore_factor, 64))
+            labels, distances = index.knn_query(
+                query, k=min(k, len(candidates)),
+                filter=None if allowed is None else allowed.__contains__
+            )
+            return labels[0].astype(np.int64), 1 - distances[0]
+        return self._scan(state, candidates, query, k)
+
+    def _documents(self, conn: sqlite3.Connection, rows: np.ndarray) -> List[Document]:
+        by_row = {}
+        rows = [int(row) for row in rows]
+        placeholders = ",".join("?" * len(rows))
+        for row, chunk_id, text, metadata in conn.execute(
+                f"SELECT row, id, text, metadata FROM rows WHERE row IN ({placeholders})", rows):
+            by_row[row] = Document(page_content=text, metadata=json.loads(metadata), id=chunk_id)
+        return [by_row[row] for row in rows if row in by_row]
+
+    def _read(self, read):
+        """Run `read(conn)` on a snapshot, retrying once if a compaction removed its files."""
+        for attempt in range(2):
+            try:
+                with self._snapshot() as conn:
+                    return read(conn)
+            except FileNotFoundError:
+                if attempt:
+                    raise
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Documents most similar to `query` with their cosine similarity."""
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: dict = None) -> List[Tuple[Document, float]]:
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+
+        def read(conn):
+            rows, scores = self._search(conn, query, k, filter)
+            return list(zip(self._documents(conn, rows), (float(score) for score in scores)))
+        return self._read(read)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None,
+                          **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: dict = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, filter: dict = None,
+                                      **kwargs: Any) -> List[Document]:
+        query = _normalize(np.asarray(self._embedding.embed_query(query), dtype=np.float32))
+
+        def read(conn):
+            rows, _ = self._search(conn, query, fetch_k, filter)
+            if not len(rows):
+                return []
+            state = self._load_state(conn)
+            vectors = self._matrix(state["generation"], "f32", state["dim"], int(rows.max()) + 1)[rows]
+            selected = maximal_marginal_relevance(query, vectors, lambda_mult=lambda_mult, k=k)
+            return self._documents(conn, rows[selected])
+        return self._read(read)
+
+    # --------- Writing --------- #
+
+    def _append(self, conn: sqlite3.Connection, vectors: np.ndarray, texts: List[str],
+                metadatas: List[dict], ids: List[str]):
+        """Append rows under the write lock: vector files first, then the sqlite rows."""
+        meta = self._meta(conn)
+        generation = int(meta["generation"])
+        if "dim" not in meta:
+            conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(vectors.shape[1]),))
+        elif int(meta["dim"]) != vectors.shape[1]:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({meta['dim']})")
+
+        # Re-adding an id replaces its row, like Chroma's upsert
+        self._delete_ids(conn, ids)
+
+        vectors = _normalize(vectors.astype(np.float32))
+        vector_path = self._file(generation, "f32")
+        start = os.path.getsize(vector_path) // (4 * vectors.shape[1]) if os.path.exists(vector_path) else 0
+        with open(vector_path, "ab") as f:
+            f.write(vectors.tobytes())
+        if meta["quantization"] == "int8":
+            codes, scales = quantize_int8(vectors)
+            with open(self._file(generation, "i8"), "ab") as f:
+                f.write(codes.tobytes())
+            with open(self._file(generation, "scale"), "ab") as f:
+                f.write(scales.tobytes())
+
+        conn.executemany(
+            "INSERT INTO rows (row, id, document_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+            [(start + offset, chunk_id, metadata.get("document_id"), text, json.dumps(metadata))
+             for offset, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))]
+        )
+
+    def add_texts(self, texts: Iterable[str], metadatas: List[dict] = None, ids: List[str] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = [dict(metadata or {}) for metadata in (metadatas or [{}] * len(texts))]
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        self.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        return ids
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[dict] = None):
+        """Store precomputed vectors, with the same arguments as a Chroma collection's upsert."""
+        if not len(ids):
+            return
+        metadatas = [dict(metadata or {}) for metadata in (metadatas or [{}] * len(ids))]
+        with self._write_lock() as conn:
+            with conn:
+                self._append(conn, np.asarray(embeddings, dtype=np.float32), list(documents), metadatas, list(ids))
+                self._bump_version(conn)
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection):
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    @staticmethod
+    def _where_sql(where: dict) -> Tuple[str, list]:
+        """Translate a Chroma-style `$eq`/`$in` filter (optionally under `$and`) to SQL."""
+        clauses, params = [], []
+        for key, value in where.items():
+            if key == "$and":
+                for condition in value:
+                    clause, condition_params = MmapVectorStore._where_sql(condition)
+                    clauses.append(clause)
+                    params += condition_params
+                continue
+            column = "document_id" if key == "document_id" else "json_extract(metadata, ?)"
+            column_params = [] if key == "document_id" else [f"$.{key}"]
+            if isinstance(value, dict) and set(value) == {"$in"}:
+                clauses.append(f"{column} IN ({','.join('?' * len(value['$in']))})")
+                params += column_params + list(value["$in"])
+                continue
+            if isinstance(value, dict):
+                if set(value) != {"$eq"}:
+                    raise ValueError(f"Unsupported filter on {key}: {value}")
+                value = value["$eq"]
+            clauses.append(f"{column} = ?")
+            params += column_params + [value]
+        return " AND ".join(clauses) or "1", params
+
+    @staticmethod
+    def _delete_ids(conn: sqlite3.Connection, ids: List[str]):
+        # Batched to stay under sqlite's limit on bound parameters
+        for start in range(0, len(ids), 900):
+            batch = ids[start:start + 900]
+            conn.execute("DELETE FROM rows WHERE id IN (%s)" % ",".join("?" * len(batch)), batch)
+
+    def delete(self, ids: List[str] = None, where: dict = None, **kwargs: Any) -> bool:
+        if not ids and not where:
+            return False
+        with self._write_lock() as conn:
+            with conn:
+                if ids:
+                    self._delete_ids(conn, list(ids))
+                if where:
+                    where_sql, params = self._where_sql(where)
+                    conn.execute(f"DELETE FROM rows WHERE {where_sql}", params)
+                self._bump_version(conn)
+            self._compact_if_sparse(conn)
+        return True
+
+    def _compact_if_sparse(self, conn: sqlite3.Connection):
+        """Rewrite the vector files without dead rows once they outnumber the live ones."""
+        meta = self._meta(conn)
+        if "dim" not in meta:
+            return
+        generation, dim = int(meta["generation"]), int(meta["dim"])
+        stored = os.path.getsize(self._file(generation, "f32")) // (4 * dim)
+        rows = np.array([row for (row,) in conn.execute("SELECT row FROM rows ORDER BY row")], dtype=np.int64)
+        if stored - len(rows) < max(len(rows), 1024):
+            return
+
+        kinds = ["f32"] + (["i8", "scale"] if meta["quantization"] == "int8" else [])
+        for kind in kinds:
+            source = self._matrix(generation, kind, dim, stored)
+            with open(self._file(generation + 1, kind), "wb") as f:
+                for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(source[rows[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+
+        with conn:
+            # Two passes through negative numbers keep the primary key unique while renumbering
+            conn.executemany("UPDATE rows SET row = ? WHERE row = ?",
+                             [(-new - 1, int(old)) for new, old in enumerate(rows)])
+            conn.execute("UPDATE rows SET row = -row - 1 WHERE row < 0")
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (str(generation + 1),))
+            self._bump_version(conn)
+        for kind in kinds:
+            os.remove(self._file(generation, kind))
+        print(f"Compacted vector store {self.path}: {stored} -> {len(rows)} rows")
+
+    def get(self, ids: List[str] = None, where: dict = None, limit: int = None, offset: int = None,
+            include: List[str] = ("documents", "metadatas"), **kwargs: Any) -> dict:
+        """Rows by id and/or metadata filter, in the shape returned by Chroma's `get`."""
+        clauses, params = [], []
+        if ids is not None:
+            clauses.append("id IN (%s)" % ",".join("?" * len(ids)))
+            params += list(ids)
+        if where:
+            clause, where_params = self._where_sql(where)
+            clauses.append(clause)
+            params += where_params
+        sql = "SELECT row, id, text, metadata FROM rows"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY row"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset or 0]
+
+        def read(conn):
+            records = conn.execute(sql, params).fetchall()
+            result = {"ids": [chunk_id for _, chunk_id, _, _ in records]}
+            if "documents" in include:
+                result["documents"] = [text for _, _, text, _ in records]
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(metadata) for _, _, _, metadata in records]
+            if "embeddings" in include:
+                state = self._load_state(conn)
+                rows = np.array([row for row, _, _, _ in records], dtype=np.int64)
+                result["embeddings"] = (
+                    np.array(self._matrix(state["generation"], "f32", state["dim"], int(rows.max()) + 1)[rows])
+                    if len(rows) else np.empty((0, state["dim"] or 0), dtype=np.float32)
+                )
+            return result
+        return self._read(read)
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        result = self.get(ids=list(ids))
+        return [Document(page_content=text, metadata=metadata, id=chunk_id)
+                for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: List[dict] = None,
+                   ids: List[str] = None, persist_directory: str = None, **kwargs: Any) -> "MmapVectorStore":
+        if not persist_directory:
+            raise ValueError("persist_directory is required")
+        store = cls(persist_directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,167 @@
+from threading import Event, Lock, Thread
+from typing import Dict, Optional, Union
+import re
+import time
+
+import httpx
+import ollama
+
+from . import metrics
+
+PULL_POLICIES = ('missing', 'always', 'never')
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_keep_alive(value) -> Optional[int]:
+    """
+    `keep_alive` in seconds, which every Ollama client accepts: a number, or a duration
+    such as "30m" or "1h30m". A negative value keeps a model loaded until Ollama restarts.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    parts = DURATION_RE.findall(str(value))
+    if not parts or ''.join(number + unit for number, unit in parts) != str(value).strip():
+        raise ValueError(f"Invalid keep_alive duration: {value}")
+    return int(sum(float(number) * DURATION_UNITS[unit] for number, unit in parts))
+
+
+class OllamaClient:
+    """
+    Access to one Ollama server, shared by every pipeline of the process: a pooled HTTP
+    client with timeouts, model checks and pulls done once, warm-up with `keep_alive`,
+    and a watcher that reports models being loaded into and evicted from memory.
+    """
+
+    def __init__(self, host: str = None, timeout: float = 300, max_connections: int = 16,
+                 keep_alive: Union[int, str] = '30m'):
+        self.host = host
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.client = ollama.Client(host=host, **self.client_kwargs())
+        self.loaded = {}
+        self.events = {}
+        self._checked = set()
+        self._lock = Lock()
+        self._check_lock = Lock()
+        self._stop = Event()
+        self._watcher = None
+
+    def client_kwargs(self) -> dict:
+        """httpx options for every client talking to this server, including the langchain models'."""
+        return {
+            'timeout': httpx.Timeout(self.timeout, connect=10.0),
+            'limits': httpx.Limits(max_connections=self.max_connections,
+                                   max_keepalive_connections=self.max_connections),
+        }
+
+    @staticmethod
+    def _present(model: str, available: set) -> bool:
+        return model in available or (':' not in model and f'{model}:latest' in available)
+
+    def ensure_model(self, model: str, pull: str = 'missing'):
+        """
+        Check once per process that the server is up and `model` is present, pulling it when
+        missing (`pull='missing'`), on every start (`'always'`) or never (only a warning).
+        """
+        if pull not in PULL_POLICIES:
+            raise ValueError(f"Unknown pull policy: {pull}")
+        with self._check_lock:
+            if model in self._checked:
+                return
+            try:
+                available = {entry.model for entry in self.client.list().models}
+            except Exception as e:
+                raise RuntimeError(f"Ollama is not running or not accessible. Please start Ollama first. Error: {e}")
+
+            present = self._present(model, available)
+            if pull == 'always' or (pull == 'missing' and not present):
+                print(f"Pulling model: {model}")
+                self.client.pull(model)
+            elif not present:
+                print(f"Model {model} is not available in Ollama; pull it with `ollama pull {model}`")
+            self._checked.add(model)
+
+    def warm_up(self, model: str, embedding: bool = False):
+        """Load `model` into memory ahead of the first request; an empty prompt generates nothing."""
+        start = time.perf_counter()
+        try:
+            if embedding:
+                self.client.embed(model=model, input='warm up', keep_alive=self.keep_alive)
+            else:
+                self.client.generate(model=model, prompt='', keep_alive=self.keep_alive)
+        except Exception as e:
+            print(f"Warm-up of {model} failed: {e}")
+            return
+        seconds = time.perf_counter() - start
+        metrics.observe("warm_up", seconds)
+        print(f"Warmed up {model} in {seconds:.2f}s")
+        self.refresh()
+
+    def _record(self, model: str, event: str):
+        self.events[(model, event)] = self.events.get((model, event), 0) + 1
+        print(f"Ollama model {event}: {model}")
+
+    def refresh(self):
+        """Compare the models Ollama holds in memory with the last look, recording loads and evictions."""
+        try:
+            running = {entry.model: entry.size or 0 for entry in self.client.ps().models}
+        except Exception as e:
+            print(f"Could not list running Ollama models: {e}")
+            return
+        with self._lock:
+            for model in running.keys() - self.loaded.keys():
+                self._record(model, 'load')
+            for model in self.loaded.keys() - running.keys():
+                self._record(model, 'evict')
+            self.loaded = running
+
+    def watch(self, interval: float):
+        """Poll the running models every `interval` seconds on a daemon thread (0 disables)."""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def run():
+            self.refresh()
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._watcher = Thread(target=run, name='ollama-watch', daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+        self.client.close()
+
+
+_clients: Dict[Optional[str], OllamaClient] = {}
+_clients_lock = Lock()
+
+
+def shared_client(host: str = None, **options) -> OllamaClient:
+    """The process's client for `host`; options only apply when it is first created."""
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = _clients[host] = OllamaClient(host, **options)
+        return client
+
+
+def _loaded_models() -> dict:
+    return {(model,): size for client in list(_clients.values()) for model, size in client.loaded.items()}
+
+
+def _model_events() -> dict:
+    return {key: count for client in list(_clients.values()) for key, count in client.events.items()}
+
+
+metrics.REGISTRY.gauge('ollama_loaded_model_bytes', 'Models Ollama holds in memory, by size.',
+                       _loaded_models, ('model',))
+metrics.REGISTRY.gauge('ollama_model_events', 'Models seen loaded into or evicted from Ollama since startup.',
+                       _model_events, ('model', 'event'))
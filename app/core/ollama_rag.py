@@ -2,15 +2,24 @@ import ollama
 from langchain_ollama import OllamaEmbeddings, ChatOllama
 
 from .base_rag import BaseRAG
+from .embeddings import CachedEmbeddings
+from .ollama_client import shared_client
 
 class OllamaRAG(BaseRAG):
     """RAG implementation using Ollama models."""
     
     def __init__(self, model: str, 
                  embedding_model: str = "nomic-embed-text", 
-                 upgradability: bool = False):
+                 upgradability: bool = False,
+                 ollama_host: str = None,
+                 ollama_timeout: float = 300,
+                 ollama_max_connections: int = 16,
+                 ollama_keep_alive: str = '30m',
+                 **loader_options):
         self.upgradability = upgradability
-        super().__init__(model, embedding_model)
+        super().__init__(model, embedding_model, **loader_options)
+        self.ollama = shared_client(ollama_host, timeout=ollama_timeout,
+                                    max_connections=ollama_max_connections, keep_alive=ollama_keep_alive)
         self._embeddings = None
         
     def _initialize_models(self):
@@ -19,21 +28,23 @@ class OllamaRAG(BaseRAG):
             raise ImportError("Ollama package not installed. Install with: pip install ollama")
             
         self._pull_models()
-        self.llm = ChatOllama(model=self.model)
+        self.llm = ChatOllama(
+            model=self.model,
+            base_url=self.ollama.host,
+            keep_alive=self.ollama.keep_alive,
+            client_kwargs=self.ollama.client_kwargs(),
+        )
         
     def _pull_models(self):
-        """Ensure Ollama models are available locally."""
-        try:
-            # Check if Ollama is running
-            ollama.list()
-        except Exception as e:
-            raise RuntimeError(f"Ollama is not running or not accessible. Please start Ollama first. Error: {e}")
-        
-        print(f"Pulling embedding model: {self.embedding_model}")
-        ollama.pull(self.embedding_model)
-        if self.upgradability:
-            print(f"Pulling LLM model: {self.model}")
-            ollama.pull(self.model)
+        """Ensure Ollama models are available locally; checked once per process."""
+        self.ollama.ensure_model(self.embedding_model, pull='missing')
+        self.ollama.ensure_model(self.model, pull='always' if self.upgradability else 'never')
+
+    def warm_up(self):
+        """Load the LLM and embedding model into Ollama's memory before the first request."""
+        self._ensure_models()
+        self.ollama.warm_up(self.embedding_model, embedding=True)
+        self.ollama.warm_up(self.model)
             
     def _get_default_embedding_model(self) -> str:
         return "nomic-embed-text"
@@ -42,5 +53,16 @@ class OllamaRAG(BaseRAG):
         """Get embeddings instance for Ollama."""
         if self._embeddings is None:
             print(f"Initializing embeddings with model: {self.embedding_model}")
-            self._embeddings = OllamaEmbeddings(model=self.embedding_model)
+            self._embeddings = CachedEmbeddings(
+                OllamaEmbeddings(
+                    model=self.embedding_model,
+                    base_url=self.ollama.host,
+                    keep_alive=self.ollama.keep_alive,
+                    client_kwargs=self.ollama.client_kwargs(),
+                ),
+                model=self.embedding_model,
+                cache_path=self.embedding_cache_path,
+                batch_size=self.embedding_batch_size,
+                concurrency=self.embedding_concurrency,
+            )
         return self._embeddings
\ No newline at end of file
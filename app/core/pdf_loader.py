@@ -0,0 +1,281 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+
+from langchain_core.documents import Document
+from langchain_community.document_loaders import UnstructuredPDFLoader
+from pypdf import PdfReader, PdfWriter
+
+from .splitters import iter_pages, merge_pages
+
+
+def _page_text(page) -> str:
+    """The text layer of a pypdf page."""
+    try:
+        return page.extract_text() or ''
+    except Exception:
+        return ''
+
+
+def _parse_shard(pdf_path: str, pages: List[int], lang: str) -> List[Document]:
+    """Run unstructured over a subset of pages (0-based) written to a temporary PDF; returns its elements."""
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page])
+
+    fd, shard_path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as shard:
+            writer.write(shard)
+        loader = UnstructuredPDFLoader(file_path=shard_path, mode='elements', language=lang)
+        documents = loader.load()
+    finally:
+        os.remove(shard_path)
+
+    for doc in documents:
+        local_page = doc.metadata.get('page_number', 1)
+        doc.metadata = {
+            'source': pdf_path,
+            'page_number': pages[local_page - 1] + 1,
+            'parser': 'unstructured',
+            'category': doc.metadata.get('category'),
+        }
+    return documents
+
+
+class CacheWriter:
+    """Writes the pages of one entry as they are parsed; the entry only appears on `commit`."""
+
+    def __init__(self, cache: 'ParseCache', path: str):
+        self.cache = cache
+        self.path = path
+        self.tmp_path = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+
+    def write(self, elements: List[Document]):
+        self.file.write(json.dumps([(doc.page_content, doc.metadata) for doc in elements], separators=(',', ':')))
+        self.file.write('\n')
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        self.cache._prune()
+
+    def close(self):
+        """Drop the entry unless it was committed."""
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.tmp_path)
+
+
+class ParseCache:
+    """
+    Parsed elements of PDFs on disk, keyed by the file's SHA-256 and the parser options,
+    so that splitting a file again (another chunk size or strategy) skips parsing.
+    Entries hold one line per page and are read and written a page at a time.
+    The least recently used entries are removed beyond `max_bytes`.
+    """
+
+    VERSION = 2
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json.gz')
+
+    def key(self, path: str, **options) -> str:
+        signature = json.dumps({'version': self.VERSION, **options}, sort_keys=True)
+        return f"{self.file_hash(path)}-{hashlib.sha256(signature.encode('utf-8')).hexdigest()[:16]}"
+
+    def read(self, key: str, source: str) -> Optional[Iterator[List[Document]]]:
+        """The cached elements of each page, or None when `key` is not cached."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+
+        def pages():
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        # The same content may have been cached under another file name
+                        yield [Document(page_content=text, metadata={**metadata, 'source': source})
+                               for text, metadata in json.loads(line)]
+            except (OSError, ValueError):
+                # Parsed again next time
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+        return pages()
+
+    def writer(self, key: str) -> CacheWriter:
+        return CacheWriter(self, self._path(key))
+
+    def remove(self, file_hash: str):
+        """Remove the entries of a file, under all parser options."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f'{file_hash}-') and name.endswith('.json.gz'):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json.gz'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class ParallelPDFLoader:
+    """
+    Load a PDF page by page, sharding page ranges across a process pool.
+
+    With `fast_path` enabled, pages that already have a text layer (born-digital PDFs)
+    are read with pypdf and only the remaining pages are sent to unstructured.
+    Documents are returned in page order with a 1-based `page_number` in their metadata.
+    `load_elements` keeps unstructured's elements (with their `category`) apart, and reads
+    them from `cache` when the same file was parsed before with the same options.
+    The `lazy_*` methods parse `pages_per_shard` x `workers` pages at a time and hand
+    them over as they are done; pypdf still keeps the objects of the pages it has read.
+    """
+
+    def __init__(self, file_path: str, language: str = 'en', workers: int = None,
+                 pages_per_shard: int = 20, fast_path: bool = False,
+                 min_chars_per_page: int = 200, cache: ParseCache = None):
+        self.file_path = file_path
+        self.language = language
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_shard = max(1, pages_per_shard)
+        self.fast_path = fast_path
+        self.min_chars_per_page = min_chars_per_page
+        self.cache = cache
+
+    def _shards(self, pages: List[int]) -> List[List[int]]:
+        """Group pages into consecutive runs of at most `pages_per_shard`."""
+        shards = []
+        for page in pages:
+            if shards and len(shards[-1]) < self.pages_per_shard and shards[-1][-1] == page - 1:
+                shards[-1].append(page)
+            else:
+                shards.append([page])
+        return shards
+
+    def load(self) -> List[Document]:
+        """One document per page."""
+        return merge_pages(self.lazy_load_elements())
+
+    def lazy_load(self) -> Iterator[Document]:
+        return iter_pages(self.lazy_load_elements())
+
+    def load_elements(self) -> List[Document]:
+        """Parsed elements in page order; pages read from the text layer are a single element."""
+        return list(self.lazy_load_elements())
+
+    def lazy_load_elements(self) -> Iterator[Document]:
+        for elements in self.lazy_load_pages():
+            yield from elements
+
+    def lazy_load_pages(self) -> Iterator[List[Document]]:
+        """The elements of each page with any, in page order, from the cache when possible."""
+        writer = None
+        if self.cache is not None:
+            key = self.cache.key(self.file_path, language=self.language, fast_path=self.fast_path,
+                                 min_chars_per_page=self.min_chars_per_page)
+            pages = self.cache.read(key, self.file_path)
+            if pages is not None:
+                print(f"Parsed elements of {os.path.basename(self.file_path)} read from the parse cache")
+                yield from pages
+                return
+            writer = self.cache.writer(key)
+
+        try:
+            for elements in self._parse():
+                if writer is not None:
+                    writer.write(elements)
+                yield elements
+            if writer is not None:
+                writer.commit()
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _parse(self) -> Iterator[List[Document]]:
+        reader = PdfReader(self.file_path)
+        total = len(reader.pages)
+        window = self.pages_per_shard * self.workers
+        fast_pages = 0
+        executor = None
+        try:
+            for first in range(0, total, window):
+                pages = range(first, min(first + window, total))
+                by_page = {}
+                pending = []
+                for page in pages:
+                    text = _page_text(reader.pages[page]) if self.fast_path else ''
+                    if len(text.strip()) >= self.min_chars_per_page:
+                        by_page[page] = [Document(
+                            page_content=text,
+                            metadata={'source': self.file_path, 'page_number': page + 1, 'parser': 'pypdf'}
+                        )]
+                    else:
+                        pending.append(page)
+                fast_pages += len(by_page)
+
+                shards = self._shards(pending)
+                if len(shards) > 1 and self.workers > 1:
+                    if executor is None:
+                        # Created from the prefetch thread: forking a threaded process can
+                        # copy locks held by other threads into the children
+                        executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                       mp_context=multiprocessing.get_context('spawn'))
+                    results = executor.map(
+                        _parse_shard,
+                        [self.file_path] * len(shards),
+                        shards,
+                        [self.language] * len(shards)
+                    )
+                else:
+                    results = [_parse_shard(self.file_path, shard, self.language) for shard in shards]
+
+                for documents in results:
+                    for doc in documents:
+                        by_page.setdefault(doc.metadata['page_number'] - 1, []).append(doc)
+                for page in pages:
+                    if page in by_page:
+                        yield by_page.pop(page)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        if self.fast_path:
+            print(f"Fast path extracted {fast_pages} of {total} pages")
@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Union
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+
+from . import metrics
+from .embeddings import normalize_text
+from .lexical import BM25Index, DiskBM25Index
+
+
+def unique_documents(documents: List[Document]) -> List[Document]:
+    """Drop duplicate documents, keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for doc in documents:
+        key = (doc.page_content, tuple(sorted((k, str(v)) for k, v in doc.metadata.items())))
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+
+class ConcurrentMultiQueryRetriever(BaseRetriever):
+    """
+    Multi-query retriever that caches the generated question variants per normalized
+    question and runs the searches for all variants concurrently. The cache may be shared
+    by retrievers with different rewrite prompts, so `prompt_key` is part of the key.
+    """
+
+    retriever: BaseRetriever
+    llm_chain: Runnable
+    variant_cache: Any = None
+    prompt_key: str = ''
+    include_original: bool = True
+    max_workers: int = 6
+
+    def generate_queries(self, question: str) -> List[str]:
+        key = ('variants', self.prompt_key, normalize_text(question).lower())
+        if self.variant_cache is not None:
+            cached = self.variant_cache.get(key)
+            if cached is not None:
+                return cached
+
+        with metrics.span("query_rewrite") as counts:
+            output = self.llm_chain.invoke({"question": question})
+            counts["queries"] = len(output.splitlines())
+        queries = [line.strip() for line in output.split("\n") if line.strip()]
+        if self.include_original:
+            queries.append(question)
+
+        if self.variant_cache is not None:
+            self.variant_cache.put(key, queries)
+        return queries
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        queries = self.generate_queries(query)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(queries))) as executor:
+            results = list(executor.map(self.retriever.invoke, queries))
+        return unique_documents([doc for docs in results for doc in docs])
+
+
+class BM25Retriever(BaseRetriever):
+    """Retriever over a persisted BM25 index."""
+
+    index: Union[DiskBM25Index, BM25Index]
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [doc for doc, _ in self.index.search(query, self.k)]
+
+
+class RRFRetriever(BaseRetriever):
+    """
+    Runs several retrievers concurrently and fuses their rankings with
+    reciprocal rank fusion: score(d) = sum(1 / (rrf_k + rank of d)).
+    """
+
+    retrievers: List[BaseRetriever]
+    k: int = 4
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with ThreadPoolExecutor(max_workers=len(self.retrievers)) as executor:
+            rankings = list(executor.map(lambda retriever: retriever.invoke(query), self.retrievers))
+
+        scores = {}
+        documents = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                key = (doc.page_content, doc.metadata.get('page_number'))
+                documents.setdefault(key, doc)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [documents[key] for key in best]
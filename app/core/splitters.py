@@ -0,0 +1,191 @@
+from typing import Callable, Iterable, Iterator, List
+import re
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .context import CHARS_PER_TOKEN, estimate_tokens
+
+SPLIT_STRATEGIES = ('recursive', 'token', 'section', 'sentence_window')
+
+# Sentence ends followed by what looks like the start of the next sentence
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+# "3.2 Maintenance", "4. Troubleshooting"
+NUMBERED_HEADING_RE = re.compile(r"^\d+(\.\d+)*\.?\s+\S")
+
+TITLE_CATEGORIES = ('Title',)
+
+
+# Set once the missing tiktoken has been reported, so each split does not print it again
+_warned_estimate = False
+
+
+def _token_counter() -> Callable[[str], int]:
+    """
+    tiktoken's cl100k encoding, else the ~4 characters per token estimate. Ollama does not
+    expose the embedding model's tokenizer, so both only approximate its token counts.
+    """
+    global _warned_estimate
+    try:
+        import tiktoken
+    except ImportError:
+        if not _warned_estimate:
+            print("tiktoken is not installed, estimating token counts from text length")
+            _warned_estimate = True
+        return estimate_tokens
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def _page_metadata(element: Document) -> dict:
+    return {key: value for key, value in element.metadata.items() if key != 'category'}
+
+
+def iter_pages(elements: Iterable[Document]) -> Iterator[Document]:
+    """Join parsed elements back into one document per page, as unstructured's paged mode does."""
+    page = None
+    for element in elements:
+        if page is not None and page.metadata.get('page_number') == element.metadata.get('page_number'):
+            page.page_content += "\n\n" + element.page_content
+            continue
+        if page is not None:
+            yield page
+        page = Document(page_content=element.page_content, metadata=_page_metadata(element))
+    if page is not None:
+        yield page
+
+
+def merge_pages(elements: Iterable[Document]) -> List[Document]:
+    return list(iter_pages(elements))
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    if not words or len(words) > 10 or line[-1] in '.,;:!?':
+        return False
+    if NUMBERED_HEADING_RE.match(line) or (line.isupper() and len(line) > 3):
+        return True
+    long_words = [word for word in words if len(word) > 3]
+    return len(words) <= 8 and bool(long_words) and all(word[0].isupper() for word in long_words)
+
+
+def _layout_elements(elements: Iterable[Document]) -> Iterator[Document]:
+    """
+    Elements with a `category`. Pages read from the text layer have none, so their
+    lines are grouped into paragraphs and lines that look like headings become titles.
+    """
+    for element in elements:
+        if element.metadata.get('category'):
+            yield element
+            continue
+        paragraph = []
+        for line in element.page_content.splitlines() + ['']:
+            line = line.strip()
+            heading = bool(line) and _is_heading(line)
+            if paragraph and (not line or heading):
+                yield Document(page_content="\n".join(paragraph),
+                               metadata={**element.metadata, 'category': 'NarrativeText'})
+                paragraph = []
+            if heading:
+                yield Document(page_content=line, metadata={**element.metadata, 'category': 'Title'})
+            elif line:
+                paragraph.append(line)
+
+
+def split_recursive(elements: Iterable[Document], chunk_size: int, overlap_ratio: float = 0.2,
+                    length_function: Callable[[str], int] = len) -> Iterator[Document]:
+    """Pages are split independently, so chunks come out as soon as their page is parsed."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size,
+                                              chunk_overlap=int(chunk_size * overlap_ratio),
+                                              length_function=length_function)
+    for page in iter_pages(elements):
+        yield from splitter.split_documents([page])
+
+
+def split_tokens(elements: Iterable[Document], chunk_size: int, overlap_ratio: float = 0.2) -> Iterator[Document]:
+    """Recursive splitting measured in tokens; `chunk_size` stays in characters, as on the upload form."""
+    return split_recursive(elements, max(1, chunk_size // CHARS_PER_TOKEN), overlap_ratio, _token_counter())
+
+
+def split_sections(elements: Iterable[Document], chunk_size: int) -> Iterator[Document]:
+    """
+    Chunks that follow the document layout: a title starts a new chunk (unless the current
+    one is still small), elements are packed whole up to `chunk_size` and every chunk is
+    prefixed with its section title. Chunks keep the page of their first element.
+    """
+    oversized = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_size // 5)
+    parts = []
+    title = chunk_title = None
+    metadata = None
+
+    def flush():
+        if parts:
+            text = "\n\n".join(parts)
+            if chunk_title:
+                text = f"{chunk_title}\n\n{text}"
+            parts.clear()
+            yield Document(page_content=text, metadata={**metadata, 'section': chunk_title or ''})
+
+    for element in _layout_elements(elements):
+        text = element.page_content.strip()
+        if not text:
+            continue
+        is_title = element.metadata['category'] in TITLE_CATEGORIES
+        size = sum(len(part) for part in parts)
+        if (size >= chunk_size // 4) if is_title else (size + len(text) > chunk_size):
+            yield from flush()
+        if is_title:
+            title = text
+            if not parts:
+                # Becomes the prefix of the chunk that follows
+                continue
+        if not parts:
+            metadata = _page_metadata(element)
+            chunk_title = title
+
+        if len(text) > chunk_size:
+            for piece in oversized.split_text(text):
+                parts.append(piece)
+                yield from flush()
+        else:
+            parts.append(text)
+    yield from flush()
+
+
+def split_sentence_windows(elements: Iterable[Document], window: int = 2) -> Iterator[Document]:
+    """
+    One chunk per sentence, so embeddings match precisely, with the `window` sentences
+    around it on the same page kept in the `window` metadata to answer from.
+    """
+    for page in iter_pages(elements):
+        sentences = [sentence.strip() for sentence in SENTENCE_RE.split(page.page_content) if sentence.strip()]
+        for i, sentence in enumerate(sentences):
+            context = " ".join(sentences[max(0, i - window):i + window + 1])
+            yield Document(page_content=sentence, metadata={**page.metadata, 'window': context})
+
+
+def expand_windows(documents: List[Document]) -> List[Document]:
+    """Replace sentence-window chunks by their surrounding sentences before generation."""
+    return [
+        Document(page_content=doc.metadata['window'], metadata=doc.metadata) if doc.metadata.get('window') else doc
+        for doc in documents
+    ]
+
+
+def iter_chunks(elements: Iterable[Document], strategy: str = 'recursive', chunk_size: int = 1000,
+                overlap_ratio: float = 0.2) -> Iterator[Document]:
+    """Split parsed elements into chunks with the given strategy, keeping page metadata, as they arrive."""
+    if strategy == 'recursive':
+        return split_recursive(elements, chunk_size, overlap_ratio)
+    if strategy == 'token':
+        return split_tokens(elements, chunk_size, overlap_ratio)
+    if strategy == 'section':
+        return split_sections(elements, chunk_size)
+    if strategy == 'sentence_window':
+        return split_sentence_windows(elements)
+    raise ValueError(f"Unknown split strategy: {strategy}")
+
+
+def split_documents(elements: Iterable[Document], strategy: str = 'recursive', chunk_size: int = 1000,
+                    overlap_ratio: float = 0.2) -> List[Document]:
+    return list(iter_chunks(elements, strategy, chunk_size, overlap_ratio))
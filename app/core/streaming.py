@@ -0,0 +1,106 @@
+from contextvars import copy_context
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Iterable, Iterator, List, TypeVar
+import time
+
+T = TypeVar('T')
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(items: Iterable[T], maxsize: int = 4, name: str = 'stage') -> Iterator[T]:
+    """
+    Produce `items` on a thread of their own, at most `maxsize` ahead of the consumer, so
+    that consecutive stages overlap while memory stays bounded by the queue. Errors are
+    raised in the consumer, and closing the returned generator stops the producer.
+    The thread runs in a copy of the caller's context, so spans land in the same trace.
+    """
+    queue = Queue(maxsize=max(1, maxsize))
+    stop = Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    thread = Thread(target=copy_context().run, args=(produce,), name=f'ingest-{name}', daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=0.1)
+            except Empty:
+                if thread.is_alive():
+                    continue
+                # The producer may have finished right after the timeout
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    raise RuntimeError(f"Ingestion stage {name} stopped unexpectedly")
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StageTimer:
+    """
+    Time spent pulling items from an iterator, i.e. producing them, and how many there were.
+    With stages running concurrently, the time a stage waits on the one before it is measured
+    by wrapping its input too, and left out with `seconds - upstream.seconds`.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.items = 0
+
+    def wrap(self, items: Iterable[T]) -> Iterator[T]:
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.seconds += time.perf_counter() - start
+            self.items += 1
+            yield item
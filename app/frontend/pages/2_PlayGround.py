@@ -1,5 +1,7 @@
 import streamlit as st
 import requests
+import time
+import json
 
 URL = 'http://localhost:8000'
 
@@ -72,23 +74,66 @@ def get_pdfs():
         return []
 
 # --------- API Helpers --------- #
-def upload_pdf(pdf_file, chunk_size=1000):
+UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+
+def upload_pdf(pdf_file, chunk_size=1000, split_strategy='recursive', retries=3):
+    """Send the file in pieces through a resumable upload session, resuming after failed pieces."""
     try:
         headers = {
             'Authorization': f'Bearer {st.session_state.access_token}'
         }
-        file = {'file': (pdf_file.name, pdf_file.getvalue(), pdf_file.type)}
-        data = {'chunk_size': chunk_size}
         respond = requests.post(
-            f'{URL}/documents/upload',
-            files=file,
-            data=data,
+            f'{URL}/documents/uploads',
+            json={'filename': pdf_file.name, 'size': pdf_file.size, 'chunk_size': chunk_size,
+                  'split_strategy': split_strategy},
             headers=headers
         )
+        if respond.status_code != 201:
+            return respond.json()
+        session = respond.json()
+
+        progress = st.progress(0.0)
+        failures = 0
+        while session['offset'] < session['size']:
+            pdf_file.seek(session['offset'])
+            try:
+                respond = requests.patch(
+                    f"{URL}/documents/uploads/{session['id']}",
+                    data=pdf_file.read(UPLOAD_CHUNK_BYTES),
+                    headers={**headers, 'Upload-Offset': str(session['offset'])}
+                )
+            except requests.exceptions.RequestException:
+                respond = None
+            if respond is not None and respond.status_code == 200:
+                session = respond.json()
+                progress.progress(session['offset'] / session['size'])
+                continue
+
+            failures += 1
+            if failures > retries:
+                return {'detail': 'Upload failed after several retries'}
+            # Ask the server how much it kept and continue from there
+            session = requests.get(f"{URL}/documents/uploads/{session['id']}", headers=headers).json()
+        progress.empty()
+
+        respond = requests.post(f"{URL}/documents/uploads/{session['id']}/complete", headers=headers)
         return respond.json()
     except Exception as e:
         return {'detail': f'Upload failed: {str(e)}'}
 
+def wait_for_job(job_id, interval=2):
+    headers = {
+        'Authorization': f'Bearer {st.session_state.access_token}'
+    }
+    while True:
+        respond = requests.get(f'{URL}/documents/jobs/{job_id}', headers=headers)
+        if respond.status_code != 200:
+            return {'detail': respond.json().get('detail', 'Unknown error')}
+        job = respond.json()
+        if job['status'] in ('done', 'failed', 'skipped'):
+            return job
+        time.sleep(interval)
+
 def delete_pdf(pdf_id):
     try:
         headers = {
@@ -126,6 +171,38 @@ def ask_query(document_id: int, question: str):
     except Exception as e:
         return {'error': f'Query failed: {str(e)}'}
 
+def ask_query_stream(document_id: int, question: str, retrieval_mode: str = None, sources: list = None):
+    """
+    Yield answer tokens from the `/ask/stream` Server-Sent Events endpoint. Without a
+    document id all documents are searched; the cited passages are appended to `sources`.
+    """
+    headers = {
+        'Authorization': f'Bearer {st.session_state.access_token}'
+    }
+    with requests.post(
+        f'{URL}/ask/stream',
+        json={'document_id': document_id, 'question': question, 'retrieval_mode': retrieval_mode},
+        headers=headers,
+        stream=True
+    ) as respond:
+        if respond.status_code != 200:
+            raise Exception(respond.json().get('detail', 'Unknown error occurred'))
+
+        event = 'message'
+        for line in respond.iter_lines(decode_unicode=True):
+            if not line:
+                event = 'message'
+            elif line.startswith('event:'):
+                event = line.removeprefix('event:').strip()
+            elif line.startswith('data:'):
+                data = json.loads(line.removeprefix('data:').strip())
+                if event == 'error':
+                    raise Exception(data.get('detail', 'Unknown error occurred'))
+                if event == 'message':
+                    yield data['token']
+                elif event == 'done' and sources is not None:
+                    sources.extend(data.get('sources', []))
+
 # --------- Sidebar Controls --------- #
 st.sidebar.header('⚙️ Settings')
 chunk_slider = st.sidebar.slider(
@@ -136,6 +213,18 @@ chunk_slider = st.sidebar.slider(
     step=100,
     help='Adjust how big each text chunk should be for processing.'
 )
+split_strategy = st.sidebar.selectbox(
+    'Chunking Strategy',
+    options=['recursive', 'token', 'section', 'sentence_window'],
+    index=0,
+    help='Recursive and token split by size; section follows the headings of the PDF; sentence window indexes single sentences and answers from the sentences around them.'
+)
+retrieval_mode = st.sidebar.selectbox(
+    'Retrieval Mode',
+    options=['multi_query', 'similarity', 'mmr', 'hybrid'],
+    index=0,
+    help='Multi-query asks the LLM for question variants first; similarity and MMR skip that round-trip. Hybrid adds keyword (BM25) matches for part numbers and error codes.'
+)
 
 # --------- Main Section --------- #
 st.title('📚 PDFs in Database')
@@ -144,6 +233,7 @@ st.title('📚 PDFs in Database')
 pdfs = get_pdfs()
 
 # Map PDFs
+ALL_DOCUMENTS = 'All documents'
 pdf_map = {}
 pdf_names = ['Select a PDF...']
 if pdfs and isinstance(pdfs, list):
@@ -154,6 +244,7 @@ if pdfs and isinstance(pdfs, list):
             display_name = pdf_name.removeprefix(f'{pdf_id}_').removesuffix('.pdf').title()
             pdf_map[display_name] = pdf_id
             pdf_names.append(display_name)
+    pdf_names.insert(1, ALL_DOCUMENTS)
 else:
     st.info('No PDFs found. Upload one to get started.')
 
@@ -163,11 +254,18 @@ upload_file = st.file_uploader('Upload PDF:', type=['pdf'])
 
 if upload_file is not None:
     with st.spinner('📤 Uploading PDF...'):
-        result = upload_pdf(upload_file, chunk_slider)
+        result = upload_pdf(upload_file, chunk_slider, split_strategy)
     if 'id' in result:
-        st.success('✅ PDF uploaded successfully!')
-        get_pdfs.clear()
-        st.rerun()
+        with st.spinner('⚙️ Processing PDF...'):
+            result = wait_for_job(result['id'])
+        if result.get('status') == 'done':
+            st.success('✅ PDF uploaded successfully!')
+            get_pdfs.clear()
+            st.rerun()
+        elif result.get('status') == 'skipped':
+            st.warning('⚠️ This file is already in the database.')
+        else:
+            st.error(f"Processing failed: {result.get('error') or result.get('detail')}")
     else:
         error_detail = result.get('detail', 'Unknown error')
         if 'already uploaded' in error_detail.lower():
@@ -179,8 +277,26 @@ st.markdown('---')
 st.subheader('📑 Select an existing PDF')
 pdf_option = st.selectbox('Choose a PDF:', options=pdf_names, index=0)
 
+# Ask across all documents
+if pdf_option == ALL_DOCUMENTS:
+    question_box = st.text_input(
+        'Type your question:',
+        placeholder='e.g. How do I reset the pump?',
+        key='library_question_input'
+    )
+    if st.button('Submit Question', key='submit_library_question') and question_box:
+        sources = []
+        try:
+            answer = st.write_stream(ask_query_stream(None, question_box, sources=sources))
+            if not answer:
+                st.warning('No answer found. Try another question.')
+            for source in sources:
+                st.caption(f"[{source['index']}] {source['name']}, page {source['page']}")
+        except Exception as e:
+            st.error(f'Error: {e}')
+
 # If PDF selected
-if pdf_option and pdf_option != 'Select a PDF...':
+elif pdf_option and pdf_option != 'Select a PDF...':
     selected_pdf_id = pdf_map.get(pdf_option)
 
     if selected_pdf_id:
@@ -192,15 +308,12 @@ if pdf_option and pdf_option != 'Select a PDF...':
 
         if st.button('Submit Question', key='submit_question'):
             if question_box:
-                with st.spinner('🔎 Finding answer...'):
-                    answer = ask_query(selected_pdf_id, question_box)
-                if 'answer' in answer:
-                    st.success('✅ Answer found:')
-                    st.write(answer['answer'])
-                elif 'error' in answer:
-                    st.error(f'Error: {answer['error']}')
-                else:
-                    st.warning('No answer found. Try another question.')
+                try:
+                    answer = st.write_stream(ask_query_stream(selected_pdf_id, question_box, retrieval_mode))
+                    if not answer:
+                        st.warning('No answer found. Try another question.')
+                except Exception as e:
+                    st.error(f'Error: {e}')
 
         # Sidebar delete
         st.sidebar.markdown('---')
@@ -0,0 +1,155 @@
+"""
+Question latency (p50/p95, time to first token) under concurrent clients.
+
+    python -m benchmarks.bench_ask --clients 8 --questions 20 --token-latency 0.01
+    python -m benchmarks.bench_ask --url http://localhost:8000 --clients 8
+
+Without `--url` the pipeline is driven in-process against the fake Ollama server.
+With `--url` a running API is exercised end to end through `/ask/stream`; start it
+with OLLAMA_HOST pointing at `python -m benchmarks.fake_ollama` for offline runs.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from benchmarks import fake_ollama
+from benchmarks.common import peak_rss_mb, percentile, write_results
+from benchmarks.synthetic_pdf import WORDS, write_pdf
+
+
+def make_questions(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [f"How do I {rng.choice(WORDS)} the {rng.choice(WORDS)} {rng.choice(WORDS)}?"
+            for _ in range(count)]
+
+
+def run_clients(ask, questions: list, clients: int) -> list:
+    """Run `ask(question) -> (first_token_seconds, total_seconds)` from `clients` threads."""
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        return list(executor.map(ask, questions))
+
+
+def summarize(mode: str, timings: list, wall_seconds: float) -> dict:
+    first = [timing[0] for timing in timings]
+    total = [timing[1] for timing in timings]
+    return {
+        'retrieval_mode': mode,
+        'requests': len(timings),
+        'wall_seconds': round(wall_seconds, 4),
+        'requests_per_second': round(len(timings) / wall_seconds, 2),
+        'latency_p50': round(percentile(total, 50), 4),
+        'latency_p95': round(percentile(total, 95), 4),
+        'first_token_p50': round(percentile(first, 50), 4),
+        'first_token_p95': round(percentile(first, 95), 4),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def pipeline_asker(args, workdir: str, mode: str):
+    from app.core.ollama_rag import OllamaRAG
+
+    rag = OllamaRAG(model='fake', embedding_model='fake-embed', fast_pdf_text=True,
+                    vector_backend=args.vector_backend,
+                    context_token_budget=args.context_token_budget, context_rerank=args.context_rerank)
+    name = 'synthetic.pdf'
+    write_pdf(os.path.join(workdir, name), args.pages)
+    persist_dir = rag.load_pdf(path=workdir, name=name, persist_dir=os.path.join(workdir, 'db'),
+                               metadata={'document_id': 1})
+    handle = rag.create_chain(persist_dir, document_id=1)
+
+    def ask(question):
+        start = time.perf_counter()
+        first = None
+        for _ in handle.query(question, mode):
+            if first is None:
+                first = time.perf_counter() - start
+        return first or 0.0, time.perf_counter() - start
+    return ask
+
+
+def http_asker(args, workdir: str, mode: str):
+    import requests
+
+    email = f'bench-{uuid.uuid4().hex[:8]}@example.com'
+    requests.post(f'{args.url}/auth/sign-up',
+                  json={'email': email, 'username': 'bench', 'password': 'bench'}).raise_for_status()
+    token = requests.post(f'{args.url}/auth/log-in',
+                          data={'username': email, 'password': 'bench'}).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    path = write_pdf(os.path.join(workdir, f'bench-{uuid.uuid4().hex[:8]}.pdf'), args.pages)
+    with open(path, 'rb') as f:
+        job = requests.post(f'{args.url}/documents/upload', headers=headers,
+                            files={'file': (os.path.basename(path), f, 'application/pdf')}).json()
+    while job['status'] not in ('done', 'failed', 'skipped'):
+        time.sleep(0.5)
+        job = requests.get(f"{args.url}/documents/jobs/{job['id']}", headers=headers).json()
+    if job['status'] == 'failed':
+        raise RuntimeError(f"Ingestion failed: {job['error']}")
+
+    session = requests.Session()
+    session.headers.update(headers)
+
+    def ask(question):
+        start = time.perf_counter()
+        first = None
+        with session.post(f'{args.url}/ask/stream', stream=True, json={
+            'document_id': job['document_id'], 'question': question,
+            'retrieval_mode': mode, 'use_cache': args.use_cache
+        }) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if first is None and line.startswith('data:') and 'token' in json.loads(line[5:]):
+                    first = time.perf_counter() - start
+        return first or 0.0, time.perf_counter() - start
+    return ask
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='benchmark a running API instead of the in-process pipeline')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--modes', nargs='+', default=['similarity', 'multi_query'])
+    parser.add_argument('--vector-backend', choices=['chroma', 'mmap'], default='chroma',
+                        help='store used by the in-process pipeline')
+    parser.add_argument('--context-token-budget', type=int, default=1500,
+                        help='prompt context budget in tokens, 0 disables trimming')
+    parser.add_argument('--context-rerank', choices=['lexical', 'embedding', 'none'], default='lexical')
+    parser.add_argument('--use-cache', action='store_true', help='allow semantic answer cache hits')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if not args.url:
+        server = fake_ollama.start_process(config=fake_ollama.config_from_args(args))
+        # The ollama client reads OLLAMA_HOST when it is imported
+        os.environ['OLLAMA_HOST'] = f'http://127.0.0.1:{server.server_port}'
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.modes:
+            ask = (http_asker if args.url else pipeline_asker)(args, workdir, mode)
+            ask('warm up')
+
+            start = time.perf_counter()
+            timings = run_clients(ask, make_questions(args.questions), args.clients)
+            result = summarize(mode, timings, time.perf_counter() - start)
+            results.append(result)
+            print(f"{mode:>12}  p50 {result['latency_p50']:.3f}s  p95 {result['latency_p95']:.3f}s  "
+                  f"ttft p50 {result['first_token_p50']:.3f}s  {result['requests_per_second']:.2f} req/s")
+
+    if server:
+        server.shutdown()
+    write_results('ask', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Ingestion throughput of the RAG pipeline against the fake Ollama server.
+
+    python -m benchmarks.bench_ingest --pages 10 100 300 --embed-item-latency 0.002
+
+For every PDF size a synthetic PDF is generated and ingested into a temporary
+store; pages/s, chunks/s, per-stage timings and peak memory are recorded.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import fake_ollama
+from benchmarks.common import peak_rss_mb, write_results
+from benchmarks.synthetic_pdf import write_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--split-strategy', choices=['recursive', 'token', 'section', 'sentence_window'],
+                        default='recursive')
+    parser.add_argument('--parse-workers', type=int, default=0, help='0 = cpu count')
+    parser.add_argument('--no-fast-path', action='store_true', help='always parse with unstructured')
+    parser.add_argument('--vector-backend', choices=['chroma', 'mmap'], default='chroma')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = fake_ollama.start_process(config=fake_ollama.config_from_args(args))
+    # The ollama client reads OLLAMA_HOST when it is imported
+    os.environ['OLLAMA_HOST'] = f'http://127.0.0.1:{server.server_port}'
+
+    from app.core import metrics
+    from app.core.ollama_rag import OllamaRAG
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for pages in args.pages:
+            name = f'synthetic-{pages}.pdf'
+            write_pdf(os.path.join(workdir, name), pages)
+
+            rag = OllamaRAG(
+                model='fake',
+                embedding_model='fake-embed',
+                parse_workers=args.parse_workers or None,
+                fast_pdf_text=not args.no_fast_path,
+                vector_backend=args.vector_backend,
+            )
+            trace_token = metrics.start_trace()
+            start = time.perf_counter()
+            rag.load_pdf(path=workdir, name=name, chunk_size=args.chunk_size, split_strategy=args.split_strategy,
+                         persist_dir=os.path.join(workdir, f'db-{pages}'),
+                         metadata={'document_id': pages})
+            seconds = time.perf_counter() - start
+            trace = metrics.end_trace(trace_token)
+
+            stages = {}
+            for record in trace:
+                stages[record['stage']] = stages.get(record['stage'], 0.0) + record['seconds']
+            chunks = sum(record.get('chunks', 0) for record in trace if record['stage'] == 'split')
+
+            result = {
+                'pages': pages,
+                'chunks': chunks,
+                'seconds': round(seconds, 4),
+                'pages_per_second': round(pages / seconds, 2),
+                'chunks_per_second': round(chunks / seconds, 2),
+                'stages': {stage: round(value, 4) for stage, value in stages.items()},
+                'peak_rss_mb': peak_rss_mb(),
+            }
+            results.append(result)
+            print(f"{pages:>5} pages  {chunks:>6} chunks  {seconds:8.2f}s  "
+                  f"{result['pages_per_second']:8.2f} pages/s  {result['chunks_per_second']:8.2f} chunks/s")
+
+    server.shutdown()
+    write_results('ingest', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
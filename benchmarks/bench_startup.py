@@ -0,0 +1,95 @@
+"""
+Cold start of an API worker, measured in fresh interpreters.
+
+    python -m benchmarks.bench_startup --preload none import startup --repeat 5
+
+For every RAG_PRELOAD mode a new Python process imports the app, runs its
+startup (lifespan) and serves a first request; import, startup and first
+request times, the time to load the RAG pipeline afterwards, the number of
+imported modules and peak memory are recorded, as medians over the runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import fake_ollama
+from benchmarks.common import percentile, write_results
+
+# Run in the child process; prints one JSON line
+CHILD = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+from app.backend.main import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+import app.backend.rag as rag
+with TestClient(app) as client:
+    started = time.perf_counter()
+    client.get('/')
+    served = time.perf_counter()
+    modules = len(sys.modules)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rag.get_pipeline()
+    loaded = time.perf_counter()
+scale = 1 / 1024 / 1024 if sys.platform == 'darwin' else 1 / 1024
+print(json.dumps({
+    'import_seconds': imported - start,
+    'startup_seconds': started - imported,
+    'first_request_seconds': served - start,
+    'pipeline_seconds': loaded - served,
+    'modules': modules,
+    'rss_mb': rss * scale,
+}))
+'''
+
+
+def run_child(preload: str, env: dict) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=root, env={**env, 'RAG_PRELOAD': preload},
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preload', nargs='+', choices=['none', 'import', 'startup'],
+                        default=['none', 'startup'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', action='store_true', help='also warm up the models on startup')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/...)')
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = fake_ollama.start_process(config=fake_ollama.config_from_args(args))
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            'OLLAMA_HOST': f'http://127.0.0.1:{server.server_port}',
+            'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "startup.db")}',
+            'SECRET_KEY': 'benchmark', 'ALGORITHM': 'HS256', 'ACCESS_TOKEN_EXPIRE_MINUTES': '30',
+            'RAG_MODEL': 'fake',
+            'EMBEDDING_CACHE_PATH': os.path.join(workdir, 'embeddings.sqlite'),
+            'OLLAMA_WARMUP': 'true' if args.warmup else 'false',
+            'OLLAMA_PS_INTERVAL': '0',
+        }
+        for preload in args.preload:
+            runs = [run_child(preload, env) for _ in range(args.repeat)]
+            result = {'preload': preload, 'runs': len(runs)}
+            for key in runs[0]:
+                result[key] = round(percentile([run[key] for run in runs], 50), 4)
+            results.append(result)
+            print(f"{preload:>8}  import {result['import_seconds']:6.2f}s  startup {result['startup_seconds']:6.2f}s  "
+                  f"first request {result['first_request_seconds']:6.2f}s  "
+                  f"pipeline {result['pipeline_seconds']:6.2f}s  {result['modules']:>5} modules  "
+                  f"{result['rss_mb']:7.1f} MB")
+
+    server.shutdown()
+    write_results('startup', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Deterministic stand-in for the Ollama HTTP API, for offline benchmarks.
+
+    python -m benchmarks.fake_ollama --port 11435 --token-latency 0.02
+
+Embeddings are feature-hashed bags of words, so similar texts get similar vectors
+and retrieval behaves sensibly. Chat/generate stream a fixed number of tokens with
+configurable first-token and per-token latency. Models count as loaded for their
+`keep_alive` after each request and are listed by `/api/ps`.
+"""
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import argparse
+import hashlib
+import json
+import multiprocessing
+import re
+import time
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)(ms|s|m|h)?$")
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}
+
+
+class FakeOllamaConfig:
+    def __init__(self, dim: int = 768, embed_latency: float = 0.0, embed_item_latency: float = 0.0,
+                 first_token_latency: float = 0.0, token_latency: float = 0.0, tokens: int = 64):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+
+
+@lru_cache(maxsize=65536)
+def _token_vector(token: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha1(token.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def embed(text: str, dim: int) -> list:
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in WORD_RE.findall(text.lower()) or ['<empty>']:
+        vector += _token_vector(token, dim)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def keep_alive_seconds(value) -> float:
+    """Seconds a model stays loaded; negative keeps it loaded, Ollama's default is five minutes."""
+    if value is None or value == '':
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = DURATION_RE.match(str(value).strip())
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)] if match else 300.0
+
+
+def _answer_tokens(prompt: str, count: int) -> list:
+    """Deterministic tokens derived from the prompt, one line per question for rewrite prompts."""
+    words = WORD_RE.findall(prompt.lower()) or ['answer']
+    tokens = []
+    for i in range(count):
+        token = words[(i * 7) % len(words)]
+        tokens.append(f'{token}\n' if i % 12 == 11 else f'{token} ')
+    return tokens
+
+
+class Handler(BaseHTTPRequestHandler):
+    config: FakeOllamaConfig = FakeOllamaConfig()
+    loaded: dict = {}
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._json({'models': [{'name': 'fake', 'model': 'fake', 'size': 0}]})
+        elif self.path == '/api/ps':
+            now = time.time()
+            self._json({'models': [
+                {'name': model, 'model': model, 'size': 0, 'size_vram': 0}
+                for model, expires in list(self.loaded.items()) if expires < 0 or expires > now
+            ]})
+        elif self.path == '/api/version':
+            self._json({'version': '0.0.0-fake'})
+        else:
+            self._json({'status': 'ok'})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _touch(self, body: dict):
+        keep_alive = keep_alive_seconds(body.get('keep_alive'))
+        if keep_alive == 0:
+            self.loaded.pop(body.get('model'), None)
+        else:
+            self.loaded[body.get('model')] = -1 if keep_alive < 0 else time.time() + keep_alive
+
+    def do_POST(self):
+        body = self._body()
+        config = self.config
+        if self.path in ('/api/embed', '/api/embeddings', '/api/chat', '/api/generate'):
+            self._touch(body)
+
+        if self.path in ('/api/pull', '/api/show'):
+            self._json({'status': 'success'})
+        elif self.path == '/api/embed':
+            inputs = body.get('input') or ''
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep(config.embed_latency + config.embed_item_latency * len(inputs))
+            self._json({'model': body.get('model'),
+                        'embeddings': [embed(text, config.dim) for text in inputs]})
+        elif self.path == '/api/embeddings':
+            time.sleep(config.embed_latency + config.embed_item_latency)
+            self._json({'embedding': embed(body.get('prompt', ''), config.dim)})
+        elif self.path in ('/api/chat', '/api/generate'):
+            if self.path == '/api/chat':
+                prompt = ' '.join(m.get('content', '') for m in body.get('messages', []))
+            else:
+                prompt = body.get('prompt', '')
+            self._stream(body, _answer_tokens(prompt, config.tokens))
+        else:
+            self._json({'error': f'unknown endpoint {self.path}'}, status=404)
+
+    def _message(self, body: dict, content: str, done: bool) -> dict:
+        message = {'model': body.get('model'), 'created_at': '1970-01-01T00:00:00Z', 'done': done}
+        if self.path == '/api/chat':
+            message['message'] = {'role': 'assistant', 'content': content}
+        else:
+            message['response'] = content
+        if done:
+            message.update({'done_reason': 'stop', 'eval_count': self.config.tokens,
+                            'prompt_eval_count': 0, 'total_duration': 0})
+        return message
+
+    def _stream(self, body: dict, tokens: list):
+        if not body.get('stream', True):
+            time.sleep(self.config.first_token_latency + self.config.token_latency * len(tokens))
+            self._json(self._message(body, ''.join(tokens), True))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(self.config.first_token_latency)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.config.token_latency)
+            self._chunk(self._message(body, token, False))
+        self._chunk(self._message(body, '', True))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _chunk(self, payload: dict):
+        data = json.dumps(payload).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+def start(port: int = 0, config: FakeOllamaConfig = None) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread; the bound port is `server.server_port`."""
+    handler = type('ConfiguredHandler', (Handler,), {'config': config or FakeOllamaConfig(), 'loaded': {}})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _serve(port: int, config: FakeOllamaConfig, ready):
+    handler = type('ConfiguredHandler', (Handler,), {'config': config, 'loaded': {}})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    ready.send(server.server_port)
+    ready.close()
+    server.serve_forever()
+
+
+class ServerProcess:
+    """The fake server running in a child process; same `server_port`/`shutdown()` as a server."""
+
+    def __init__(self, process, server_port: int):
+        self.process = process
+        self.server_port = server_port
+
+    def shutdown(self):
+        self.process.terminate()
+        self.process.join()
+
+
+def start_process(port: int = 0, config: FakeOllamaConfig = None) -> ServerProcess:
+    """
+    Start the fake server in its own process, so that its memory (e.g. the token vector
+    cache) is not counted in the peak RSS of the benchmark process.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_serve, args=(port, config or FakeOllamaConfig(), sender),
+                              name='fake-ollama', daemon=True)
+    process.start()
+    sender.close()
+    return ServerProcess(process, receiver.recv())
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--embed-latency', type=float, default=0.0, help='seconds per embed request')
+    parser.add_argument('--embed-item-latency', type=float, default=0.0, help='seconds per embedded text')
+    parser.add_argument('--first-token-latency', type=float, default=0.0)
+    parser.add_argument('--token-latency', type=float, default=0.0)
+    parser.add_argument('--tokens', type=int, default=64, help='tokens per generation')
+
+
+def config_from_args(args) -> FakeOllamaConfig:
+    return FakeOllamaConfig(
+        dim=args.dim,
+        embed_latency=args.embed_latency,
+        embed_item_latency=args.embed_item_latency,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        tokens=args.tokens,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Ollama server for benchmarks.')
+    parser.add_argument('--port', type=int, default=11435)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start(args.port, config_from_args(args))
+    print(f'Fake Ollama listening on http://127.0.0.1:{server.server_port}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
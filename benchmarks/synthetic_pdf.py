@@ -0,0 +1,89 @@
+"""
+Generate born-digital PDFs of arbitrary size without any PDF library.
+
+    python -m benchmarks.synthetic_pdf out.pdf --pages 300
+
+Pages contain seeded pseudo-random manual-like prose with part numbers and error
+codes, so runs are reproducible and lexical retrieval has exact tokens to find.
+"""
+import argparse
+import random
+
+WORDS = (
+    "pump valve pressure sensor module firmware reset calibrate housing bracket torque "
+    "assembly inspect replace filter coolant relay circuit voltage fuse display panel "
+    "warning alarm procedure maintenance interval operator manual section chapter "
+    "install remove tighten loosen clean check verify adjust connect disconnect"
+).split()
+
+LINES_PER_PAGE = 48
+WORDS_PER_LINE = 12
+
+
+def page_lines(rng: random.Random, page: int) -> list:
+    lines = [f"Chapter {page // 10 + 1} - Section {page + 1}"]
+    while len(lines) < LINES_PER_PAGE:
+        words = [rng.choice(WORDS) for _ in range(WORDS_PER_LINE)]
+        if rng.random() < 0.2:
+            words[rng.randrange(WORDS_PER_LINE)] = f"PN-{rng.randrange(10000, 99999)}"
+        if rng.random() < 0.1:
+            words[rng.randrange(WORDS_PER_LINE)] = f"E{rng.randrange(100, 999)}"
+        lines.append(' '.join(words).capitalize() + '.')
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: str, pages: int, seed: int = 0):
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for page in range(pages):
+        text = ["BT /F1 10 Tf 12 TL 50 760 Td"]
+        text += [f"({_escape(line)}) '" for line in page_lines(rng, page)]
+        text.append("ET")
+        stream = '\n'.join(text).encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+
+    kids = ' '.join(f"{ref} 0 R" for ref in page_refs).encode('ascii')
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic PDF.')
+    parser.add_argument('path')
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_pdf(args.path, args.pages, args.seed)
+    print(f'Wrote {args.pages} pages to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import time
+
+from app.core.answer_cache import SemanticAnswerCache
+
+WORDS = ["reset", "pump", "valve", "replace", "filter", "alarm"]
+
+
+def embed(text):
+    words = text.split()
+    return [float(words.count(word)) for word in WORDS]
+
+
+class Loader:
+    """Stored answers per document, recording which documents were seeded."""
+
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+        self.calls = []
+
+    def __call__(self, document_id):
+        self.calls.append(document_id)
+        return self.rows.get(document_id, [])
+
+
+def make_cache(loader=None, **options):
+    return SemanticAnswerCache(embed=embed, threshold=0.9, loader=loader or Loader(), **options)
+
+
+def test_similar_question_hits_and_other_questions_miss():
+    cache = make_cache()
+    cache.add(1, "reset pump", "Hold the reset button.", 10)
+
+    assert cache.lookup(1, "Reset pump ") == ("Hold the reset button.", 10)
+    assert cache.lookup(1, "replace filter") is None
+    # Answers belong to their document
+    assert cache.lookup(2, "reset pump") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_first_use_seeds_from_the_loader_in_one_batch():
+    batches = []
+    loader = Loader({1: [("reset pump", "Hold the reset button.", 10, time.time())]})
+    cache = make_cache(loader, embed_many=lambda texts: batches.append(texts) or [embed(t) for t in texts])
+
+    assert cache.lookup(1, "reset pump") == ("Hold the reset button.", 10)
+    assert cache.lookup(1, "reset pump") is not None
+    assert loader.calls == [1]
+    assert batches == [["reset pump"]]
+
+
+def test_expired_answers_are_not_served():
+    loader = Loader({1: [("reset pump", "old", 10, time.time() - 120)]})
+    cache = make_cache(loader, ttl=60)
+
+    assert cache.lookup(1, "reset pump") is None
+
+
+def test_invalidate_drops_the_document():
+    loader = Loader()
+    cache = make_cache(loader)
+    cache.add(1, "reset pump", "Hold the reset button.", 10)
+
+    cache.invalidate(1)
+
+    assert cache.lookup(1, "reset pump") is None
+    assert loader.calls == [1, 1]
+
+
+def test_another_version_is_seeded_again():
+    loader = Loader()
+    cache = make_cache(loader)
+    cache.add(1, "reset pump", "Hold the reset button.", 10, version="v1")
+    assert cache.lookup(1, "reset pump", version="v1") is not None
+
+    # Another process re-ingested the document: its answers are not served for the new version
+    assert cache.lookup(1, "reset pump", version="v2") is None
+    assert loader.calls == [1, 1]
+    cache.add(1, "reset pump", "Press and hold reset.", 11, version="v2")
+    assert cache.lookup(1, "reset pump", version="v2") == ("Press and hold reset.", 11)
+
+
+def test_least_recently_used_documents_are_dropped():
+    cache = make_cache(max_documents=2)
+    for document_id in (1, 2):
+        cache.add(document_id, "reset pump", f"answer {document_id}", document_id)
+    cache.lookup(1, "reset pump")
+    cache.add(3, "reset pump", "answer 3", 3)
+
+    assert cache.stats()["documents"] == 2
+    assert cache.lookup(1, "reset pump") is not None
+    assert cache.lookup(2, "reset pump") is None
@@ -0,0 +1,83 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.core.context import ContextCompressor, estimate_tokens
+
+
+def doc(text, page=1, source="manual.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page_number": page})
+
+
+def sentences(word, count):
+    return " ".join(f"The {word} sentence number {i} is here." for i in range(count))
+
+
+def texts(selected):
+    return [text for _, text in selected]
+
+
+def test_duplicates_and_contained_chunks_are_dropped():
+    compressor = ContextCompressor(token_budget=0, rerank="none")
+    first = sentences("pump", 4)
+
+    selected = compressor.select("pump", [doc(first), doc(first), doc(first[:60], page=2), doc("Valve closed.")])
+
+    assert selected == [(0, first), (3, "Valve closed.")]
+
+
+def test_overlap_with_a_neighbouring_chunk_is_trimmed():
+    compressor = ContextCompressor(token_budget=0, rerank="none")
+    shared = "Close the pump valve before opening the housing cover."
+    left = f"Switch off the main breaker first. {shared}"
+    right = f"{shared} Then remove the four screws."
+
+    assert texts(compressor.select("pump", [doc(left), doc(right)])) == [left, "Then remove the four screws."]
+    # Chunks of other pages are not neighbours
+    assert texts(compressor.select("pump", [doc(left), doc(right, page=2)])) == [left, right]
+
+
+def test_chunks_are_kept_within_the_token_budget():
+    chunks = [doc(sentences(word, 6), page) for page, word in enumerate(["pump", "valve", "relay"], 1)]
+    per_chunk = estimate_tokens(chunks[0].page_content)
+    compressor = ContextCompressor(token_budget=per_chunk + 70, rerank="none", min_tail_tokens=64)
+
+    selected = compressor.select("question", chunks)
+
+    assert [position for position, _ in selected] == [0, 1]
+    assert selected[0][1] == chunks[0].page_content
+    # The rest of the budget takes the start of the next chunk, cut at a sentence end
+    assert selected[1][1].endswith(".")
+    assert estimate_tokens(selected[1][1]) <= 70
+    assert sum(estimate_tokens(text) for text in texts(selected)) <= compressor.token_budget
+
+
+def test_first_chunk_is_truncated_rather_than_dropped():
+    compressor = ContextCompressor(token_budget=10, rerank="none", min_tail_tokens=64)
+
+    selected = compressor.select("question", [doc(sentences("pump", 40))])
+
+    assert len(selected) == 1
+    assert estimate_tokens(selected[0][1]) <= 64
+
+
+def test_lexical_rerank_moves_matching_chunks_up():
+    chunks = [doc("General safety notes for the operator.", 1),
+              doc("Ambient temperature limits.", 2),
+              doc("Reset error E-1042 by holding the reset key.", 3)]
+
+    assert [p for p, _ in ContextCompressor(token_budget=0, rerank="none").select("reset e-1042", chunks)] == [0, 1, 2]
+    # Fused with the retrieval order, so the match moves up without overriding it
+    assert [p for p, _ in ContextCompressor(token_budget=0, rerank="lexical").select("reset e-1042", chunks)] == [0, 2, 1]
+
+
+def test_compress_keeps_the_chunk_metadata():
+    compressor = ContextCompressor(token_budget=0, rerank="none")
+
+    compressed = compressor.compress("pump", [doc("Pump data.", page=4)])
+
+    assert compressed[0].metadata == {"source": "manual.pdf", "page_number": 4}
+
+
+def test_unknown_rerank_mode_is_rejected():
+    with pytest.raises(ValueError):
+        ContextCompressor(rerank="cross-encoder")
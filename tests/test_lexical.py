@@ -0,0 +1,107 @@
+import gzip
+import json
+import os
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.lexical import (BM25Index, BM25Writer, DiskBM25Index, lexical_index_path,
+                              open_lexical_index, tokenize)
+from app.core.retrievers import BM25Retriever, RRFRetriever
+
+CHUNKS = [
+    "Error E-1042 means the pump is dry.",
+    "Replace filter XJ9.2b every six months.",
+    "The pump valve must be closed before the pump is serviced.",
+    "Reset the panel after replacing the relay.",
+]
+
+
+def docs():
+    return [Document(page_content=text, metadata={"page_number": page}) for page, text in enumerate(CHUNKS, 1)]
+
+
+def write_index(path):
+    writer = BM25Writer(path)
+    for position, doc in enumerate(docs()):
+        writer.add(f"chunk-{position}", doc)
+    writer.commit()
+    writer.finish()
+    return DiskBM25Index(path)
+
+
+def test_part_numbers_stay_single_tokens():
+    assert tokenize("Error E-1042 on XJ9.2b, see 3/4") == ["error", "e-1042", "on", "xj9.2b", "see", "3/4"]
+
+
+def test_disk_index_scores_like_the_in_memory_index(tmp_path):
+    disk = write_index(str(tmp_path / "bm25" / "1.sqlite"))
+    memory = BM25Index.build([f"chunk-{i}" for i in range(len(CHUNKS))], docs())
+
+    for query in ("pump", "pump valve", "e-1042", "filter relay", "nothing here"):
+        expected = memory.search(query, k=3)
+        found = disk.search(query, k=3)
+        assert [doc.page_content for doc, _ in found] == [doc.page_content for doc, _ in expected]
+        assert [score for _, score in found] == pytest.approx([score for _, score in expected])
+
+    doc, _ = disk.search("e-1042", k=1)[0]
+    assert doc.metadata == {"page_number": 1}
+
+
+def test_writer_replaces_the_index_only_when_finished(tmp_path):
+    path = lexical_index_path(str(tmp_path), 1)
+    write_index(path)
+
+    writer = BM25Writer(path)
+    writer.add("other", Document(page_content="firmware update", metadata={}))
+    writer.commit()
+    assert open_lexical_index(str(tmp_path), 1).search("firmware") == []
+
+    writer.abort()
+    assert not os.path.exists(f"{path}.tmp")
+    assert open_lexical_index(str(tmp_path), 1).search("pump")
+
+
+def test_legacy_gzip_index_is_read_until_replaced(tmp_path):
+    legacy = lexical_index_path(str(tmp_path), 1, "json.gz")
+    os.makedirs(os.path.dirname(legacy))
+    index = BM25Index.build(["chunk-0"], docs()[:1])
+    with gzip.open(legacy, "wt", encoding="utf-8") as f:
+        json.dump({"ids": index.ids, "texts": index.texts, "metadatas": index.metadatas,
+                   "lengths": index.lengths, "postings": index.postings}, f)
+
+    assert isinstance(open_lexical_index(str(tmp_path), 1), BM25Index)
+    assert open_lexical_index(str(tmp_path), 1).search("pump")
+
+    write_index(lexical_index_path(str(tmp_path), 1))
+    assert isinstance(open_lexical_index(str(tmp_path), 1), DiskBM25Index)
+    assert not os.path.exists(legacy)
+    assert open_lexical_index(str(tmp_path), 2) is None
+
+
+def test_bm25_retriever_returns_the_best_chunks(tmp_path):
+    retriever = BM25Retriever(index=write_index(str(tmp_path / "1.sqlite")), k=2)
+
+    found = retriever.invoke("pump valve")
+
+    assert [doc.page_content for doc in found] == [CHUNKS[2], CHUNKS[0]]
+
+
+class FixedRetriever(BaseRetriever):
+    documents: List[Document]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.documents
+
+
+def test_rrf_ranks_chunks_found_by_both_retrievers_first():
+    a, b, c, d = docs()
+    fused = RRFRetriever(retrievers=[FixedRetriever(documents=[a, b, c]),
+                                     FixedRetriever(documents=[d, c, a])], k=3)
+
+    found = fused.invoke("question")
+
+    # a: 1/61 + 1/63, c: 1/63 + 1/62, d: 1/61, b: 1/62
+    assert found == [a, c, d]
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.core.mmap_store import MmapVectorStore
+
+WORDS = ["pump", "valve", "sensor", "filter", "relay", "panel", "firmware", "alarm"]
+
+
+class WordEmbeddings(Embeddings):
+    """Counts of a few known words, so that similarities are known in advance."""
+
+    def _embed(self, text: str):
+        words = text.lower().split()
+        return [float(words.count(word)) for word in WORDS]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture(params=["int8", "none"])
+def store(request, tmp_path):
+    return MmapVectorStore(str(tmp_path), WordEmbeddings(), quantization=request.param)
+
+
+def add_manual(store):
+    store.add_texts(
+        ["pump pump", "valve", "sensor", "pump valve", "filter"],
+        metadatas=[
+            {"document_id": 1, "page_number": 1},
+            {"document_id": 1, "page_number": 2},
+            {"document_id": 2, "page_number": 1},
+            {"document_id": 2, "page_number": 2},
+            {"document_id": 3, "page_number": 1},
+        ],
+        ids=["a", "b", "c", "d", "e"],
+    )
+
+
+def ids(hits):
+    return [doc.id for doc, _ in hits]
+
+
+def test_search_orders_by_cosine_similarity(store):
+    add_manual(store)
+
+    hits = store.similarity_search_with_score("pump", k=2)
+
+    assert ids(hits) == ["a", "d"]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-4)
+    assert hits[1][1] == pytest.approx(1 / np.sqrt(2), abs=1e-4)
+    assert hits[0][0].page_content == "pump pump"
+    assert hits[0][0].metadata == {"document_id": 1, "page_number": 1}
+
+
+def test_search_filters(store):
+    add_manual(store)
+
+    assert ids(store.similarity_search_with_score("pump", k=5, filter={"document_id": 2})) == ["d", "c"]
+    assert set(ids(store.similarity_search_with_score(
+        "pump", k=5, filter={"document_id": {"$in": [1, 3]}}))) == {"a", "b", "e"}
+    assert ids(store.similarity_search_with_score(
+        "pump", k=5, filter={"$and": [{"document_id": 2}, {"page_number": 2}]})) == ["d"]
+    assert store.similarity_search_with_score("pump", k=5, filter={"document_id": 9}) == []
+
+
+def test_readding_an_id_replaces_it(store):
+    add_manual(store)
+
+    store.add_texts(["filter"], metadatas=[{"document_id": 1}], ids=["a"])
+
+    assert store.count() == 5
+    assert store.get(ids=["a"])["documents"] == ["filter"]
+    assert "a" not in ids(store.similarity_search_with_score("pump", k=5))[:2]
+
+
+def test_delete_by_ids_and_filter(store):
+    add_manual(store)
+
+    store.delete(ids=["a"])
+    store.delete(where={"document_id": 2})
+
+    assert store.get()["ids"] == ["b", "e"]
+    assert set(ids(store.similarity_search_with_score("pump valve", k=5))) == {"b", "e"}
+    assert store.delete() is False
+
+
+def test_other_instances_see_writes(store, tmp_path):
+    add_manual(store)
+    other = MmapVectorStore(str(tmp_path), WordEmbeddings())
+    assert ids(other.similarity_search_with_score("sensor", k=1)) == ["c"]
+
+    store.delete(ids=["c"])
+
+    assert MmapVectorStore.exists(str(tmp_path))
+    assert "c" not in ids(other.similarity_search_with_score("sensor", k=5))
+
+
+def test_compaction_keeps_live_rows(store):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(1200, len(WORDS))).astype(np.float32)
+    store.upsert(
+        ids=[f"r{i}" for i in range(1200)],
+        embeddings=vectors,
+        documents=[f"row {i}" for i in range(1200)],
+        metadatas=[{"document_id": i % 12} for i in range(1200)],
+    )
+
+    # Enough dead rows to rewrite the vector files into a new generation
+    store.delete(where={"document_id": {"$in": list(range(11))}})
+
+    assert not os.path.exists(store._file(0, "f32"))
+    assert os.path.exists(store._file(1, "f32"))
+    assert store.count() == 100
+    kept = [i for i in range(1200) if i % 12 == 11]
+    assert store.get()["ids"] == [f"r{i}" for i in kept]
+    stored = store.get(ids=["r11"], include=["embeddings"])["embeddings"][0]
+    assert stored == pytest.approx(vectors[11] / np.linalg.norm(vectors[11]), abs=1e-5)
+    for i in kept[:5]:
+        best = store.similarity_search_by_vector_with_score(vectors[i].tolist(), k=1)
+        assert ids(best) == [f"r{i}"]
+        assert best[0][1] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_rejects_another_dimension(store):
+    add_manual(store)
+
+    with pytest.raises(ValueError):
+        store.upsert(ids=["x"], embeddings=[[1.0, 0.0]], documents=["x"])
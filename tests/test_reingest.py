@@ -0,0 +1,128 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.core.base_rag import BaseRAG
+from app.core.lexical import open_lexical_index
+
+WORDS = ["pump", "valve", "sensor", "filter", "relay", "panel"]
+
+
+class CountingEmbeddings(Embeddings):
+    """Counts of a few known words; remembers every text it embedded."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def _embed(self, text):
+        words = text.lower().split()
+        return [float(words.count(word)) for word in WORDS] + [1.0]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class FakeRAG(BaseRAG):
+    """Ingests `texts` as the chunks of any PDF, without parsing or Ollama."""
+
+    def __init__(self, **options):
+        self.embeddings = CountingEmbeddings()
+        self.texts = []
+        super().__init__(model="fake", vector_backend="mmap", ingest_batch_size=2, **options)
+
+    def _initialize_models(self):
+        pass
+
+    def _get_default_embedding_model(self):
+        return "fake"
+
+    def _get_embeddings(self):
+        return self.embeddings
+
+    def _iter_chunks(self, path, name, lang="en", chunk_size=1000, metadata=None, split_strategy="recursive"):
+        return iter([Document(page_content=text, metadata={"page_number": 1, **(metadata or {})})
+                     for text in self.texts])
+
+
+@pytest.fixture
+def rag():
+    return FakeRAG()
+
+
+def stored(rag, persist_dir):
+    data = rag._open_db(persist_dir).get(include=["documents"])
+    return sorted(zip(data["documents"], data["ids"]))
+
+
+def ingest(rag, persist_dir, texts):
+    rag.texts = texts
+    rag.embeddings.embedded = []
+    rag.load_pdf("unused", "manual.pdf", persist_dir=persist_dir, metadata={"document_id": 7})
+
+
+def reingest(rag, persist_dir, texts):
+    rag.texts = texts
+    rag.embeddings.embedded = []
+    return rag.reingest_pdf("unused", "manual.pdf", persist_dir, document_id=7)
+
+
+def test_only_changed_chunks_are_embedded(rag, tmp_path):
+    persist_dir = str(tmp_path / "manual")
+    ingest(rag, persist_dir, ["pump one", "valve two", "sensor three"])
+    before = dict(stored(rag, persist_dir))
+
+    counts = reingest(rag, persist_dir, ["pump one", "valve two changed", "sensor three", "relay four"])
+
+    assert counts == {"added": 2, "deleted": 1, "unchanged": 2}
+    assert sorted(rag.embeddings.embedded) == ["relay four", "valve two changed"]
+    after = dict(stored(rag, persist_dir))
+    assert sorted(after) == ["pump one", "relay four", "sensor three", "valve two changed"]
+    # Unchanged chunks keep their content-addressed ids
+    assert after["pump one"] == before["pump one"]
+    assert all(chunk_id.startswith("7-") for chunk_id in after.values())
+
+
+def test_identical_file_changes_nothing(rag, tmp_path):
+    persist_dir = str(tmp_path / "manual")
+    ingest(rag, persist_dir, ["pump one", "valve two"])
+
+    counts = reingest(rag, persist_dir, ["pump one", "valve two"])
+
+    assert counts == {"added": 0, "deleted": 0, "unchanged": 2}
+    assert rag.embeddings.embedded == []
+
+
+def test_repeated_text_is_counted_per_occurrence(rag, tmp_path):
+    persist_dir = str(tmp_path / "manual")
+    ingest(rag, persist_dir, ["warning", "pump one", "warning"])
+    ids = [chunk_id for text, chunk_id in stored(rag, persist_dir) if text == "warning"]
+    assert sorted(chunk_id.rsplit("-", 1)[1] for chunk_id in ids) == ["0", "1"]
+
+    counts = reingest(rag, persist_dir, ["warning", "pump one"])
+
+    assert counts == {"added": 0, "deleted": 1, "unchanged": 2}
+    assert [text for text, _ in stored(rag, persist_dir)] == ["pump one", "warning"]
+
+
+def test_lexical_index_follows_the_new_version(rag, tmp_path):
+    persist_dir = str(tmp_path / "manual")
+    ingest(rag, persist_dir, ["pump one", "valve two"])
+
+    reingest(rag, persist_dir, ["pump one", "relay four"])
+
+    index = open_lexical_index(persist_dir, 7)
+    assert [doc.page_content for doc, _ in index.search("relay")] == ["relay four"]
+    assert index.search("valve") == []
+
+
+def test_shared_chunk_ids_keep_their_document_prefix():
+    from app.backend.migrate_store import shared_chunk_id
+
+    assert shared_chunk_id("7-abc-0", 7) == "7-abc-0"
+    # Chunks ingested before ids carried the document id
+    assert shared_chunk_id("abc-0", 7) == "7-abc-0"
+    assert shared_chunk_id("17-abc-0", 7) == "7-17-abc-0"
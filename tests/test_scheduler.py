@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.backend.scheduler import BACKGROUND, INTERACTIVE, FairScheduler, QueueFull
+
+
+def make_scheduler(concurrency=1, limits=None, max_queued=None, timeouts=None):
+    return FairScheduler(concurrency, limits or {}, max_queued or {}, timeouts or {})
+
+
+class Recorder:
+    """Collects the tickets started by a scheduler, in order."""
+
+    def __init__(self):
+        self.started = []
+
+    def __call__(self, name):
+        return lambda ticket: self.started.append((name, ticket))
+
+    def names(self):
+        return [name for name, _ in self.started]
+
+    def release(self, name):
+        for started, ticket in self.started:
+            if started == name:
+                ticket.release()
+                return
+        raise AssertionError(f"{name} was not started")
+
+
+def test_users_take_turns():
+    scheduler = make_scheduler()
+    record = Recorder()
+    scheduler.submit(0, INTERACTIVE, record("busy"))
+    for name in ("a1", "a2", "a3"):
+        scheduler.submit(1, INTERACTIVE, record(name))
+    scheduler.submit(2, INTERACTIVE, record("b1"))
+    scheduler.submit(3, INTERACTIVE, record("c1"))
+
+    for name in ("busy", "a1", "b1", "c1", "a2", "a3"):
+        record.release(name)
+
+    assert record.names() == ["busy", "a1", "b1", "c1", "a2", "a3"]
+    assert scheduler.stats()[INTERACTIVE] == {"queued": 0, "users": 0, "running": 0}
+
+
+def test_questions_start_before_queued_ingestion():
+    scheduler = make_scheduler()
+    record = Recorder()
+    scheduler.submit(1, BACKGROUND, record("busy"))
+    scheduler.submit(1, BACKGROUND, record("ingest"))
+    scheduler.submit(2, INTERACTIVE, record("question"))
+
+    record.release("busy")
+
+    assert record.names() == ["busy", "question"]
+    record.release("question")
+    assert record.names() == ["busy", "question", "ingest"]
+
+
+def test_background_work_is_capped():
+    scheduler = make_scheduler(concurrency=3, limits={BACKGROUND: 1})
+    record = Recorder()
+    scheduler.submit(1, BACKGROUND, record("ingest1"))
+    scheduler.submit(2, BACKGROUND, record("ingest2"))
+    scheduler.submit(1, INTERACTIVE, record("question"))
+
+    assert record.names() == ["ingest1", "question"]
+    assert scheduler.stats()[BACKGROUND] == {"queued": 1, "users": 1, "running": 1}
+    record.release("ingest1")
+    assert record.names() == ["ingest1", "question", "ingest2"]
+
+
+def test_per_user_queue_limit():
+    scheduler = make_scheduler(max_queued={INTERACTIVE: 2})
+    record = Recorder()
+    scheduler.submit(1, INTERACTIVE, record("running"))
+    scheduler.submit(1, INTERACTIVE, record("queued1"))
+    scheduler.submit(1, INTERACTIVE, record("queued2"))
+
+    with pytest.raises(QueueFull):
+        scheduler.submit(1, INTERACTIVE, record("rejected"))
+    # Other users have their own queue
+    scheduler.submit(2, INTERACTIVE, record("other"))
+
+    assert scheduler.rejected == {(INTERACTIVE, "queue_full"): 1}
+    assert scheduler.stats()[INTERACTIVE]["queued"] == 3
+
+
+def test_release_and_cancel_are_idempotent():
+    scheduler = make_scheduler()
+    record = Recorder()
+    running = scheduler.submit(1, INTERACTIVE, record("running"))
+    queued = scheduler.submit(2, INTERACTIVE, record("queued"))
+
+    assert queued.cancel()
+    assert not queued.cancel()
+    assert not running.cancel()
+    running.release()
+    running.release()
+
+    assert record.names() == ["running"]
+    assert scheduler.stats()[INTERACTIVE] == {"queued": 0, "users": 0, "running": 0}
+
+
+def test_queued_work_expires_at_its_deadline():
+    scheduler = make_scheduler()
+    record = Recorder()
+    expired = []
+    scheduler.submit(1, BACKGROUND, record("busy"))
+    scheduler.submit(2, BACKGROUND, record("late"), lambda: expired.append("late"),
+                     deadline=time.monotonic() + 0.05)
+    scheduler.submit(3, BACKGROUND, record("patient"))
+
+    time.sleep(0.1)
+    record.release("busy")
+
+    assert expired == ["late"]
+    assert record.names() == ["busy", "patient"]
+    assert scheduler.rejected == {(BACKGROUND, "timeout"): 1}
+
+
+def test_failing_start_gives_the_slot_back():
+    scheduler = make_scheduler()
+    record = Recorder()
+
+    def fail(ticket):
+        raise RuntimeError("no worker")
+
+    scheduler.submit(1, INTERACTIVE, fail)
+    scheduler.submit(2, INTERACTIVE, record("next"))
+
+    assert record.names() == ["next"]
+
+
+def test_acquire_waits_for_a_slot():
+    scheduler = make_scheduler(timeouts={INTERACTIVE: 5})
+
+    async def run():
+        first = await scheduler.acquire(1)
+        waiting = asyncio.ensure_future(scheduler.acquire(2))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        first.release()
+        second = await asyncio.wait_for(waiting, 1)
+        second.release()
+
+    asyncio.run(run())
+    assert scheduler.stats()[INTERACTIVE]["running"] == 0
+
+
+def test_acquire_times_out_with_503():
+    scheduler = make_scheduler(timeouts={INTERACTIVE: 0.05})
+
+    async def run():
+        ticket = await scheduler.acquire(1)
+        with pytest.raises(HTTPException) as error:
+            await scheduler.acquire(2)
+        ticket.release()
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert scheduler.rejected == {(INTERACTIVE, "timeout"): 1}
+    assert scheduler.stats()[INTERACTIVE] == {"queued": 0, "users": 0, "running": 0}
+
+
+def test_acquire_answers_429_when_the_user_queue_is_full():
+    scheduler = make_scheduler(max_queued={INTERACTIVE: 1}, timeouts={INTERACTIVE: 5})
+
+    async def run():
+        ticket = await scheduler.acquire(1)
+        waiting = asyncio.ensure_future(scheduler.acquire(1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as error:
+            await scheduler.acquire(1)
+        waiting.cancel()
+        ticket.release()
+        return error.value
+
+    assert asyncio.run(run()).status_code == 429
+    assert scheduler.stats()[INTERACTIVE] == {"queued": 0, "users": 0, "running": 0}
@@ -0,0 +1,110 @@
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+from app.core import splitters
+from app.core.base_rag import BaseRAG
+from app.core.splitters import expand_windows, iter_chunks, iter_pages
+
+
+def element(text, page, category=None):
+    metadata = {"source": "manual.pdf", "page_number": page}
+    if category:
+        metadata["category"] = category
+    return Document(page_content=text, metadata=metadata)
+
+
+def long_text(word, sentences):
+    return " ".join(f"The {word} check number {i} passed." for i in range(sentences))
+
+
+def test_elements_are_joined_per_page():
+    pages = list(iter_pages([element("Title", 1, "Title"), element("Body.", 1, "NarrativeText"),
+                             element("Next page.", 2, "NarrativeText")]))
+
+    assert [page.page_content for page in pages] == ["Title\n\nBody.", "Next page."]
+    assert pages[0].metadata == {"source": "manual.pdf", "page_number": 1}
+
+
+def test_recursive_chunks_stay_within_their_page():
+    elements = [element(long_text("pump", 30), 1), element(long_text("valve", 30), 2)]
+
+    chunks = list(iter_chunks(elements, "recursive", chunk_size=200))
+
+    assert all(len(chunk.page_content) <= 200 for chunk in chunks)
+    for chunk in chunks:
+        word = "pump" if chunk.metadata["page_number"] == 1 else "valve"
+        assert word in chunk.page_content and ({"pump", "valve"} - {word}).pop() not in chunk.page_content
+
+
+def test_token_chunks_are_measured_in_tokens(monkeypatch):
+    counted = []
+    monkeypatch.setattr(splitters, "_token_counter", lambda: lambda text: counted.append(text) or len(text.split()))
+
+    chunks = list(iter_chunks([element(long_text("pump", 40), 1)], "token", chunk_size=80))
+
+    assert counted
+    # 80 characters on the form are 20 tokens
+    assert all(len(chunk.page_content.split()) <= 20 for chunk in chunks)
+
+
+def test_missing_tiktoken_is_reported_once(monkeypatch, capsys):
+    monkeypatch.setattr(splitters, "_warned_estimate", False)
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+
+    for _ in range(3):
+        list(iter_chunks([element(long_text("pump", 10), 1)], "token", chunk_size=200))
+
+    assert capsys.readouterr().out.count("tiktoken is not installed") == 1
+
+
+def test_sections_start_at_titles_and_carry_them():
+    elements = [
+        element("1. Installation", 1, "Title"), element(long_text("mount", 3), 1, "NarrativeText"),
+        element("2. Maintenance", 2, "Title"), element(long_text("clean", 3), 2, "NarrativeText"),
+    ]
+
+    # A title only starts a new chunk once the current one has a quarter of chunk_size
+    chunks = list(iter_chunks(elements, "section", chunk_size=300))
+
+    assert [chunk.metadata["section"] for chunk in chunks] == ["1. Installation", "2. Maintenance"]
+    assert chunks[1].page_content.startswith("2. Maintenance\n\nThe clean check")
+    assert chunks[1].metadata["page_number"] == 2
+
+
+def test_headings_are_found_in_plain_text_pages():
+    page = element("3.2 Filter Replacement\n" + long_text("filter", 3) + "\n\nWARNINGS\nDo not open while running.", 1)
+
+    chunks = list(iter_chunks([page], "section", chunk_size=150))
+
+    assert [chunk.metadata["section"] for chunk in chunks] == ["3.2 Filter Replacement", "WARNINGS"]
+
+
+def test_sentence_windows_keep_the_surrounding_sentences():
+    text = "One is first. Two follows. Three is here. Four comes next. Five ends it."
+
+    chunks = list(iter_chunks([element(text, 1)], "sentence_window"))
+
+    assert [chunk.page_content for chunk in chunks] == [
+        "One is first.", "Two follows.", "Three is here.", "Four comes next.", "Five ends it."]
+    assert chunks[0].metadata["window"] == "One is first. Two follows. Three is here."
+    assert chunks[2].metadata["window"] == text
+    assert [doc.page_content for doc in expand_windows(chunks[:1])] == [chunks[0].metadata["window"]]
+
+
+def test_chunk_ids_change_with_the_sentence_window():
+    same = Document(page_content="Close the valve.", metadata={"window": "Close the valve. Then wait."})
+    other_window = Document(page_content="Close the valve.", metadata={"window": "First drain. Close the valve."})
+    taken = set()
+
+    first = BaseRAG._chunk_id(same, taken.__contains__, 7)
+    assert first.startswith("7-") and first.endswith("-0")
+    assert BaseRAG._chunk_id(other_window, taken.__contains__, 7) != first
+    taken.add(first)
+    assert BaseRAG._chunk_id(same, taken.__contains__, 7) == first[:-1] + "1"
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        list(iter_chunks([element("text", 1)], "paragraph"))
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from app.backend import uploads
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(uploads, "PARTIAL_DIR", str(tmp_path / ".partial"))
+    return tmp_path
+
+
+async def pieces(data, size=1000, delay=0.0):
+    for start in range(0, len(data), size):
+        await asyncio.sleep(delay)
+        yield data[start:start + size]
+
+
+def append(upload_id, offset, data, delay=0.0):
+    session = uploads.load_session(upload_id, 1)
+    return asyncio.run(uploads.append_chunk(session, offset, pieces(data, delay=delay)))
+
+
+def status_of(call, *args):
+    with pytest.raises(HTTPException) as error:
+        call(*args)
+    return error.value.status_code
+
+
+def test_upload_resumes_from_the_server_offset(upload_dir):
+    session = uploads.create_session(1, "manual.pdf", len(DATA), 1000)
+    assert session["offset"] == 0
+
+    append(session["id"], 0, DATA[:4000])
+    # The client lost the response and asks where to continue
+    offset = uploads.load_session(session["id"], 1)["offset"]
+    assert offset == 4000
+    assert append(session["id"], offset, DATA[offset:])["offset"] == len(DATA)
+
+    save_path = str(upload_dir / "1_manual.pdf")
+    content_hash = asyncio.run(uploads.finish_session(uploads.load_session(session["id"], 1), save_path))
+
+    assert content_hash == hashlib.sha256(DATA).hexdigest()
+    with open(save_path, "rb") as f:
+        assert f.read() == DATA
+    assert os.listdir(upload_dir / ".partial") == []
+
+
+def test_wrong_offset_is_rejected():
+    session = uploads.create_session(1, "manual.pdf", len(DATA), 1000)
+    append(session["id"], 0, DATA[:1000])
+
+    assert status_of(append, session["id"], 0, DATA[:1000]) == 409
+    assert uploads.load_session(session["id"], 1)["offset"] == 1000
+
+
+def test_data_beyond_the_declared_size_is_rejected():
+    session = uploads.create_session(1, "manual.pdf", 1500, 1000)
+
+    assert status_of(append, session["id"], 0, DATA[:2000]) == 413
+    assert status_of(uploads.create_session, 1, "big.pdf", uploads.max_upload_bytes() + 1, 1000) == 413
+
+
+def test_sessions_belong_to_their_user():
+    session = uploads.create_session(1, "manual.pdf", len(DATA), 1000)
+
+    assert status_of(uploads.load_session, session["id"], 2) == 404
+    assert status_of(uploads.load_session, "not-an-id", 1) == 404
+
+
+def test_incomplete_upload_cannot_be_finished(upload_dir):
+    session = uploads.create_session(1, "manual.pdf", len(DATA), 1000)
+    append(session["id"], 0, DATA[:1000])
+
+    finish = lambda: asyncio.run(uploads.finish_session(uploads.load_session(session["id"], 1),
+                                                        str(upload_dir / "1_manual.pdf")))
+    assert status_of(finish) == 409
+
+
+def test_concurrent_appends_do_not_interleave():
+    session = uploads.create_session(1, "manual.pdf", len(DATA), 1000)
+
+    async def attempt(data):
+        try:
+            await uploads.append_chunk(uploads.load_session(session["id"], 1), 0, pieces(data, delay=0.01))
+            return "ok"
+        except HTTPException as error:
+            return error.status_code
+
+    async def both():
+        return await asyncio.gather(attempt(DATA[:5000]), attempt(DATA[5000:]))
+
+    # The first request holds the lock from before its first await
+    assert asyncio.run(both()) == ["ok", 409]
+    assert uploads.load_session(session["id"], 1)["offset"] == 5000